@@ -0,0 +1,49 @@
+"""Tabela historii testów PathFindera (dotąd tworzona przy pierwszym odczycie)
+
+Revision ID: a4e7c91b2d05
+Revises: d81f4c2a9e37
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4e7c91b2d05'
+down_revision: Union[str, None] = 'd81f4c2a9e37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # Na istniejących bazach tabelę mógł już utworzyć PathFinderTester.get_test_history
+    if not inspector.has_table('pathfinder_test_history'):
+        op.create_table('pathfinder_test_history',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('test_type', mysql.VARCHAR(length=50), nullable=False),
+        sa.Column('start_point', mysql.VARCHAR(length=100), nullable=True),
+        sa.Column('end_point', mysql.VARCHAR(length=100), nullable=True),
+        sa.Column('test_parameters', sa.JSON(), nullable=True),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('success', mysql.TINYINT(display_width=1), nullable=True),
+        sa.Column('execution_time_ms', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        indexes = set()
+    else:
+        indexes = {index['name'] for index in inspector.get_indexes('pathfinder_test_history')}
+
+    # Odczyt historii sortuje po created_at, retencja usuwa po created_at
+    if 'ix_pathfinder_test_history_created_at' not in indexes:
+        op.create_index('ix_pathfinder_test_history_created_at', 'pathfinder_test_history', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    # Tabelę zostawiamy - poprzednie wersje aplikacji i tak z niej korzystają (i tworzyły ją same)
+    op.drop_index('ix_pathfinder_test_history_created_at', table_name='pathfinder_test_history')
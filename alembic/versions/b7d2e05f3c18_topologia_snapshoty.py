@@ -0,0 +1,40 @@
+"""Migawki struktury mapy rurociągu (topologia_snapshoty)
+
+Revision ID: b7d2e05f3c18
+Revises: a4e7c91b2d05
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2e05f3c18'
+down_revision: Union[str, None] = 'a4e7c91b2d05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('topologia_snapshoty',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('hash_sha256', mysql.VARCHAR(length=64), nullable=False),
+    sa.Column('wersja_topologii', sa.Integer(), server_default=sa.text("'0'"), nullable=False),
+    sa.Column('liczba_portow', sa.Integer(), server_default=sa.text("'0'"), nullable=False),
+    sa.Column('liczba_wezlow', sa.Integer(), server_default=sa.text("'0'"), nullable=False),
+    sa.Column('liczba_segmentow', sa.Integer(), server_default=sa.text("'0'"), nullable=False),
+    sa.Column('dane', sa.JSON(), nullable=False),
+    sa.Column('utworzono_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    comment='Niezmienne migawki struktury mapy rurociągu (porty, węzły, segmenty z zaworami) identyfikowane skrótem SHA-256'
+    )
+    op.create_index('ix_topologia_snapshoty_hash', 'topologia_snapshoty', ['hash_sha256'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_topologia_snapshoty_hash', table_name='topologia_snapshoty')
+    op.drop_table('topologia_snapshoty')
@@ -0,0 +1,55 @@
+"""Bieżące odczyty czujników wydzielone z tabeli sprzet (sprzet_telemetria)
+
+Revision ID: c5f1a8d93e27
+Revises: b7d2e05f3c18
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5f1a8d93e27'
+down_revision: Union[str, None] = 'b7d2e05f3c18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TELEMETRY_COLUMNS = 'temperatura_aktualna, cisnienie_aktualne, poziom_aktualny_procent, ostatnia_aktualizacja'
+
+
+def upgrade() -> None:
+    op.create_table('sprzet_telemetria',
+    sa.Column('id_sprzetu', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('temperatura_aktualna', sa.DECIMAL(precision=10, scale=6), nullable=True),
+    sa.Column('cisnienie_aktualne', sa.DECIMAL(precision=5, scale=2), nullable=True),
+    sa.Column('poziom_aktualny_procent', sa.DECIMAL(precision=5, scale=2), nullable=True),
+    sa.Column('ostatnia_aktualizacja', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['id_sprzetu'], ['sprzet.id'], name='sprzet_telemetria_ibfk_1', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id_sprzetu'),
+    comment='Bieżące odczyty czujników sprzętu (temperatura, ciśnienie, poziom)'
+    )
+    # Przeniesienie ostatnich odczytów, zanim kolumny znikną z tabeli sprzet
+    op.execute(
+        f"INSERT INTO sprzet_telemetria (id_sprzetu, {TELEMETRY_COLUMNS}) "
+        f"SELECT id, {TELEMETRY_COLUMNS} FROM sprzet"
+    )
+    op.drop_column('sprzet', 'ostatnia_aktualizacja')
+    op.drop_column('sprzet', 'poziom_aktualny_procent')
+    op.drop_column('sprzet', 'cisnienie_aktualne')
+    op.drop_column('sprzet', 'temperatura_aktualna')
+
+
+def downgrade() -> None:
+    op.add_column('sprzet', sa.Column('temperatura_aktualna', sa.DECIMAL(precision=10, scale=6), nullable=True))
+    op.add_column('sprzet', sa.Column('cisnienie_aktualne', sa.DECIMAL(precision=5, scale=2), nullable=True))
+    op.add_column('sprzet', sa.Column('poziom_aktualny_procent', sa.DECIMAL(precision=5, scale=2), nullable=True))
+    op.add_column('sprzet', sa.Column('ostatnia_aktualizacja', sa.DateTime(), nullable=True))
+    op.execute(
+        "UPDATE sprzet s JOIN sprzet_telemetria t ON t.id_sprzetu = s.id SET "
+        "s.temperatura_aktualna = t.temperatura_aktualna, s.cisnienie_aktualne = t.cisnienie_aktualne, "
+        "s.poziom_aktualny_procent = t.poziom_aktualny_procent, s.ostatnia_aktualizacja = t.ostatnia_aktualizacja"
+    )
+    op.drop_table('sprzet_telemetria')
@@ -0,0 +1,33 @@
+"""Znacznik wersji topologii rurociągu
+
+Revision ID: d81f4c2a9e37
+Revises: c63b10fdc2a7
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81f4c2a9e37'
+down_revision: Union[str, None] = 'c63b10fdc2a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('topologia_wersja',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('wersja', sa.Integer(), server_default=sa.text("'0'"), nullable=False),
+    sa.Column('zmieniono_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    comment='Znacznik wersji mapy rurociągu (jeden wiersz, id=1) - do przeładowania grafu w innych procesach'
+    )
+    op.execute("INSERT INTO topologia_wersja (id, wersja, zmieniono_at) VALUES (1, 0, UTC_TIMESTAMP())")
+
+
+def downgrade() -> None:
+    op.drop_table('topologia_wersja')
@@ -5,11 +5,14 @@ from .config import Config, ProdConfig, TestConfig
 from .pathfinder_service import PathFinder
 from .monitoring import MonitoringService
 from .sensors import SensorService
+from .topology_sync import TopologySync
 import logging
 import os
 from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
 from .extensions import db, socketio
+from .db import init_db_pool
+from . import perf, replica
 # from flask_admin import Admin
 # from flask_admin.contrib.sqla import ModelView
 from logging.handlers import RotatingFileHandler
@@ -90,6 +93,9 @@ def create_app(config_class=None):
     # --------------------------------------------------------------------
 
     db.init_app(app)
+    replica.init_app(app, db)
+    init_db_pool(app)
+    perf.init_app(app)
     
     
     
@@ -104,6 +110,7 @@ def create_app(config_class=None):
     
     # Rejestrujemy serwisy w extensions
     app.extensions['pathfinder'] = pathfinder_service
+    app.extensions['topology_sync'] = TopologySync(app)
     app.extensions['sensor_service'] = sensor_service
     app.extensions['monitoring'] = monitoring
     
@@ -128,6 +135,10 @@ def create_app(config_class=None):
     app.register_blueprint(scheduler_bp)
     app.register_blueprint(earth_pallets_bp)
     app.register_blueprint(workflow_bp)
+    if app.config.get('SQL_PERF_ENABLED', False):
+        # Diagnostyka (/api/debug/*) tylko przy świadomie włączonym pomiarze
+        from .debug_routes import debug_bp
+        app.register_blueprint(debug_bp)
     @app.route('/hello')
     def hello():
         return "Witaj w aplikacji MES!"
@@ -11,8 +11,24 @@ def _as_aware_utc(dt: datetime | None) -> datetime:
 from .extensions import db  # Importujemy obiekt `db` z __init__.py
 from .models import Sprzet, ApolloSesje, ApolloTracking, PartieApollo, OperacjeLog
 from decimal import Decimal
-from sqlalchemy import func
-
+from sqlalchemy import func, bindparam
+
+
+# Zapytania stanu Apollo (odpytywane co kilka sekund przez dashboard) budowane raz przy
+# imporcie, z ID jako parametrami wiązanymi - patrz dashboard_service
+AKTYWNA_SESJA_Q = db.select(ApolloSesje).where(
+    ApolloSesje.id_sprzetu == bindparam('id_sprzetu'),
+    ApolloSesje.status_sesji == 'aktywna'
+)
+# Suma dodanego surowca i transferów sesji w jednym zapytaniu (zamiast osobnego na każdy typ)
+BILANS_SESJI_Q = db.select(ApolloTracking.typ_zdarzenia, func.sum(ApolloTracking.waga_kg)).where(
+    ApolloTracking.id_sesji == bindparam('id_sesji'),
+    ApolloTracking.typ_zdarzenia.in_(['DODANIE_SUROWCA', 'TRANSFER_WYJSCIOWY'])
+).group_by(ApolloTracking.typ_zdarzenia)
+OSTATNI_TRANSFER_Q = db.select(ApolloTracking).where(
+    ApolloTracking.id_sesji == bindparam('id_sesji'),
+    ApolloTracking.typ_zdarzenia == 'TRANSFER_WYJSCIOWY'
+).order_by(ApolloTracking.czas_zdarzenia.desc()).limit(1)
 
 
 class ApolloService:
@@ -249,9 +265,7 @@ class ApolloService:
                 'szybkosc_topnienia_kg_h': float(apollo.szybkosc_topnienia_kg_h or ApolloService.SZYBKOSC_WYTAPIANIA_KG_H)
             }
             
-            sesja = db.session.execute(
-                db.select(ApolloSesje).filter_by(id_sprzetu=id_sprzetu, status_sesji='aktywna')
-            ).scalar_one_or_none()
+            sesja = db.session.execute(AKTYWNA_SESJA_Q, {'id_sprzetu': id_sprzetu}).scalar_one_or_none()
 
             if not sesja:
                 return result # Zwróć podstawowe dane, jeśli nie ma sesji
@@ -261,27 +275,14 @@ class ApolloService:
             stan_obliczony = ApolloService.oblicz_aktualny_stan_apollo(id_sprzetu, current_time=current_time)
             
             # Oblicz bilans "księgowy" dla informacji dodatkowej w GUI
-            total_added_q = db.select(func.sum(ApolloTracking.waga_kg)).where(
-                ApolloTracking.id_sesji == sesja.id,
-                ApolloTracking.typ_zdarzenia == 'DODANIE_SUROWCA'
-            )
-            total_added = db.session.execute(total_added_q).scalar() or Decimal('0.0')
-
-            total_transferred_q = db.select(func.sum(ApolloTracking.waga_kg)).where(
-                ApolloTracking.id_sesji == sesja.id,
-                ApolloTracking.typ_zdarzenia == 'TRANSFER_WYJSCIOWY'
-            )
-            total_transferred = db.session.execute(total_transferred_q).scalar() or Decimal('0.0')
+            sumy = dict(db.session.execute(BILANS_SESJI_Q, {'id_sesji': sesja.id}).all())
+            total_added = sumy.get('DODANIE_SUROWCA') or Decimal('0.0')
+            total_transferred = sumy.get('TRANSFER_WYJSCIOWY') or Decimal('0.0')
 
             bilans_ksiegowy_kg = float(total_added - total_transferred)
             
             # Pobierz ostatni transfer dla celów informacyjnych
-            ostatni_transfer = db.session.execute(
-                db.select(ApolloTracking).where(
-                    ApolloTracking.id_sesji == sesja.id,
-                    ApolloTracking.typ_zdarzenia == 'TRANSFER_WYJSCIOWY'
-                ).order_by(ApolloTracking.czas_zdarzenia.desc())
-            ).scalars().first()
+            ostatni_transfer = db.session.execute(OSTATNI_TRANSFER_Q, {'id_sesji': sesja.id}).scalars().first()
 
             # Zaktualizuj słownik wynikowy o wszystkie potrzebne dane
             result.update({
@@ -4,6 +4,7 @@ from flask import Blueprint, jsonify, request
 from decimal import Decimal
 
 from .extensions import db
+from .replica import read_replica
 from .models import *
 from .batch_management_service import BatchManagementService
 
@@ -146,6 +147,7 @@ def receive_from_apollo():
         return jsonify({'status': 'error', 'message': f'Błąd serwera: {e}'}), 500
 
 @batch_bp.route('/tanks/<int:tank_id>/status', methods=['GET'])
+@read_replica
 def get_tank_status(tank_id):
     """
     Zwraca szczegółowy status i skład mieszaniny dla danego zbiornika.
@@ -194,6 +196,7 @@ def get_tank_status(tank_id):
         return jsonify({'status': 'error', 'message': f'Błąd serwera: {e}'}), 500
 
 @batch_bp.route('/mixes/<int:mix_id>/composition', methods=['GET'])
+@read_replica
 def get_mix_composition_endpoint(mix_id):
     """
     Zwraca szczegółowy, dwupoziomowy skład dla danej mieszaniny.
@@ -27,10 +27,57 @@ class Config:
     )
     print(f"--- [CONFIG DEBUG] Zbudowano SQLALCHEMY_DATABASE_URI: {SQLALCHEMY_DATABASE_URI}")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Pula połączeń silnika - wspólna dla sesji ORM i surowego SQL (app/db.get_db_connection)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 20)),
+        # Sekundy oczekiwania na wolne połączenie, zanim zgłoszony zostanie błąd
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        # Połączenia starsze niż N sekund są odnawiane (krócej niż wait_timeout MySQL/proxy)
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 280)),
+        'pool_pre_ping': True,
+    }
+    # Pomiar zapytań SQL per żądanie HTTP / zadanie Celery oraz endpointy /api/debug/* (perf, db-pool).
+    # Domyślnie wyłączony - narzut na każde żądanie i ujawnianie kształtów zapytań
+    SQL_PERF_ENABLED = os.environ.get('SQL_PERF_ENABLED', 'False').lower() in ('true', '1', 't')
+    # Nagłówki X-SQL-* i Server-Timing w odpowiedziach oraz ostrzeżenia N+1 w logu
+    SQL_PERF_HEADERS = os.environ.get('SQL_PERF_HEADERS', 'False').lower() in ('true', '1', 't')
+    # Ile wykonań tej samej instrukcji (z dokładnością do parametrów) w jednym żądaniu to N+1
+    SQL_PERF_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_PERF_N_PLUS_ONE_THRESHOLD', 5))
+    # Replika MySQL do odczytów raportowych (dashboard, historia, palety, historia testów PathFindera)
+    REPLICA_DATABASE_URI = os.environ.get('REPLICA_DATABASE_URI')
+    SQLALCHEMY_BINDS = {'replica': REPLICA_DATABASE_URI} if REPLICA_DATABASE_URI else {}
+    # Przy większym opóźnieniu repliki (lub jej awarii) odczyty wracają na bazę główną
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+    REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS', 10))
     TESTING = False
     CELERY_BEAT_DBURI = SQLALCHEMY_DATABASE_URI
     print(f"--- [CONFIG DEBUG] Ustawiono CELERY_BEAT_DBURI na: {CELERY_BEAT_DBURI}")
     IPOMIAR_API_BASE_URL = 'https://ipomiar.pl/public-api/v1.0'
+    # Silnik grafowy PathFindera: 'networkx' (domyślny, do debugowania) lub 'csr' (tablice CSR)
+    PATHFINDER_BACKEND = os.environ.get('PATHFINDER_BACKEND', 'networkx')
+    # Maksymalna liczba tras trzymanych w cache LRU PathFindera
+    PATHFINDER_ROUTE_CACHE_SIZE = int(os.environ.get('PATHFINDER_ROUTE_CACHE_SIZE', 512))
+    # Macierz osiągalności portów przebudowywana w tle (False = synchronicznie, przy zmianie grafu)
+    PATHFINDER_REACHABILITY_BACKGROUND = os.environ.get('PATHFINDER_REACHABILITY_BACKGROUND', 'True').lower() in ('true', '1', 't')
+    # Liczba procesów puli analizy krytycznych zaworów - pula tworzona przy pierwszej analizie (0 = w bieżącym procesie)
+    PATHFINDER_ANALYSIS_WORKERS = int(os.environ.get('PATHFINDER_ANALYSIS_WORKERS', 2))
+    # Raport odporności (minimalne przekroje) liczony w tle po każdym przeładowaniu topologii
+    PATHFINDER_RESILIENCE = os.environ.get('PATHFINDER_RESILIENCE', 'True').lower() in ('true', '1', 't')
+    # Liczba ostatnich zmian stanów zaworów/zajętości pamiętanych do eksportu przyrostowego topologii
+    PATHFINDER_CHANGE_LOG_SIZE = int(os.environ.get('PATHFINDER_CHANGE_LOG_SIZE', 1000))
+    # Zapis migawek struktury mapy (topologia_snapshoty) przy każdym wczytaniu nowej struktury
+    PATHFINDER_SNAPSHOTS = os.environ.get('PATHFINDER_SNAPSHOTS', 'True').lower() in ('true', '1', 't')
+    # Historia testów PathFindera: zapis porcjami w tle i retencja (0 = bez limitu)
+    PATHFINDER_HISTORY_FLUSH_SECONDS = float(os.environ.get('PATHFINDER_HISTORY_FLUSH_SECONDS', 2))
+    PATHFINDER_HISTORY_BATCH_SIZE = int(os.environ.get('PATHFINDER_HISTORY_BATCH_SIZE', 200))
+    PATHFINDER_HISTORY_RETENTION_DAYS = int(os.environ.get('PATHFINDER_HISTORY_RETENTION_DAYS', 30))
+    PATHFINDER_HISTORY_MAX_ROWS = int(os.environ.get('PATHFINDER_HISTORY_MAX_ROWS', 100000))
+    PATHFINDER_HISTORY_PRUNE_CHUNK = int(os.environ.get('PATHFINDER_HISTORY_PRUNE_CHUNK', 1000))
+    # Przeładowanie topologii w innych procesach: kanał Redis + okresowy odczyt znacznika z bazy
+    REDIS_URL = os.environ.get('REDIS_URL')
+    PATHFINDER_HOT_RELOAD = os.environ.get('PATHFINDER_HOT_RELOAD', 'True').lower() in ('true', '1', 't')
+    PATHFINDER_TOPOLOGY_POLL_SECONDS = int(os.environ.get('PATHFINDER_TOPOLOGY_POLL_SECONDS', 30))
 
 
 class ProdConfig(Config):
@@ -46,6 +93,10 @@ class TestConfig(Config):
     MYSQL_USER = os.environ.get('MYSQLUSER', 'root')
     MYSQL_PASSWORD = os.environ.get('MYSQL_ROOT_PASSWORD', '')
     MYSQL_DB = 'mes_parafina_db_test' # Jedyna prawdziwa zmiana
+    PATHFINDER_HOT_RELOAD = False
+    PATHFINDER_ANALYSIS_WORKERS = 0
+    # Testy nie mogą czytać z repliki bazy produkcyjnej
+    SQLALCHEMY_BINDS = {}
 
     SQLALCHEMY_DATABASE_URI = (
         f"mysql+mysqlconnector://{MYSQL_USER}:{MYSQL_PASSWORD}@"
@@ -3,11 +3,52 @@
 from .extensions import db
 from .models import Sprzet, Alarmy, TankMixes, OperacjeLog, HistoriaPomiarow
 from .batch_management_service import BatchManagementService
-from sqlalchemy import func, select
+from sqlalchemy import func, select, bindparam
 from sqlalchemy.orm import joinedload
 from decimal import Decimal
 from collections import defaultdict
 
+DASHBOARD_EQUIPMENT_TYPES = ('reaktor', 'beczka_brudna', 'beczka_czysta')
+
+
+def _equipment_query():
+    return select(Sprzet).options(
+        joinedload(Sprzet.active_mix)
+    ).where(
+        Sprzet.typ_sprzetu.in_(DASHBOARD_EQUIPMENT_TYPES)
+    ).order_by(Sprzet.typ_sprzetu, Sprzet.nazwa_unikalna)
+
+
+def _latest_level_query():
+    return (
+        select(HistoriaPomiarow.poziom_mm)
+        .where(HistoriaPomiarow.id_sprzetu == bindparam('id_sprzetu'), HistoriaPomiarow.poziom_mm.isnot(None))
+        .order_by(HistoriaPomiarow.czas_pomiaru.desc())
+        .limit(1)
+    )
+
+
+def _active_alarms_query():
+    return select(Alarmy).where(Alarmy.status_alarmu == 'AKTYWNY').order_by(Alarmy.czas_wystapienia.desc()).limit(5)
+
+
+def _active_operations_query():
+    return select(OperacjeLog).options(
+        joinedload(OperacjeLog.sprzet_zrodlowy),
+        joinedload(OperacjeLog.sprzet_docelowy)
+    ).where(OperacjeLog.status_operacji == 'aktywna').order_by(OperacjeLog.czas_rozpoczecia.desc())
+
+
+# Zapytania dashboardu budowane raz przy imporcie (zmienne wartości jako parametry wiązane).
+# SQLAlchemy zapamiętuje na obiekcie zapytania jego klucz cache, więc kolejne wywołania
+# (każdy tik Celery i każde odświeżenie) nie budują konstrukcji ani klucza od nowa i od razu
+# trafiają w cache skompilowanych instrukcji. Zysk mierzy benchmark_statements.py.
+EQUIPMENT_Q = _equipment_query()
+LATEST_LEVEL_Q = _latest_level_query()
+ACTIVE_ALARMS_Q = _active_alarms_query()
+ACTIVE_OPERATIONS_Q = _active_operations_query()
+
+
 class DashboardService:
 
     @staticmethod
@@ -15,14 +56,7 @@ class DashboardService:
         """
         Agreguje wszystkie dane dla dashboardu. (Wersja 3: Poprawna konwersja na float)
         """
-        
-        sprzet_q = db.select(Sprzet).options(
-            joinedload(Sprzet.active_mix)
-        ).where(
-            Sprzet.typ_sprzetu.in_(['reaktor', 'beczka_brudna', 'beczka_czysta'])
-        ).order_by(Sprzet.typ_sprzetu, Sprzet.nazwa_unikalna)
-        
-        wszystkie_urzadzenia = db.session.execute(sprzet_q).scalars().unique().all()
+        wszystkie_urzadzenia = db.session.execute(EQUIPMENT_Q).scalars().unique().all()
 
         all_reactors_data = []
         beczki_brudne_data = []
@@ -34,10 +68,7 @@ class DashboardService:
             latest_level_mm = None
             if sprzet.ipomiar_device_id:
                 latest_level_mm = db.session.execute(
-                    select(HistoriaPomiarow.poziom_mm)
-                    .where(HistoriaPomiarow.id_sprzetu == sprzet.id, HistoriaPomiarow.poziom_mm.isnot(None))
-                    .order_by(HistoriaPomiarow.czas_pomiaru.desc())
-                    .limit(1)
+                    LATEST_LEVEL_Q, {'id_sprzetu': sprzet.id}
                 ).scalar_one_or_none()
 
             sprzet_data = {
@@ -119,17 +150,11 @@ class DashboardService:
             for k, v in stock_summary.items()
         ], key=lambda x: x['material_type'])
         
-        alarmy_q = db.select(Alarmy).where(Alarmy.status_alarmu == 'AKTYWNY').order_by(Alarmy.czas_wystapienia.desc()).limit(5)
-        alarmy = db.session.execute(alarmy_q).scalars().all()
+        alarmy = db.session.execute(ACTIVE_ALARMS_Q).scalars().all()
         alarmy_data = [{ "id": a.id, "typ": a.typ_alarmu, "sprzet": a.nazwa_sprzetu, "wartosc": float(a.wartosc), "limit": float(a.limit_przekroczenia), "czas": a.czas_wystapienia.isoformat() + 'Z' } for a in alarmy]
 
         # NOWA LOGIKA: Pobierz aktywne operacje
-        active_ops_q = db.select(OperacjeLog).options(
-            joinedload(OperacjeLog.sprzet_zrodlowy),
-            joinedload(OperacjeLog.sprzet_docelowy)
-        ).where(OperacjeLog.status_operacji == 'aktywna').order_by(OperacjeLog.czas_rozpoczecia.desc())
-        
-        active_ops = db.session.execute(active_ops_q).scalars().all()
+        active_ops = db.session.execute(ACTIVE_OPERATIONS_Q).scalars().all()
         
         active_operations_data = [
             {
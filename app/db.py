@@ -1,20 +1,165 @@
 # app/db.py
+"""
+Połączenia dla kodu używającego "surowego" SQL (mysql.connector): trasy, TopologyManager,
+PathFinderTester, operacje, historia testów.
 
-import mysql.connector
+Połączenia są wypożyczane z puli silnika SQLAlchemy (ten sam pool co sesje ORM), zamiast
+otwierać nowe połączenie TCP przy każdym wywołaniu. Obiekt zwracany przez get_db_connection
+zachowuje się jak połączenie mysql.connector (cursor(dictionary=True), commit, rollback,
+is_connected), a conn.close() oddaje połączenie do puli - niezatwierdzona transakcja jest
+wtedy wycofywana, tak jak przy zamknięciu zwykłego połączenia. SET time_zone wykonuje
+listener z extensions.py raz na fizyczne połączenie.
+Przy włączonym pomiarze SQL (app/perf.py) kursory takiego połączenia są mierzone.
+get_db_connection(replica=True) wypożycza połączenie z puli repliki (patrz replica.py),
+o ile jest skonfigurowana i aktualna - w przeciwnym razie z puli bazy głównej.
+
+Ustawienia puli (rozmiar, limit czasu oczekiwania, recykling, pre-ping) są w
+SQLALCHEMY_ENGINE_OPTIONS. Pula czeka na wolne połączenie przez threading.Condition,
+więc pod eventletem (monkey_patch) usypia tylko bieżący greenlet.
+"""
+
+import os
+import threading
+import time
+import weakref
 from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from .extensions import db
+from . import perf
+from .replica import REPLICA_BIND, replica_engine
+
+# Wypożyczenie dłuższe niż ten próg liczone jest jako oczekiwanie na wolne połączenie
+SLOW_CHECKOUT_MS = 50
+
+_engines = weakref.WeakSet()
+
+
+class PoolMetrics:
+    """Liczniki puli połączeń jednego silnika (do diagnozowania wyczerpania puli)."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.total_checkout_ms = 0.0
+        self.max_checkout_ms = 0.0
+
+    def on_checkout(self, *args):
+        with self._lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def on_checkin(self, *args):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def on_connect(self, *args):
+        self.connects += 1
+
+    def on_invalidate(self, *args):
+        self.invalidations += 1
+
+    def record_checkout(self, elapsed_ms):
+        with self._lock:
+            self.checkouts += 1
+            self.total_checkout_ms += elapsed_ms
+            self.max_checkout_ms = max(self.max_checkout_ms, elapsed_ms)
+            if elapsed_ms >= SLOW_CHECKOUT_MS:
+                self.slow_checkouts += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        pool = self.engine.pool
+        size = pool.size() if hasattr(pool, 'size') else None
+        return {
+            'pool_class': type(pool).__name__,
+            'size': size,
+            'max_overflow': getattr(pool, '_max_overflow', None),
+            'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else self.in_use,
+            'idle': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+            'peak_in_use': self.peak_in_use,
+            'checkouts': self.checkouts,
+            'slow_checkouts': self.slow_checkouts,
+            'timeouts': self.timeouts,
+            'connects': self.connects,
+            'invalidations': self.invalidations,
+            'avg_checkout_ms': round(self.total_checkout_ms / self.checkouts, 3) if self.checkouts else None,
+            'max_checkout_ms': round(self.max_checkout_ms, 3),
+            'status': pool.status(),
+        }
+
+
+def init_db_pool(app):
+    """Podpina liczniki pod pule silników aplikacji (wywoływać po db.init_app)."""
+    with app.app_context():
+        engines = dict(db.engines)
+    for bind_key, engine in engines.items():
+        metrics = PoolMetrics(engine)
+        event.listen(engine.pool, 'checkout', metrics.on_checkout)
+        event.listen(engine.pool, 'checkin', metrics.on_checkin)
+        event.listen(engine.pool, 'connect', metrics.on_connect)
+        event.listen(engine.pool, 'invalidate', metrics.on_invalidate)
+        app.extensions['db_pool' if bind_key is None else f'db_pool_{bind_key}'] = metrics
+
+        if not _engines and hasattr(os, 'register_at_fork'):
+            # Worker Celery (prefork) - proces potomny nie może używać gniazd odziedziczonych po rodzicu
+            os.register_at_fork(after_in_child=_dispose_after_fork)
+        _engines.add(engine)
+
+
+def _dispose_after_fork():
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+def get_db_connection(app=None, replica=False):
+    """
+    Wypożycza połączenie z puli silnika aplikacji (`app` lub current_app).
+    Przy `replica=True` (odczyty raportowe) - z puli repliki, jeśli jest dostępna.
+    Wywołujący zwraca je przez conn.close(). Przy wyczerpanej puli po
+    pool_timeout sekundach zgłaszany jest sqlalchemy.exc.TimeoutError.
+    """
+    if app is None:
+        app = current_app._get_current_object()
+    metrics = app.extensions.get('db_pool')
+    if metrics is None:
+        init_db_pool(app)
+        metrics = app.extensions['db_pool']
+    if replica and replica_engine(app) is not None:
+        metrics = app.extensions[f'db_pool_{REPLICA_BIND}']
+
+    started = time.perf_counter()
+    try:
+        connection = metrics.engine.raw_connection()
+    except PoolTimeoutError:
+        metrics.record_timeout()
+        print(f"ERROR: Pula połączeń z bazą wyczerpana ({metrics.engine.pool.status()}).")
+        raise
+    metrics.record_checkout((time.perf_counter() - started) * 1000)
+    if 'sql_perf' in app.extensions:
+        return perf.instrument_connection(connection)
+    return connection
+
 
-def get_db_connection(config=None):
-    """Tworzy i zwraca nowe połączenie z bazą danych na podstawie podanej konfiguracji lub z current_app."""
-    if config is None:
-        config = current_app.config
-    connection = mysql.connector.connect(
-        host=config['MYSQL_HOST'],
-        user=config['MYSQL_USER'],
-        password=config['MYSQL_PASSWORD'],
-        database=config['MYSQL_DB'],
-        autocommit=False
-    )
-    cursor = connection.cursor()
-    cursor.execute("SET time_zone = '+00:00'")
-    cursor.close()
-    return connection
\ No newline at end of file
+def db_pool_stats(app=None):
+    """Zwraca stan puli połączeń i liczniki wypożyczeń."""
+    if app is None:
+        app = current_app._get_current_object()
+    metrics = app.extensions.get('db_pool')
+    if metrics is None:
+        return None
+    stats = metrics.snapshot()
+    replica_metrics = app.extensions.get(f'db_pool_{REPLICA_BIND}')
+    if replica_metrics is not None:
+        stats['replica'] = dict(replica_metrics.snapshot(), routing=app.extensions['replica'].status())
+    return stats
@@ -0,0 +1,36 @@
+# app/debug_routes.py
+"""
+Endpointy diagnostyczne (pula połączeń, pomiar zapytań SQL). Blueprint rejestrowany
+wyłącznie przy SQL_PERF_ENABLED - ujawnia kształty instrukcji SQL i stan puli,
+więc nie może być dostępny na produkcji bez świadomego włączenia.
+"""
+
+from flask import Blueprint, jsonify, request, current_app
+from .db import db_pool_stats
+
+debug_bp = Blueprint('debug', __name__, url_prefix='/api/debug')
+
+
+@debug_bp.route('/db-pool', methods=['GET'])
+def get_db_pool_stats():
+    """Zwraca stan puli połączeń z bazą (wypożyczone, szczyt, oczekiwania, przekroczenia limitu czasu)."""
+    try:
+        return jsonify(db_pool_stats())
+    except Exception as e:
+        return jsonify({'error': f'Błąd pobierania stanu puli połączeń: {str(e)}'}), 500
+
+
+@debug_bp.route('/perf', methods=['GET', 'DELETE'])
+def get_perf_stats():
+    """
+    Zwraca agregaty pomiaru zapytań SQL per endpoint / zadanie Celery w tym procesie
+    (liczba zapytań, czas w bazie, sygnatury N+1, najwolniejsze instrukcje) i stan puli.
+    DELETE zeruje agregaty.
+    """
+    registry = current_app.extensions.get('sql_perf')
+    if registry is None:
+        return jsonify({'error': 'Pomiar zapytań SQL jest wyłączony (SQL_PERF_ENABLED).'}), 404
+    if request.method == 'DELETE':
+        registry.reset()
+        return jsonify({'success': True})
+    return jsonify(dict(registry.snapshot(), db_pool=db_pool_stats()))
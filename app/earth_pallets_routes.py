@@ -2,6 +2,7 @@
 
 from flask import Blueprint, jsonify, request, render_template
 from .extensions import db
+from .replica import read_replica
 from .models import EarthPallets
 from datetime import datetime
 from sqlalchemy import func, desc
@@ -48,6 +49,7 @@ def index():
 
 
 @bp.route('/api/pallets', methods=['GET'])
+@read_replica
 def get_pallets():
     """Pobiera wszystkie palety (sortowane po ID od najnowszych)"""
     try:
@@ -5,9 +5,11 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
 from sqlalchemy import event
 from sqlalchemy.engine import Engine
+from .replica import RoutingSession
 
 
-db = SQLAlchemy()
+# Sesja kieruje odczyty z bloków @read_replica na replikę (patrz replica.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 @event.listens_for(Engine, "connect")
 def set_utc_timezone(dbapi_connection, connection_record):
@@ -15,6 +17,9 @@ def set_utc_timezone(dbapi_connection, connection_record):
     Wykonuje SET time_zone = '+00:00' dla każdego nowego połączenia.
     Zapewnia to, że sesja MySQL zawsze działa w UTC.
     """
+    if type(dbapi_connection).__module__.startswith('sqlite3'):
+        # Np. lokalna replika testowa na SQLite - brak strefy czasowej sesji
+        return
     cursor = dbapi_connection.cursor()
     cursor.execute("SET time_zone = '+00:00'")
     cursor.close()
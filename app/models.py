@@ -7,12 +7,35 @@ from typing import Optional, List
 
 from sqlalchemy import (
     DECIMAL, DateTime, ForeignKeyConstraint, Index, Integer, JSON, String,
-    Table, Text, TIMESTAMP, text, VARCHAR, ForeignKey, func, Boolean
+    Table, Text, TIMESTAMP, text, VARCHAR, ForeignKey, func, Boolean, select
 )
 from sqlalchemy.dialects.mysql import ENUM, TINYINT
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 
+def _telemetria(kolumna):
+    """
+    Atrybut Sprzet odczytujący i zapisujący bieżący pomiar z wiersza sprzet_telemetria
+    (wiersz tworzony przy pierwszym zapisie). Na poziomie klasy - skorelowane podzapytanie,
+    więc Sprzet.temperatura_aktualna działa też w select() i where().
+    """
+    def fget(self):
+        return getattr(self.telemetria, kolumna) if self.telemetria is not None else None
+
+    def fset(self, value):
+        if self.telemetria is None:
+            self.telemetria = SprzetTelemetria()
+        setattr(self.telemetria, kolumna, value)
+
+    def expr(cls):
+        return select(getattr(SprzetTelemetria, kolumna)).where(
+            SprzetTelemetria.id_sprzetu == cls.id
+        ).scalar_subquery().label(kolumna)
+
+    return hybrid_property(fget, fset, expr=expr)
+
+
 # Definiujemy tabelę `sprzet` jako klasę Pythona
 class Alarmy(db.Model):
     __tablename__ = 'alarmy'
@@ -31,6 +54,9 @@ class Alarmy(db.Model):
 
 class PathfinderTestHistory(db.Model):
     __tablename__ = 'pathfinder_test_history'
+    __table_args__ = (
+        Index('ix_pathfinder_test_history_created_at', 'created_at'),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     test_type: Mapped[str] = mapped_column(VARCHAR(50))
@@ -58,10 +84,11 @@ class Sprzet(db.Model):
     typ_sprzetu: Mapped[Optional[str]] = mapped_column(ENUM('reaktor', 'filtr', 'beczka_brudna', 'beczka_czysta', 'apollo', 'magazyn', 'cysterna', 'mauzer'))
     pojemnosc_kg: Mapped[Optional[decimal.Decimal]] = mapped_column(DECIMAL(10, 2))
     stan_sprzetu: Mapped[Optional[str]] = mapped_column(VARCHAR(50), comment='Np. Pusty, W koło, Przelew, Dmuchanie filtra')
-    temperatura_aktualna: Mapped[Optional[decimal.Decimal]] = mapped_column(DECIMAL(10, 6))
-    cisnienie_aktualne: Mapped[Optional[decimal.Decimal]] = mapped_column(DECIMAL(5, 2))
-    poziom_aktualny_procent: Mapped[Optional[decimal.Decimal]] = mapped_column(DECIMAL(5, 2))
-    ostatnia_aktualizacja: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+    # Bieżące odczyty czujników są w osobnej tabeli sprzet_telemetria (patrz SprzetTelemetria)
+    temperatura_aktualna = _telemetria('temperatura_aktualna')
+    cisnienie_aktualne = _telemetria('cisnienie_aktualne')
+    poziom_aktualny_procent = _telemetria('poziom_aktualny_procent')
+    ostatnia_aktualizacja = _telemetria('ostatnia_aktualizacja')
     temperatura_max: Mapped[Optional[decimal.Decimal]] = mapped_column(DECIMAL(10, 6), server_default=text("'120.00'"))
     cisnienie_max: Mapped[Optional[decimal.Decimal]] = mapped_column(DECIMAL(5, 2), server_default=text("'6.00'"))
     id_partii_surowca: Mapped[Optional[int]] = mapped_column(Integer)
@@ -100,12 +127,40 @@ class Sprzet(db.Model):
         post_update=True # Ważne dla cyklicznych zależności
     )
     historia_podgrzewania: Mapped[List['HistoriaPodgrzewania']] = relationship(back_populates='sprzet')
+    # Ładowana razem ze sprzętem (LEFT JOIN), aby odczyt pomiarów w pętlach nie był N+1
+    telemetria: Mapped[Optional['SprzetTelemetria']] = relationship(
+        back_populates='sprzet', uselist=False, lazy='joined',
+        cascade='all, delete-orphan', passive_deletes=True
+    )
 
 
     def __repr__(self):
         # Ta metoda pomaga w debugowaniu, ładnie wyświetlając obiekt
         return f"<Sprzet id={self.id} nazwa='{self.nazwa_unikalna}'>"
 
+
+class SprzetTelemetria(db.Model):
+    """
+    Bieżące odczyty czujników sprzętu, nadpisywane w każdym cyklu read_sensors.
+    Wydzielone z szerokiego wiersza `sprzet`, aby częste zapisy pomiarów nie blokowały
+    i nie "przepisywały" wiersza konfiguracji, czytanego przez większość endpointów.
+    Kod ORM korzysta z atrybutów Sprzet.temperatura_aktualna itd., a surowy SQL
+    dołącza tabelę: LEFT JOIN sprzet_telemetria ON sprzet_telemetria.id_sprzetu = sprzet.id.
+    """
+    __tablename__ = 'sprzet_telemetria'
+    __table_args__ = (
+        ForeignKeyConstraint(['id_sprzetu'], ['sprzet.id'], ondelete='CASCADE', name='sprzet_telemetria_ibfk_1'),
+        {'comment': 'Bieżące odczyty czujników sprzętu (temperatura, ciśnienie, poziom)'}
+    )
+
+    id_sprzetu: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    temperatura_aktualna: Mapped[Optional[decimal.Decimal]] = mapped_column(DECIMAL(10, 6))
+    cisnienie_aktualne: Mapped[Optional[decimal.Decimal]] = mapped_column(DECIMAL(5, 2))
+    poziom_aktualny_procent: Mapped[Optional[decimal.Decimal]] = mapped_column(DECIMAL(5, 2))
+    ostatnia_aktualizacja: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+
+    sprzet: Mapped['Sprzet'] = relationship(back_populates='telemetria')
+
 class PartieApollo(db.Model):
     __tablename__ = 'partie_apollo'
     __table_args__ = (
@@ -172,6 +227,32 @@ class Zawory(db.Model):
     segmenty: Mapped[List['Segmenty']] = relationship('Segmenty', back_populates='zawory')
 
 
+class TopologiaWersja(db.Model):
+    __tablename__ = 'topologia_wersja'
+    __table_args__ = {'comment': 'Znacznik wersji mapy rurociągu (jeden wiersz, id=1) - do przeładowania grafu w innych procesach'}
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    wersja: Mapped[int] = mapped_column(Integer, server_default=text("'0'"))
+    zmieniono_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+
+
+class TopologiaSnapshot(db.Model):
+    __tablename__ = 'topologia_snapshoty'
+    __table_args__ = (
+        Index('ix_topologia_snapshoty_hash', 'hash_sha256', unique=True),
+        {'comment': 'Niezmienne migawki struktury mapy rurociągu (porty, węzły, segmenty z zaworami) identyfikowane skrótem SHA-256'}
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    hash_sha256: Mapped[str] = mapped_column(VARCHAR(64), nullable=False)
+    wersja_topologii: Mapped[int] = mapped_column(Integer, server_default=text("'0'"))
+    liczba_portow: Mapped[int] = mapped_column(Integer, server_default=text("'0'"))
+    liczba_wezlow: Mapped[int] = mapped_column(Integer, server_default=text("'0'"))
+    liczba_segmentow: Mapped[int] = mapped_column(Integer, server_default=text("'0'"))
+    dane: Mapped[dict] = mapped_column(JSON, nullable=False)
+    utworzono_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+
+
 class ApolloSesje(db.Model):
     __tablename__ = 'apollo_sesje'
     __table_args__ = (
@@ -4,6 +4,10 @@ from datetime import datetime, timezone
 from .extensions import db
 from .models import Sprzet, Alarmy
 
+# Zapytania sprawdzania alarmów (co tik Celery) budowane raz przy imporcie - patrz dashboard_service
+ALL_EQUIPMENT_Q = db.select(Sprzet)
+ACTIVE_ALARMS_Q = db.select(Alarmy).where(Alarmy.status_alarmu == 'AKTYWNY')
+
 class MonitoringService:
     
     def init_app(self, app):
@@ -15,11 +19,10 @@ class MonitoringService:
         """
         try:
             # 1. Pobierz stan wszystkich urządzeń
-            all_equipment = db.session.execute(db.select(Sprzet)).scalars().all()
+            all_equipment = db.session.execute(ALL_EQUIPMENT_Q).scalars().all()
 
             # 2. Pobierz wszystkie AKTYWNE alarmy
-            active_alarms_q = db.select(Alarmy).where(Alarmy.status_alarmu == 'AKTYWNY')
-            active_alarms_raw = db.session.execute(active_alarms_q).scalars().all()
+            active_alarms_raw = db.session.execute(ACTIVE_ALARMS_Q).scalars().all()
             
             # Stwórz słownik dla szybkich sprawdzeń: (nazwa_sprzętu, typ_alarmu) -> obiekt Alarm
             active_alarms = {(a.nazwa_sprzetu, a.typ_alarmu): a for a in active_alarms_raw}
@@ -31,6 +31,26 @@ def get_pathfinder():
     print(f"DEBUG: pathfinder retrieved: {type(pathfinder)}")
     return pathfinder
 
+def _znajdz_wolna_trase(pathfinder, punkty, otwarte_zawory):
+    """
+    Szuka trasy przez kolejne punkty, omijając segmenty zajęte przez aktywne operacje.
+    Zwraca (odcinki, zajete_segmenty) - odcinki jak w PathFinder.find_route_legs.
+    Jeśli wolnej trasy nie ma, a istnieje trasa przez zajęte segmenty,
+    zajete_segmenty wskazuje blokujące segmenty.
+    """
+    odcinki = pathfinder.find_route_legs(punkty, otwarte_zawory, avoid_occupied=True)
+    if all(odcinek is not None for odcinek in odcinki):
+        return odcinki, []
+    odcinki_przez_zajete = pathfinder.find_route_legs(punkty, otwarte_zawory)
+    zajete = [
+        nazwa for odcinek in odcinki_przez_zajete if odcinek is not None
+        for nazwa in pathfinder.occupied_in(odcinek)
+    ]
+    if any(odcinek is None for odcinek in odcinki_przez_zajete):
+        # Trasy nie ma niezależnie od zajętości - zwracamy, który odcinek jest nieosiągalny
+        return odcinki_przez_zajete, []
+    return odcinki, zajete
+
 # Endpoint do tworzenia nowej partii przez tankowanie
 
 
@@ -107,17 +127,19 @@ def start_apollo_transfer():
         punkt_docelowy = f"{cel['nazwa_unikalna']}_IN"
         print(f"DEBUG: punkt_startowy={punkt_startowy}, punkt_docelowy={punkt_docelowy}")
         
-        print(f"DEBUG: Getting all valves from pathfinder graph")
-        wszystkie_zawory = [edge_data['valve_name'] for _, _, edge_data in pathfinder.graph.edges(data=True)]
+        wszystkie_zawory = pathfinder.valve_names()
         print(f"DEBUG: Found {len(wszystkie_zawory)} valves")
         
         print(f"DEBUG: Calling pathfinder.find_path()")
-        trasa_segmentow_nazwy = pathfinder.find_path(punkt_startowy, punkt_docelowy, wszystkie_zawory)
+        (trasa_segmentow_nazwy,), zajete = _znajdz_wolna_trase(pathfinder, [punkt_startowy, punkt_docelowy], wszystkie_zawory)
         print(f"DEBUG: pathfinder.find_path() returned: {trasa_segmentow_nazwy}")
 
+        if zajete:
+            return jsonify({'message': 'Konflikt zasobów - każda trasa prowadzi przez segmenty używane przez inne operacje.','zajete_segmenty': zajete}), 409
         if not trasa_segmentow_nazwy:
             return jsonify({'message': f'Nie można znaleźć trasy z {punkt_startowy} do {punkt_docelowy}'}), 404
             
+        # Zabezpieczenie: baza jest źródłem prawdy (np. operację rozpoczął inny proces)
         placeholders_konflikt = ', '.join(['%s'] * len(trasa_segmentow_nazwy))
         sql_konflikt = f"SELECT s.nazwa_segmentu FROM log_uzyte_segmenty lus JOIN operacje_log ol ON lus.id_operacji_log = ol.id JOIN segmenty s ON lus.id_segmentu = s.id WHERE ol.status_operacji = 'aktywna' AND s.nazwa_segmentu IN ({placeholders_konflikt})"
         read_cursor.execute(sql_konflikt, trasa_segmentow_nazwy)
@@ -125,17 +147,13 @@ def start_apollo_transfer():
 
         if konflikty:
             nazwy_zajetych = [k['nazwa_segmentu'] for k in konflikty]
+            pathfinder.refresh_occupancy()
             return jsonify({'message': 'Konflikt zasobów - niektóre segmenty są używane przez inne operacje.','zajete_segmenty': nazwy_zajetych}), 409
 
         write_cursor = conn.cursor()
 
         # NOWY KROK: Otwórz zawory na trasie
-        zawory_do_otwarcia = set()
-        for segment_name in trasa_segmentow_nazwy:
-            for u, v, data in pathfinder.graph.edges(data=True):
-                if data.get('segment_name') == segment_name:
-                    zawory_do_otwarcia.add(data['valve_name'])
-                    break
+        zawory_do_otwarcia = pathfinder.valves_for_segments(trasa_segmentow_nazwy)
         
         if zawory_do_otwarcia:
             placeholders_zawory = ', '.join(['%s'] * len(zawory_do_otwarcia))
@@ -149,10 +167,7 @@ def start_apollo_transfer():
         write_cursor.execute(sql_log, (typ_operacji, id_zrodla, id_celu, opis_operacji, punkt_startowy, punkt_docelowy, operator))
         operacja_id = write_cursor.lastrowid
 
-        placeholders_segmenty = ', '.join(['%s'] * len(trasa_segmentow_nazwy))
-        sql_id_segmentow = f"SELECT id FROM segmenty WHERE nazwa_segmentu IN ({placeholders_segmenty})"
-        read_cursor.execute(sql_id_segmentow, trasa_segmentow_nazwy)
-        id_segmentow = [row['id'] for row in read_cursor.fetchall()]
+        id_segmentow = pathfinder.segment_ids(trasa_segmentow_nazwy)
 
         sql_blokada = "INSERT INTO log_uzyte_segmenty (id_operacji_log, id_segmentu) VALUES (%s, %s)"
         dane_do_blokady = [(operacja_id, id_seg) for id_seg in id_segmentow]
@@ -162,6 +177,8 @@ def start_apollo_transfer():
         write_cursor.execute("UPDATE sprzet SET stan_sprzetu = 'W transferze' WHERE id = %s", (id_celu,))
         
         conn.commit()
+        pathfinder.set_valve_states({nazwa: 'OTWARTY' for nazwa in zawory_do_otwarcia})
+        pathfinder.occupy_segments(operacja_id, trasa_segmentow_nazwy)
         broadcast_apollo_update()
 
         return jsonify({'message': 'Transfer rozpoczęty pomyślnie.','id_operacji': operacja_id}), 201
@@ -261,6 +278,9 @@ def end_apollo_transfer():
         #     partia_w_apollo.waga_aktualna_kg -= waga_kg
         
         db.session.commit()
+        pathfinder = get_pathfinder()
+        pathfinder.set_valve_states({nazwa: 'ZAMKNIETY' for nazwa in zawory_do_zamkniecia_nazwy})
+        pathfinder.release_operation(operacja.id)
         broadcast_apollo_update()
         return jsonify({'success': True, 'message': f'Operacja {id_operacji} zakończona. Utworzono i zatankowano partię.'})
 
@@ -322,6 +342,9 @@ def anuluj_apollo_transfer():
         cursor.execute("UPDATE sprzet SET stan_sprzetu = 'Gotowy' WHERE id = %s", (id_celu))
         cursor.execute("UPDATE sprzet SET stan_sprzetu = 'Zatankowany' WHERE id = %s", (id_zrodla))
         conn.commit()
+        pathfinder = get_pathfinder()
+        pathfinder.set_valve_states({nazwa: 'ZAMKNIETY' for nazwa in zawory_do_zamkniecia})
+        pathfinder.release_operation(operacja['id'])
         broadcast_dashboard_update()
 
         return jsonify({'success': True, 'message': f'Operacja {id_operacji} została anulowana.'})
@@ -376,12 +399,18 @@ def start_cysterna_transfer():
         punkt_startowy = f"{zrodlo['nazwa_unikalna']}_OUT"
         punkt_docelowy = f"{cel['nazwa_unikalna']}_IN"
         
-        wszystkie_zawory = [edge_data['valve_name'] for _, _, edge_data in pathfinder.graph.edges(data=True) if 'valve_name' in edge_data]
-        trasa_segmentow_nazwy = pathfinder.find_path(punkt_startowy, punkt_docelowy, wszystkie_zawory)
+        wszystkie_zawory = pathfinder.valve_names()
+        (trasa_segmentow_nazwy,), zajete = _znajdz_wolna_trase(pathfinder, [punkt_startowy, punkt_docelowy], wszystkie_zawory)
 
+        if zajete:
+            return jsonify({
+                'message': 'Konflikt zasobów - każda trasa prowadzi przez używane segmenty.',
+                'zajete_segmenty': zajete
+            }), 409
         if not trasa_segmentow_nazwy:
             return jsonify({'message': f'Nie można znaleźć trasy z {punkt_startowy} do {punkt_docelowy}'}), 404
 
+        # Zabezpieczenie: baza jest źródłem prawdy (np. operację rozpoczął inny proces)
         placeholders_konflikt = ', '.join(['%s'] * len(trasa_segmentow_nazwy))
         sql_konflikt = f"SELECT s.nazwa_segmentu FROM log_uzyte_segmenty lus JOIN operacje_log ol ON lus.id_operacji_log = ol.id JOIN segmenty s ON lus.id_segmentu = s.id WHERE ol.status_operacji = 'aktywna' AND s.nazwa_segmentu IN ({placeholders_konflikt})"
         cursor.execute(sql_konflikt, trasa_segmentow_nazwy)
@@ -391,6 +420,7 @@ def start_cysterna_transfer():
         # Uwaga: ta logika jest trochę dziwna, bo 'force' nie jest tutaj używane
         if konflikty:
             nazwy_zajetych = [k['nazwa_segmentu'] for k in konflikty]
+            pathfinder.refresh_occupancy()
             return jsonify({
                 'message': 'Konflikt zasobów - niektóre segmenty są używane.',
                 'zajete_segmenty': nazwy_zajetych
@@ -398,12 +428,7 @@ def start_cysterna_transfer():
 
         write_cursor = conn.cursor()
 
-        zawory_do_otwarcia = set()
-        for segment_name in trasa_segmentow_nazwy:
-            for u, v, d in pathfinder.graph.edges(data=True):
-                if d.get('segment_name') == segment_name and 'valve_name' in d:
-                    zawory_do_otwarcia.add(d['valve_name'])
-                    break
+        zawory_do_otwarcia = pathfinder.valves_for_segments(trasa_segmentow_nazwy)
         if zawory_do_otwarcia:
             placeholders_zawory = ', '.join(['%s'] * len(zawory_do_otwarcia))
             sql_zawory = f"UPDATE zawory SET stan = 'OTWARTY' WHERE nazwa_zaworu IN ({placeholders_zawory})"
@@ -416,10 +441,7 @@ def start_cysterna_transfer():
         write_cursor.execute(sql_log, (typ_operacji, id_cysterny, id_celu, opis_operacji, punkt_startowy, punkt_docelowy, operator))
         operacja_id = write_cursor.lastrowid
 
-        placeholders_segmenty = ', '.join(['%s'] * len(trasa_segmentow_nazwy))
-        sql_id_segmentow = f"SELECT id FROM segmenty WHERE nazwa_segmentu IN ({placeholders_segmenty})"
-        cursor.execute(sql_id_segmentow, trasa_segmentow_nazwy)
-        id_segmentow = [row['id'] for row in cursor.fetchall()]
+        id_segmentow = pathfinder.segment_ids(trasa_segmentow_nazwy)
         sql_blokada = "INSERT INTO log_uzyte_segmenty (id_operacji_log, id_segmentu) VALUES (%s, %s)"
         dane_do_blokady = [(operacja_id, id_seg) for id_seg in id_segmentow]
         write_cursor.executemany(sql_blokada, dane_do_blokady)
@@ -428,6 +450,8 @@ def start_cysterna_transfer():
         write_cursor.execute("UPDATE sprzet SET stan_sprzetu = 'W transferze' WHERE id = %s", (id_celu,))
         
         conn.commit()
+        pathfinder.set_valve_states({nazwa: 'OTWARTY' for nazwa in zawory_do_otwarcia})
+        pathfinder.occupy_segments(operacja_id, trasa_segmentow_nazwy)
         return jsonify({'message': 'Roztankowanie cysterny rozpoczęte pomyślnie.', 'id_operacji': operacja_id}), 201
 
     except mysql.connector.Error as err:
@@ -542,6 +566,9 @@ def end_cysterna_transfer():
         cursor.execute("UPDATE sprzet SET stan_sprzetu = 'Zatankowany' WHERE id = %s", (id_celu,))
         
         conn.commit()
+        pathfinder = get_pathfinder()
+        pathfinder.set_valve_states({nazwa: 'ZAMKNIETY' for nazwa in zawory_do_zamkniecia})
+        pathfinder.release_operation(operacja['id'])
         return jsonify({'message': 'Operacja zakończona pomyślnie. Utworzono i przetworzono nową partię surowca.'}), 200
 
     except mysql.connector.Error as err:
@@ -603,6 +630,9 @@ def anuluj_cysterna_transfer():
         write_cursor.execute("UPDATE sprzet SET stan_sprzetu = 'Pusty' WHERE id = %s", (id_celu,))
 
         conn.commit()
+        pathfinder = get_pathfinder()
+        pathfinder.set_valve_states({nazwa: 'ZAMKNIETY' for nazwa in zawory_do_zamkniecia})
+        pathfinder.release_operation(operacja['id'])
         return jsonify({'success': True, 'message': f'Operacja {id_operacji} została anulowana.'})
 
     except mysql.connector.Error as err:
@@ -627,30 +657,27 @@ def rozpocznij_trase():
     sprzet_posredni = dane.get('sprzet_posredni')
     
     pathfinder = get_pathfinder()
-    znaleziona_sciezka_nazwy = []
 
     # --- Logika PathFinder (teraz kompletna) ---
+    # Jeśli jest sprzęt pośredni (np. filtr), trasa prowadzi przez jego wejście i wyjście.
+    # Wszystkie odcinki liczone są jednym wywołaniem, z pominięciem segmentów zajętych.
+    punkty = [start_point, end_point]
     if sprzet_posredni:
-        # Jeśli jest sprzęt pośredni (np. filtr), szukamy trasy w dwóch częściach.
-        posredni_in = f"{sprzet_posredni}_IN"
-        posredni_out = f"{sprzet_posredni}_OUT"
+        punkty = [start_point, f"{sprzet_posredni}_IN", f"{sprzet_posredni}_OUT", end_point]
 
-        sciezka_1 = pathfinder.find_path(start_point, posredni_in, open_valves_list)
-        if not sciezka_1:
-            return jsonify({"status": "error", "message": f"Nie znaleziono ścieżki z {start_point} do {posredni_in}."}), 404
-        
-        sciezka_wewnetrzna = pathfinder.find_path(posredni_in, posredni_out, open_valves_list)
-        if not sciezka_wewnetrzna:
-            return jsonify({"status": "error", "message": f"Nie znaleziono ścieżki wewnętrznej w {sprzet_posredni} (z {posredni_in} do {posredni_out})."}), 404
+    odcinki, zajete = _znajdz_wolna_trase(pathfinder, punkty, open_valves_list)
+    if zajete:
+        return jsonify({"status": "error", "message": "Konflikt zasobów.", "zajete_segmenty": zajete}), 409
 
-        sciezka_2 = pathfinder.find_path(posredni_out, end_point, open_valves_list)
-        if not sciezka_2:
-            return jsonify({"status": "error", "message": f"Nie znaleziono ścieżki z {posredni_out} do {end_point}."}), 404
+    for i, odcinek in enumerate(odcinki):
+        if odcinek is None and len(punkty) > 2:
+            if i == 1:
+                komunikat = f"Nie znaleziono ścieżki wewnętrznej w {sprzet_posredni} (z {punkty[1]} do {punkty[2]})."
+            else:
+                komunikat = f"Nie znaleziono ścieżki z {punkty[i]} do {punkty[i + 1]}."
+            return jsonify({"status": "error", "message": komunikat}), 404
 
-        znaleziona_sciezka_nazwy = sciezka_1 + sciezka_wewnetrzna + sciezka_2
-    else:
-        # Jeśli nie ma punktu pośredniego, szukamy jednej, ciągłej ścieżki.
-        znaleziona_sciezka_nazwy = pathfinder.find_path(start_point, end_point, open_valves_list)
+    znaleziona_sciezka_nazwy = [segment for odcinek in odcinki if odcinek for segment in odcinek]
 
     if not znaleziona_sciezka_nazwy:
         return jsonify({
@@ -667,7 +694,7 @@ def rozpocznij_trase():
         if not partia:
             return jsonify({"status": "error", "message": f"W urządzeniu startowym ({start_point}) nie znaleziono żadnej partii."}), 404
         
-        # Krok 2: Sprawdź konflikty
+        # Krok 2: Sprawdź konflikty (zabezpieczenie - trasa omija już segmenty zajęte w pamięci PathFindera)
         konflikt_query = db.select(Segmenty.nazwa_segmentu).join(Segmenty.operacje_log).where(
             OperacjeLog.status_operacji == 'aktywna',
             Segmenty.nazwa_segmentu.in_(znaleziona_sciezka_nazwy)
@@ -675,6 +702,7 @@ def rozpocznij_trase():
         konflikty = db.session.execute(konflikt_query).scalars().all()
 
         if konflikty:
+            pathfinder.refresh_occupancy()
             return jsonify({
                 "status": "error", "message": "Konflikt zasobów.",
                 "zajete_segmenty": konflikty
@@ -705,6 +733,8 @@ def rozpocznij_trase():
         nowa_operacja.segmenty = segmenty_trasy
 
         db.session.commit()
+        pathfinder.set_valve_states({nazwa: 'OTWARTY' for nazwa in open_valves_list})
+        pathfinder.occupy_segments(nowa_operacja.id, znaleziona_sciezka_nazwy)
         
         return jsonify({
             "status": "success",
@@ -767,6 +797,9 @@ def zakoncz_operacje():
 
         # Krok 5: Zatwierdź transakcję
         db.session.commit()
+        pathfinder = get_pathfinder()
+        pathfinder.set_valve_states({nazwa: 'ZAMKNIETY' for nazwa in zawory_do_zamkniecia_nazwy})
+        pathfinder.release_operation(operacja.id)
 
         return jsonify({
             "status": "success",
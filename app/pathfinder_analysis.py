@@ -0,0 +1,567 @@
+# app/pathfinder_analysis.py
+"""
+Analizy grafu rurociągu liczone w całości w pamięci (bez zapytań do bazy).
+
+Krytyczność zaworów: dla każdej uporządkowanej pary portów (start, cel), między
+którymi istnieje trasa, ustalamy, których zaworów zamknięcie tę trasę przerywa.
+
+- Zawór sterujący jednym segmentem - drzewa dominatorów. Każdy segment zamieniany
+  jest na osobny węzeł grafu, więc segment przerywa trasę start -> cel dokładnie wtedy,
+  gdy jego węzeł dominuje cel w drzewie dominatorów liczonym od startu.
+  Jedno drzewo na port startowy obsługuje wszystkie zawory naraz.
+- Zawór sterujący kilkoma segmentami - zamknięcie usuwa kilka krawędzi jednocześnie,
+  czego dominatory nie opisują. Dla takich zaworów macierz osiągalności liczona jest
+  od nowa bez ich krawędzi i porównywana z bazową; zawory rozdzielane są na długo żyjącą
+  pulę procesów (AnalysisPool), tworzoną przy pierwszej analizie w procesie.
+
+Mosty i punkty artykulacji dotyczą grafów nieskierowanych - dla przepływu
+(graf skierowany) ich odpowiednikiem są właśnie dominatory.
+"""
+
+import multiprocessing
+import os
+from collections import defaultdict
+import networkx as nx
+
+
+def run_cpu_bound(func, *args, **kwargs):
+    """
+    Wykonuje obliczenie CPU w wątku systemowym, gdy proces działa pod eventletem (monkey_patch):
+    `threading.Thread` jest tam zielonym wątkiem i liczenie w nim blokowałoby pętlę zdarzeń,
+    czyli wszystkie żądania HTTP i klientów Socket.IO. Bez eventletu wywołuje funkcję wprost.
+    `func` dostaje migawki danych i nie może używać locków ani sesji bazy - wynik
+    podmienia wywołujący, już w swoim wątku.
+    """
+    if _eventlet_patched():
+        from eventlet import tpool
+        return tpool.execute(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+
+def _eventlet_patched():
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return False
+    return patcher.is_monkey_patched('thread')
+
+
+def compute_reachability_rows(adjacency, port_names):
+    """
+    Liczy wiersze macierzy osiągalności: port -> bitset portów (bit i = port_names[i]).
+    Graf jest kondensowany do silnie spójnych składowych, a bitsety sumowane
+    w odwrotnej kolejności topologicznej, więc każda krawędź jest odwiedzana raz.
+    """
+    graph = nx.DiGraph()
+    graph.add_nodes_from(adjacency)
+    graph.add_edges_from((u, v) for u, nbrs in adjacency.items() for v in nbrs)
+
+    port_bits = {nazwa: 1 << i for i, nazwa in enumerate(port_names)}
+    condensed = nx.condensation(graph)
+    reach = {}
+    for component in reversed(list(nx.topological_sort(condensed))):
+        bits = 0
+        for node in condensed.nodes[component]['members']:
+            bits |= port_bits.get(node, 0)
+        for successor in condensed.successors(component):
+            bits |= reach[successor]
+        reach[component] = bits
+
+    mapping = condensed.graph['mapping']
+    return {nazwa: reach[mapping[nazwa]] for nazwa in port_names if nazwa in mapping}
+
+
+class AnalysisPool:
+    """
+    Długo żyjące procesy analizy ('spawn'), każdy z własnym potokiem. Procesy startują przy
+    pierwszym zadaniu i są potem używane ponownie - pojedyncza analiza nie płaci za start
+    interpreterów i import aplikacji. Wysyłka zadań i odbiór wyników odbywają się w całości
+    w wątku wywołującym (pod eventletem: w wątku systemowym tpool, patrz run_cpu_bound),
+    bez wątków pomocniczych i kolejek concurrent.futures - po monkey_patch są one zielone
+    i oczekiwanie na nie z innego wątku systemowego potrafi się zawiesić.
+    Jedno wywołanie map naraz (PathFinder woła je pod _critical_lock).
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._workers = []  # (proces, końcówka potoku)
+
+    def map(self, func, items):
+        """Jak wbudowane map, ale `func(item)` liczone w procesach puli; zachowuje kolejność."""
+        items = list(items)
+        results = []
+        try:
+            self._start()
+            for i in range(0, len(items), self.workers):
+                chunk = list(zip(self._workers, items[i:i + self.workers]))
+                for (_, conn), item in chunk:
+                    conn.send((func, item))
+                for (_, conn), _ in chunk:
+                    ok, result = conn.recv()
+                    if not ok:
+                        raise result
+                    results.append(result)
+        except (EOFError, OSError):
+            # Proces puli zakończył się w trakcie zadania - pula wystartuje od nowa przy kolejnym wywołaniu
+            self.close()
+            raise
+        return results
+
+    def close(self):
+        """Zatrzymuje procesy puli (wywoływane przy wyjściu procesu serwera)."""
+        workers, self._workers = self._workers, []
+        for process, conn in workers:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for process, conn in workers:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+
+    def _start(self):
+        # 'spawn' - proces serwera ma wątki w tle (fork mógłby skopiować zablokowane locki)
+        context = multiprocessing.get_context('spawn')
+        while len(self._workers) < self.workers:
+            conn, child_conn = context.Pipe()
+            process = context.Process(target=_pool_worker, args=(child_conn,), name='pathfinder-analysis', daemon=True)
+            process.start()
+            child_conn.close()
+            self._workers.append((process, conn))
+
+
+def _pool_worker(conn):
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        func, item = message
+        try:
+            conn.send((True, func(item)))
+        except Exception as e:
+            conn.send((False, e))
+
+
+def create_analysis_pool(workers):
+    """Pula procesów analizy (None, gdy analiza ma liczyć w bieżącym procesie). Zamyka ją właściciel."""
+    # Pula ma sens tylko przy więcej niż jednym rdzeniu
+    workers = min(workers or 0, os.cpu_count() or 1)
+    if workers <= 1:
+        return None
+    return AnalysisPool(workers)
+
+
+def analyze_critical_valves(edges, port_names, workers=0, pool=None):
+    """
+    `edges`: lista krawędzi widoku (start, koniec, segment, zawór) - tylko krawędzie przejezdne.
+    `pool`: pula z create_analysis_pool (zadania dzielone na `workers` paczek) albo None.
+    Zwraca (słownik {zawór: lista przerywanych par (start, cel)}, liczba par z trasą).
+    Zawory bez wpływu na żadną parę mają pustą listę.
+    """
+    workers = (workers or 0) if pool is not None else 0
+    state, tasks, blocked, pairs_total = run_cpu_bound(_prepare_analysis, edges, port_names, workers)
+    for task_result in _run_tasks(state, tasks, workers, pool):
+        for valve_name, pairs in task_result:
+            blocked[valve_name].extend(pairs)
+
+    return blocked, pairs_total
+
+
+def _prepare_analysis(edges, port_names, workers):
+    """Osiągalność bazowa, graf z węzłami segmentów i lista zadań analizy."""
+    valve_edges = defaultdict(list)
+    for u, v, segment_name, valve_name in edges:
+        if valve_name:
+            valve_edges[valve_name].append((u, v, segment_name))
+
+    adjacency = defaultdict(list)
+    for u, v, _, _ in edges:
+        adjacency[u].append(v)
+        adjacency.setdefault(v, [])
+    port_names = list(port_names)
+    baseline = compute_reachability_rows(adjacency, port_names)
+    # Bit portu startowego jest pomijany - para (port, ten sam port) nie jest trasą
+    baseline = {nazwa: baseline.get(nazwa, 0) & ~(1 << i) for i, nazwa in enumerate(port_names)}
+    pairs_total = sum(bin(row).count('1') for row in baseline.values())
+
+    blocked = {valve_name: [] for valve_name in valve_edges}
+    # Segment -> zawór dla zaworów z jednym segmentem; pozostałe liczone wprost
+    single = {}
+    multi = []
+    for valve_name, segments in valve_edges.items():
+        if len(segments) == 1:
+            single[segments[0][2]] = valve_name
+        else:
+            multi.append(valve_name)
+
+    graph = _SplitGraph(edges, port_names, single)
+    sources = [nazwa for nazwa in port_names if baseline[nazwa] and nazwa in graph.index]
+    dominator_tasks = [('dominators', sources[i::max(workers, 1)]) for i in range(max(workers, 1))]
+    valve_tasks = [('valve', (valve_name, [(u, v) for u, v, _ in valve_edges[valve_name]])) for valve_name in multi]
+
+    state = (graph, dict(adjacency), port_names, baseline)
+    return state, [task for task in dominator_tasks if task[1]] + valve_tasks, blocked, pairs_total
+
+
+class _SplitGraph:
+    """
+    Graf z segmentami zaworów jednosegmentowych zamienionymi na osobne węzły,
+    indeksowany liczbami całkowitymi (listy następników i poprzedników).
+    """
+
+    def __init__(self, edges, port_names, single):
+        self.index = {}
+        self.names = []
+        self.valve_of = []  # zawór węzła-segmentu lub None dla zwykłego węzła
+
+        def node(key, valve_name=None):
+            i = self.index.get(key)
+            if i is None:
+                i = self.index[key] = len(self.names)
+                self.names.append(key)
+                self.valve_of.append(valve_name)
+            return i
+
+        for nazwa in port_names:
+            node(nazwa)
+        pairs = []
+        for u, v, segment_name, _ in edges:
+            ui, vi = node(u), node(v)
+            if segment_name in single:
+                # Węzeł segmentu - krotka, więc nie koliduje z nazwami portów i węzłów
+                si = node(('segment', segment_name), single[segment_name])
+                pairs.append((ui, si))
+                pairs.append((si, vi))
+            else:
+                pairs.append((ui, vi))
+
+        self.succ = [[] for _ in self.names]
+        self.pred = [[] for _ in self.names]
+        for ui, vi in pairs:
+            self.succ[ui].append(vi)
+            self.pred[vi].append(ui)
+
+    def immediate_dominators(self, source):
+        """
+        Dominatory bezpośrednie (Cooper, Harvey, Kennedy) dla węzłów osiągalnych ze `source`.
+        Zwraca (idom, kolejność węzłów w odwrotnym porządku postorder); idom[x] = -1 dla nieosiągalnych.
+        """
+        succ, pred = self.succ, self.pred
+        count = len(self.names)
+        # Iteracyjny DFS - numeracja postorder
+        postorder = []
+        visited = bytearray(count)
+        visited[source] = 1
+        stack = [(source, iter(succ[source]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if not visited[child]:
+                    visited[child] = 1
+                    stack.append((child, iter(succ[child])))
+                    break
+            else:
+                stack.pop()
+                postorder.append(node)
+
+        order = [0] * count
+        for i, node in enumerate(postorder):
+            order[node] = i
+        rpo = postorder[::-1]
+
+        idom = [-1] * count
+        idom[source] = source
+        changed = True
+        while changed:
+            changed = False
+            for node in rpo[1:]:
+                new_idom = -1
+                for p in pred[node]:
+                    if idom[p] == -1:
+                        continue
+                    if new_idom == -1:
+                        new_idom = p
+                        continue
+                    a, b = p, new_idom
+                    while a != b:
+                        while order[a] < order[b]:
+                            a = idom[a]
+                        while order[b] < order[a]:
+                            b = idom[b]
+                    new_idom = a
+                if idom[node] != new_idom:
+                    idom[node] = new_idom
+                    changed = True
+        return idom, rpo
+
+
+def _dominator_pairs(graph, port_names, sources):
+    """Pary przerywane przez zawory jednosegmentowe - jedno drzewo dominatorów na port startowy."""
+    port_set = {graph.index[nazwa] for nazwa in port_names}
+    valve_of, names = graph.valve_of, graph.names
+    blocked = defaultdict(list)
+    for source_name in sources:
+        source = graph.index[source_name]
+        idom, rpo = graph.immediate_dominators(source)
+        # Zawory segmentów dominujących węzeł - w kolejności rpo dominator jest zawsze przed węzłem
+        dominating = {source: ()}
+        for node in rpo[1:]:
+            valves = dominating[idom[node]]
+            if valve_of[node] is not None:
+                valves = valves + (valve_of[node],)
+            dominating[node] = valves
+            if node in port_set:
+                for valve_name in valves:
+                    blocked[valve_name].append((source_name, names[node]))
+    return list(blocked.items())
+
+
+def _run_tasks(state, tasks, workers, pool):
+    """
+    Wykonuje zadania analizy - w puli procesów, gdy jest ich kilka i pula jest włączona.
+    Zadania wysyłane są w `workers` paczkach razem ze stanem analizy, więc stan
+    serializowany jest raz na paczkę, a nie raz na zadanie.
+    """
+    if pool is not None and workers > 1 and len(tasks) > 1:
+        batches = [(state, tasks[i::workers]) for i in range(min(workers, len(tasks)))]
+        try:
+            # Wysyłka i oczekiwanie na wyniki poza pętlą zdarzeń (pod eventletem w wątku systemowym)
+            return [result for batch in run_cpu_bound(pool.map, _run_batch, batches) for result in batch]
+        except Exception as e:
+            print(f"WARNING: Pula procesów analizy niedostępna ({e}), liczenie w bieżącym procesie.")
+
+    return run_cpu_bound(_run_batch, (state, tasks))
+
+
+def _run_batch(batch):
+    state, tasks = batch
+    return [_run_task(state, task) for task in tasks]
+
+
+def _run_task(state, task):
+    graph, adjacency, port_names, baseline = state
+    kind, payload = task
+    if kind == 'dominators':
+        return _dominator_pairs(graph, port_names, payload)
+    return [_blocked_pairs(adjacency, port_names, baseline, payload)]
+
+
+def _blocked_pairs(adjacency, port_names, baseline, task):
+    """Osiągalność bez krawędzi zaworu wielosegmentowego, porównana z bazową."""
+    valve_name, removed = task
+    removed = set(removed)
+    reduced = {
+        u: [v for v in nbrs if (u, v) not in removed]
+        for u, nbrs in adjacency.items()
+    }
+    rows = compute_reachability_rows(reduced, port_names)
+    pairs = []
+    for source in port_names:
+        lost = baseline[source] & ~rows.get(source, 0)
+        while lost:
+            lowest = lost & -lost
+            pairs.append((source, port_names[lowest.bit_length() - 1]))
+            lost ^= lowest
+    return valve_name, pairs
+
+
+# Etapy przepływu w zakładzie: (typ sprzętu źródłowego, typ sprzętu docelowego)
+RESILIENCE_STAGES = (
+    ('apollo', 'reaktor'),
+    ('reaktor', 'filtr'),
+    ('filtr', 'beczka_czysta'),
+)
+
+
+def resilience_report(edges, ports, stages=RESILIENCE_STAGES):
+    """
+    Minimalne przekroje między klasami sprzętu: dla każdego sprzętu docelowego etapu
+    najmniejszy zbiór segmentów, których utrata odcina go od wszystkich portów OUT
+    sprzętu źródłowego (maksymalny przepływ przy przepustowości 1 na segment).
+
+    `edges`: krawędzie widoku (start, koniec, segment, zawór),
+    `ports`: {nazwa_portu: {'typ': 'IN'/'OUT', 'sprzet': nazwa, 'typ_sprzetu': typ}}.
+    Zbiór zaworów przekroju to zawory jego segmentów (górne ograniczenie minimalnego
+    zbioru zaworów - zawór sterujący kilkoma segmentami może przeciąć więcej niż jeden).
+    """
+    graph = nx.DiGraph()
+    for u, v, segment_name, valve_name in edges:
+        graph.add_edge(u, v, capacity=1, segment_name=segment_name, valve_name=valve_name)
+
+    def equipment_ports(equipment_type, port_type):
+        grouped = defaultdict(list)
+        for nazwa, port in ports.items():
+            if (port.get('typ_sprzetu') or '').lower() == equipment_type and port['typ'] == port_type and nazwa in graph:
+                grouped[port['sprzet']].append(nazwa)
+        return grouped
+
+    # Sztuczne źródło i ujście - krawędzie bez 'capacity' mają w networkx przepustowość nieskończoną
+    super_source, super_sink = ('zrodlo',), ('ujscie',)
+    report = []
+    for source_type, target_type in stages:
+        sources = [nazwa for names in equipment_ports(source_type, 'OUT').values() for nazwa in names]
+        for equipment, targets in sorted(equipment_ports(target_type, 'IN').items()):
+            entry = {
+                'stage': f"{source_type} -> {target_type}",
+                'equipment': equipment,
+                'equipment_type': target_type,
+                'reachable': False,
+                'min_cut_size': 0,
+                'cut_segments': [],
+                'cut_valves': [],
+                'single_point_of_failure': False
+            }
+            report.append(entry)
+            if not sources:
+                continue
+
+            graph.add_edges_from((super_source, nazwa) for nazwa in sources)
+            graph.add_edges_from((nazwa, super_sink) for nazwa in targets)
+            try:
+                cut_value, (source_side, _) = nx.minimum_cut(graph, super_source, super_sink)
+            finally:
+                graph.remove_node(super_source)
+                graph.remove_node(super_sink)
+
+            if cut_value == float('inf'):
+                # Port źródłowy jest jednocześnie portem docelowym - nie da się go odciąć
+                entry['reachable'] = True
+                entry['min_cut_size'] = None
+                continue
+            if cut_value == 0:
+                continue
+
+            cut_edges = [
+                (u, v) for u in source_side if u in graph
+                for v in graph.successors(u) if v not in source_side
+            ]
+            entry['reachable'] = True
+            entry['min_cut_size'] = int(cut_value)
+            entry['cut_segments'] = sorted(graph[u][v]['segment_name'] for u, v in cut_edges)
+            entry['cut_valves'] = sorted({graph[u][v]['valve_name'] for u, v in cut_edges if graph[u][v]['valve_name']})
+            entry['single_point_of_failure'] = cut_value == 1
+    return report
+
+
+def topology_health(segments, junctions, ports, equipment, valve_names):
+    """
+    Przegląd stanu mapy rurociągu w jednym przejściu po segmentach (bez zapytań do bazy).
+
+    `segments`: {nazwa: {'start', 'end', 'valve_name', ...}} - wszystkie segmenty, także równoległe,
+    `junctions`: {nazwa_wezla: id}, `ports`: {nazwa_portu: {'typ', 'sprzet', ...}},
+    `equipment`: {nazwa_sprzetu: typ_sprzetu}, `valve_names`: nazwy wszystkich zaworów.
+    Spójność i osiągalność liczone są tak, jakby wszystkie zawory były otwarte.
+    """
+    graph = nx.DiGraph()
+    graph.add_nodes_from(ports)
+    graph.add_nodes_from(junctions)
+    connections = defaultdict(int)
+    used_valves = set()
+    segments_without_valves = []
+    segments_without_endpoints = []
+
+    for nazwa, segment in segments.items():
+        start, end, valve_name = segment['start'], segment['end'], segment['valve_name']
+        if valve_name:
+            used_valves.add(valve_name)
+        else:
+            segments_without_valves.append(nazwa)
+        if start:
+            connections[start] += 1
+        if end:
+            connections[end] += 1
+        if start and end:
+            graph.add_edge(start, end)
+        else:
+            segments_without_endpoints.append(nazwa)
+
+    junction_entry = lambda nazwa: {'id': junctions[nazwa], 'nazwa_wezla': nazwa, 'connections_count': connections[nazwa]}
+    isolated_nodes = [junction_entry(nazwa) for nazwa in sorted(junctions) if connections[nazwa] == 0]
+    dead_end_nodes = [junction_entry(nazwa) for nazwa in sorted(junctions) if connections[nazwa] == 1]
+
+    components = []
+    for members in nx.weakly_connected_components(graph):
+        if len(members) == 1 and next(iter(members)) in junctions and connections[next(iter(members))] == 0:
+            # Izolowane węzły raportowane osobno
+            continue
+        components.append({
+            'size': len(members),
+            'equipment': sorted({ports[nazwa]['sprzet'] for nazwa in members if nazwa in ports}),
+            'nodes': sorted(members)
+        })
+    components.sort(key=lambda c: (-c['size'], c['nodes'][0]))
+
+    cycles = sorted(
+        (sorted(members) for members in nx.strongly_connected_components(graph) if len(members) > 1),
+        key=lambda members: (-len(members), members[0])
+    )
+
+    # Osiągalność portów (bitsety) - sprzęt, do którego nic nie dopłynie lub z którego nic nie odpłynie
+    port_names = list(ports)
+    rows = compute_reachability_rows({u: list(graph.successors(u)) for u in graph}, port_names)
+    equipment_ports = defaultdict(lambda: {'IN': 0, 'OUT': 0})
+    for i, nazwa in enumerate(port_names):
+        equipment_ports[ports[nazwa]['sprzet']][ports[nazwa]['typ']] |= 1 << i
+
+    names = sorted(equipment_ports)
+    outflow = []
+    for nazwa in names:
+        bits, reach = equipment_ports[nazwa]['OUT'], 0
+        while bits:
+            lowest = bits & -bits
+            reach |= rows.get(port_names[lowest.bit_length() - 1], 0)
+            bits ^= lowest
+        outflow.append(reach)
+    # Sumy "wszystkie poza i-tym" z sum prefiksowych i sufiksowych - bez pętli po parach sprzętu
+    others_reach = _exclusive_or_sums(outflow)
+    others_in = _exclusive_or_sums([equipment_ports[nazwa]['IN'] for nazwa in names])
+
+    unreachable_equipment = []
+    for i, nazwa in enumerate(names):
+        own = equipment_ports[nazwa]
+        no_inflow = bool(own['IN']) and not (others_reach[i] & own['IN'])
+        no_outflow = bool(own['OUT']) and not (outflow[i] & others_in[i])
+        if no_inflow or no_outflow:
+            unreachable_equipment.append({
+                'equipment': nazwa,
+                'typ_sprzetu': equipment.get(nazwa),
+                'no_inflow': no_inflow,
+                'no_outflow': no_outflow
+            })
+
+    return {
+        'orphaned_valves': sorted(set(valve_names) - used_valves),
+        'segments_without_valves': sorted(segments_without_valves),
+        'segments_without_endpoints': sorted(segments_without_endpoints),
+        'isolated_nodes': isolated_nodes,
+        'dead_end_nodes': dead_end_nodes,
+        'equipment_without_ports': sorted(set(equipment) - set(equipment_ports)),
+        'components': components,
+        'unreachable_equipment': unreachable_equipment,
+        'cycles': cycles,
+        'counts': {
+            'nodes': graph.number_of_nodes(),
+            'junctions': len(junctions),
+            'ports': len(ports),
+            'segments': len(segments),
+            'valves': len(set(valve_names) | used_valves),
+            'equipment': len(equipment)
+        }
+    }
+
+
+def _exclusive_or_sums(values):
+    """Dla każdego i zwraca sumę bitową wszystkich wartości poza values[i]."""
+    suffix = [0] * (len(values) + 1)
+    for i in range(len(values) - 1, -1, -1):
+        suffix[i] = suffix[i + 1] | values[i]
+    result, prefix = [], 0
+    for i, value in enumerate(values):
+        result.append(prefix | suffix[i + 1])
+        prefix |= value
+    return result
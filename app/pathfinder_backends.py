@@ -0,0 +1,448 @@
+# app/pathfinder_backends.py
+"""
+Silniki grafowe PathFindera.
+
+Oba silniki mają ten sam interfejs i przechowują mapę rurociągu jako graf skierowany
+(węzły = porty i węzły rurociągu, krawędzie = segmenty z przypisanym zaworem):
+
+- NetworkXBackend - graf networkx (domyślny, wygodny do debugowania),
+- CSRBackend - tablice CSR indeksowane liczbami całkowitymi i maska otwartych zaworów;
+  zużywa znacznie mniej pamięci i przeszukuje graf bez narzutu słowników networkx.
+
+Filtr zaworów przekazywany do `view()`:
+- LIVE - bieżące stany zaworów (utrzymywane przez rebuild_live/update_live),
+- ALL - wszystkie krawędzie (jakby każdy zawór można było otworzyć),
+- frozenset nazw zaworów - tylko krawędzie z tymi zaworami.
+
+Widok można dodatkowo zawęzić metodą `exclude()` - pomija wskazane segmenty
+(np. zajęte przez aktywne operacje) bez względu na stan ich zaworów.
+"""
+
+from array import array
+from collections import defaultdict
+import networkx as nx
+
+LIVE = object()
+ALL = object()
+
+
+class NetworkXBackend:
+    name = 'networkx'
+
+    def __init__(self, nodes, edges):
+        """`edges`: słownik {(start, koniec): (nazwa_segmentu, nazwa_zaworu)}."""
+        self.graph = nx.DiGraph()
+        self.graph.add_nodes_from(nodes)
+        for (u, v), (segment_name, valve_name) in edges.items():
+            self.graph.add_edge(u, v, segment_name=segment_name, valve_name=valve_name)
+
+        # Indeks zawór -> krawędzie, potrzebny do przyrostowej aktualizacji grafu otwartych krawędzi
+        self._valve_edges = defaultdict(list)
+        for u, v, data in self.graph.edges(data=True):
+            self._valve_edges[data['valve_name']].append((u, v))
+        self.valve_names = frozenset(nazwa for nazwa in self._valve_edges if nazwa)
+
+        # Graf roboczy zawierający tylko krawędzie z otwartymi zaworami
+        self.open_graph = nx.DiGraph()
+
+    def has_node(self, node):
+        return node in self.graph
+
+    def rebuild_live(self, usable_valves):
+        """Buduje od zera graf zawierający tylko krawędzie z podanymi zaworami."""
+        open_graph = nx.DiGraph()
+        open_graph.add_nodes_from(self.graph.nodes())
+        open_graph.add_edges_from(
+            (u, v, data) for u, v, data in self.graph.edges(data=True)
+            if data['valve_name'] in usable_valves
+        )
+        self.open_graph = open_graph
+
+    def update_live(self, changed):
+        """Nanosi zmiany {nazwa_zaworu: czy_otwarty}, dotykając tylko krawędzi tych zaworów."""
+        for nazwa, is_open in changed.items():
+            for u, v in self._valve_edges.get(nazwa, ()):
+                if is_open:
+                    self.open_graph.add_edge(u, v, **self.graph[u][v])
+                elif self.open_graph.has_edge(u, v):
+                    self.open_graph.remove_edge(u, v)
+
+    def view(self, valve_filter):
+        if valve_filter is LIVE:
+            return self.open_graph
+        if valve_filter is ALL:
+            return self.graph
+        # Widok filtrujący krawędzie (bez kopiowania grafu)
+        return nx.subgraph_view(
+            self.graph,
+            filter_edge=lambda u, v: self.graph[u][v]['valve_name'] in valve_filter
+        )
+
+    def exclude(self, view, segment_names):
+        """Zwraca widok bez krawędzi podanych segmentów."""
+        if not segment_names:
+            return view
+        return nx.subgraph_view(
+            view,
+            filter_edge=lambda u, v: view[u][v]['segment_name'] not in segment_names
+        )
+
+    def _segments(self, path_nodes):
+        return [
+            self.graph[path_nodes[i]][path_nodes[i + 1]]['segment_name']
+            for i in range(len(path_nodes) - 1)
+        ]
+
+    def shortest_path(self, view, start_node, end_node):
+        try:
+            path_nodes = nx.shortest_path(view, source=start_node, target=end_node)
+        except (nx.NetworkXNoPath, nx.NodeNotFound) as e:
+            print(f"DEBUG: No path found - {type(e).__name__}: {e}")
+            return None
+        print(f"DEBUG: Found path nodes: {path_nodes}")
+        return self._segments(path_nodes)
+
+    def shortest_paths_from(self, view, start_node, end_nodes):
+        tree = nx.single_source_shortest_path(view, start_node)
+        return {
+            end_node: self._segments(tree[end_node]) if end_node in tree else None
+            for end_node in end_nodes
+        }
+
+    def adjacency(self, view):
+        return {u: list(nbrs) for u, nbrs in view.adj.items()}
+
+    def descendants(self, view, start_node):
+        return nx.descendants(view, start_node)
+
+    def edges(self, view):
+        """Krawędzie widoku: lista (start, koniec, segment, zawór)."""
+        return [(u, v, data['segment_name'], data['valve_name']) for u, v, data in view.edges(data=True)]
+
+    def out_edges(self, node):
+        """Krawędzie wychodzące z węzła pełnego grafu: (węzeł_docelowy, segment, zawór)."""
+        for target, data in self.graph[node].items():
+            yield target, data['segment_name'], data['valve_name']
+
+
+class CSRBackend:
+    name = 'csr'
+
+    def __init__(self, nodes, edges):
+        """`edges`: słownik {(start, koniec): (nazwa_segmentu, nazwa_zaworu)}."""
+        node_names = list(dict.fromkeys(nodes))
+        node_index = {nazwa: i for i, nazwa in enumerate(node_names)}
+        for u, v in edges:
+            for node in (u, v):
+                if node not in node_index:
+                    node_index[node] = len(node_names)
+                    node_names.append(node)
+
+        valve_list = sorted({valve for _, valve in edges.values() if valve})
+        valve_index = {nazwa: i for i, nazwa in enumerate(valve_list)}
+
+        # Sortowanie krawędzi po węźle źródłowym (counting sort) -> tablice CSR
+        node_count = len(node_names)
+        indptr = array('l', bytes(array('l').itemsize * (node_count + 1)))
+        for u, _ in edges:
+            indptr[node_index[u] + 1] += 1
+        for i in range(node_count):
+            indptr[i + 1] += indptr[i]
+
+        edge_count = len(edges)
+        fill = array('l', indptr[:-1])
+        sources = array('l', bytes(array('l').itemsize * edge_count))
+        targets = array('l', bytes(array('l').itemsize * edge_count))
+        edge_valve = array('l', bytes(array('l').itemsize * edge_count))
+        edge_segment = [None] * edge_count
+        for (u, v), (segment_name, valve_name) in edges.items():
+            ui = node_index[u]
+            e = fill[ui]
+            fill[ui] += 1
+            sources[e] = ui
+            targets[e] = node_index[v]
+            edge_valve[e] = valve_index.get(valve_name, -1)
+            edge_segment[e] = segment_name
+
+        # Krawędzie wchodzące (CSR po węźle docelowym) - do przeszukiwania dwukierunkowego
+        rev_indptr = array('l', bytes(array('l').itemsize * (node_count + 1)))
+        for e in range(edge_count):
+            rev_indptr[targets[e] + 1] += 1
+        for i in range(node_count):
+            rev_indptr[i + 1] += rev_indptr[i]
+        rev_fill = array('l', rev_indptr[:-1])
+        rev_edges = array('l', bytes(array('l').itemsize * edge_count))
+        for e in range(edge_count):
+            k = rev_fill[targets[e]]
+            rev_fill[targets[e]] += 1
+            rev_edges[k] = e
+
+        self.node_names = node_names
+        self.node_index = node_index
+        self.indptr = indptr
+        self.rev_indptr = rev_indptr
+        self.rev_edges = rev_edges
+        self.sources = sources
+        self.targets = targets
+        self.edge_valve = edge_valve
+        self.edge_segment = edge_segment
+        self.segment_edge = {segment_name: e for e, segment_name in enumerate(edge_segment)}
+        self.valve_index = valve_index
+        self._valve_list = valve_list
+        self.valve_names = frozenset(valve_list)
+        # Maska bieżących stanów zaworów: 1 = zawór otwarty
+        self.live_mask = bytearray(len(valve_list))
+
+    def has_node(self, node):
+        return node in self.node_index
+
+    def _mask_for(self, valves):
+        mask = bytearray(len(self.valve_index))
+        for nazwa in valves:
+            i = self.valve_index.get(nazwa)
+            if i is not None:
+                mask[i] = 1
+        return mask
+
+    def rebuild_live(self, usable_valves):
+        self.live_mask = self._mask_for(usable_valves)
+
+    def update_live(self, changed):
+        for nazwa, is_open in changed.items():
+            i = self.valve_index.get(nazwa)
+            if i is not None:
+                self.live_mask[i] = 1 if is_open else 0
+
+    def view(self, valve_filter):
+        """Zwraca maskę zaworów (None = wszystkie krawędzie)."""
+        if valve_filter is LIVE:
+            return self.live_mask
+        if valve_filter is ALL:
+            return None
+        return self._mask_for(valve_filter)
+
+    def exclude(self, view, segment_names):
+        """Zwraca widok (maska zaworów, zbiór wykluczonych krawędzi) bez podanych segmentów."""
+        mask, blocked = _split_view(view)
+        excluded = {self.segment_edge[nazwa] for nazwa in segment_names if nazwa in self.segment_edge}
+        if not excluded:
+            return view
+        return _ExcludedView(mask, blocked | excluded)
+
+    def _bfs(self, view, source):
+        """BFS po tablicach CSR. Zwraca tablicę krawędzi-rodziców (-1 = nieodwiedzony, -2 = źródło)."""
+        mask, blocked = _split_view(view)
+        indptr, targets, edge_valve = self.indptr, self.targets, self.edge_valve
+        parent_edge = array('l', [-1]) * len(self.node_names)
+        parent_edge[source] = -2
+        queue = [source]
+        head = 0
+        while head < len(queue):
+            u = queue[head]
+            head += 1
+            for e in range(indptr[u], indptr[u + 1]):
+                if mask is not None:
+                    valve = edge_valve[e]
+                    if valve < 0 or not mask[valve]:
+                        continue
+                if blocked and e in blocked:
+                    continue
+                t = targets[e]
+                if parent_edge[t] != -1:
+                    continue
+                parent_edge[t] = e
+                queue.append(t)
+        return parent_edge
+
+    def _segments_to(self, parent_edge, target):
+        if parent_edge[target] == -1:
+            return None
+        segments = []
+        e = parent_edge[target]
+        while e >= 0:
+            segments.append(self.edge_segment[e])
+            e = parent_edge[self.sources[e]]
+        segments.reverse()
+        return segments
+
+    def _bidirectional_bfs(self, view, source, target):
+        """
+        Dwukierunkowy BFS (jak nx.shortest_path): rozwija mniejszy z frontów,
+        więc odwiedza znacznie mniej węzłów niż BFS z jednego końca.
+        Zwraca listę krawędzi ścieżki lub None.
+        """
+        if source == target:
+            return []
+        mask, blocked = _split_view(view)
+        indptr, targets, sources, edge_valve = self.indptr, self.targets, self.sources, self.edge_valve
+        rev_indptr, rev_edges = self.rev_indptr, self.rev_edges
+        pred = {source: -1}
+        succ = {target: -1}
+        forward, backward = [source], [target]
+        meet = None
+        while forward and backward and meet is None:
+            next_level = []
+            if len(forward) <= len(backward):
+                for u in forward:
+                    for e in range(indptr[u], indptr[u + 1]):
+                        if mask is not None:
+                            valve = edge_valve[e]
+                            if valve < 0 or not mask[valve]:
+                                continue
+                        if blocked and e in blocked:
+                            continue
+                        w = targets[e]
+                        if w in pred:
+                            continue
+                        pred[w] = e
+                        if w in succ:
+                            meet = w
+                            break
+                        next_level.append(w)
+                    if meet is not None:
+                        break
+                forward = next_level
+            else:
+                for u in backward:
+                    for k in range(rev_indptr[u], rev_indptr[u + 1]):
+                        e = rev_edges[k]
+                        if mask is not None:
+                            valve = edge_valve[e]
+                            if valve < 0 or not mask[valve]:
+                                continue
+                        if blocked and e in blocked:
+                            continue
+                        w = sources[e]
+                        if w in succ:
+                            continue
+                        succ[w] = e
+                        if w in pred:
+                            meet = w
+                            break
+                        next_level.append(w)
+                    if meet is not None:
+                        break
+                backward = next_level
+
+        if meet is None:
+            return None
+        path = []
+        e = pred[meet]
+        while e >= 0:
+            path.append(e)
+            e = pred[sources[e]]
+        path.reverse()
+        e = succ[meet]
+        while e >= 0:
+            path.append(e)
+            e = succ[targets[e]]
+        return path
+
+    def shortest_path(self, view, start_node, end_node):
+        source = self.node_index.get(start_node)
+        target = self.node_index.get(end_node)
+        if source is None or target is None:
+            return None
+        path_edges = self._bidirectional_bfs(view, source, target)
+        if path_edges is None:
+            print(f"DEBUG: No path found - {start_node} -> {end_node}")
+            return None
+        return [self.edge_segment[e] for e in path_edges]
+
+    def shortest_paths_from(self, view, start_node, end_nodes):
+        source = self.node_index.get(start_node)
+        if source is None:
+            return {end_node: None for end_node in end_nodes}
+        parent_edge = self._bfs(view, source)
+        return {
+            end_node: self._segments_to(parent_edge, self.node_index[end_node]) if end_node in self.node_index else None
+            for end_node in end_nodes
+        }
+
+    def adjacency(self, view):
+        mask, blocked = _split_view(view)
+        indptr, targets, edge_valve, names = self.indptr, self.targets, self.edge_valve, self.node_names
+        adjacency = {}
+        for u, nazwa in enumerate(names):
+            adjacency[nazwa] = [
+                names[targets[e]] for e in range(indptr[u], indptr[u + 1])
+                if (mask is None or (edge_valve[e] >= 0 and mask[edge_valve[e]])) and e not in blocked
+            ]
+        return adjacency
+
+    def descendants(self, view, start_node):
+        source = self.node_index[start_node]
+        parent_edge = self._bfs(view, source)
+        return {self.node_names[i] for i, e in enumerate(parent_edge) if e >= 0}
+
+    def edges(self, view):
+        """Krawędzie widoku: lista (start, koniec, segment, zawór)."""
+        mask, blocked = _split_view(view)
+        names, valve_list = self.node_names, self._valve_list
+        result = []
+        for e in range(len(self.edge_segment)):
+            valve = self.edge_valve[e]
+            if mask is not None and (valve < 0 or not mask[valve]):
+                continue
+            if e in blocked:
+                continue
+            result.append((
+                names[self.sources[e]], names[self.targets[e]],
+                self.edge_segment[e], valve_list[valve] if valve >= 0 else None
+            ))
+        return result
+
+    def out_edges(self, node):
+        """Krawędzie wychodzące z węzła pełnego grafu: (węzeł_docelowy, segment, zawór)."""
+        valve_list = self._valve_list
+        u = self.node_index[node]
+        for e in range(self.indptr[u], self.indptr[u + 1]):
+            valve = self.edge_valve[e]
+            yield self.node_names[self.targets[e]], self.edge_segment[e], valve_list[valve] if valve >= 0 else None
+
+    # Widoki networkx tylko do debugowania/testów - budowane na żądanie
+
+    def _to_networkx(self, mask):
+        valve_list = self._valve_list
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.node_names)
+        for e in range(len(self.edge_segment)):
+            valve = self.edge_valve[e]
+            if mask is not None and (valve < 0 or not mask[valve]):
+                continue
+            graph.add_edge(
+                self.node_names[self.sources[e]],
+                self.node_names[self.targets[e]],
+                segment_name=self.edge_segment[e],
+                valve_name=valve_list[valve] if valve >= 0 else None
+            )
+        return graph
+
+    @property
+    def graph(self):
+        return self._to_networkx(None)
+
+    @property
+    def open_graph(self):
+        return self._to_networkx(self.live_mask)
+
+
+class _ExcludedView:
+    """Widok CSR: maska zaworów plus zbiór indeksów krawędzi wyłączonych z przeszukiwania."""
+    __slots__ = ('mask', 'blocked')
+
+    def __init__(self, mask, blocked):
+        self.mask = mask
+        self.blocked = frozenset(blocked)
+
+
+def _split_view(view):
+    if isinstance(view, _ExcludedView):
+        return view.mask, view.blocked
+    return view, frozenset()
+
+
+BACKENDS = {
+    NetworkXBackend.name: NetworkXBackend,
+    CSRBackend.name: CSRBackend,
+}
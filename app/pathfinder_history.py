@@ -0,0 +1,168 @@
+# app/pathfinder_history.py
+"""
+Zapis historii testów PathFindera (tabela `pathfinder_test_history`).
+
+Wyniki testów trafiają do kolejki w pamięci procesu, a wątek w tle (pod eventletem -
+green thread) zapisuje je wielowierszowymi INSERT-ami, więc zapytanie HTTP nie czeka
+na połączenie z bazą. Ten sam wątek co jakiś czas usuwa stare wpisy (retencja)
+w porcjach, aby pojedynczy DELETE nie blokował tabeli. Tabelę tworzy migracja.
+"""
+
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from .db import get_db_connection
+
+INSERT_COLUMNS = ('test_type', 'start_point', 'end_point', 'test_parameters', 'result', 'success', 'execution_time_ms')
+
+
+class TestHistoryWriter:
+    def __init__(self):
+        self.app = None
+        self.flush_seconds = 2
+        self.batch_size = 200
+        self.retention_days = 30
+        self.max_rows = 100000
+        self.prune_chunk = 1000
+        self.prune_every_seconds = 3600
+        self._queue = queue.Queue(maxsize=10000)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._last_prune = None
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'pruned': 0, 'failed_batches': 0}
+
+    def init_app(self, app):
+        """Wczytuje ustawienia z konfiguracji (wywoływane leniwie przy pierwszym zapisie)."""
+        self.app = app
+        self.flush_seconds = app.config.get('PATHFINDER_HISTORY_FLUSH_SECONDS', self.flush_seconds)
+        self.batch_size = app.config.get('PATHFINDER_HISTORY_BATCH_SIZE', self.batch_size)
+        self.retention_days = app.config.get('PATHFINDER_HISTORY_RETENTION_DAYS', self.retention_days)
+        self.max_rows = app.config.get('PATHFINDER_HISTORY_MAX_ROWS', self.max_rows)
+        self.prune_chunk = app.config.get('PATHFINDER_HISTORY_PRUNE_CHUNK', self.prune_chunk)
+
+    def enqueue(self, app, test_type, start_point, end_point, test_parameters, result, success, execution_time_ms):
+        """Dodaje wynik testu do kolejki zapisu. Zwraca False, gdy kolejka jest pełna."""
+        if self.app is None:
+            self.init_app(app)
+        row = (
+            test_type, start_point, end_point, json.dumps(test_parameters, default=str),
+            json.dumps(result, default=str), success, execution_time_ms
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Baza nie nadąża (lub jest niedostępna) - historia testów nie może blokować testów
+            self.stats['dropped'] += 1
+            print("WARNING: Kolejka historii testów PathFinder jest pełna, wynik testu pominięty.")
+            return False
+        self.stats['queued'] += 1
+        self._ensure_thread()
+        return True
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='pathfinder-history', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                # Czekamy na pierwszy wpis, potem chwilę zbieramy kolejne do jednej porcji
+                row = self._queue.get(timeout=self.prune_every_seconds)
+                time.sleep(self.flush_seconds)
+                self.flush(first_row=row)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                print(f"ERROR: Błąd zapisu historii testów PathFinder: {e}")
+            try:
+                if self._last_prune is None or time.monotonic() - self._last_prune >= self.prune_every_seconds:
+                    self._last_prune = time.monotonic()
+                    self.prune()
+            except Exception as e:
+                print(f"ERROR: Błąd czyszczenia historii testów PathFinder: {e}")
+
+    def flush(self, first_row=None):
+        """Zapisuje wszystkie oczekujące wyniki (porcjami po `batch_size` wierszy). Zwraca liczbę zapisanych."""
+        with self._flush_lock:
+            rows = [first_row] if first_row is not None else []
+            while True:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not rows or self.app is None:
+                return 0
+
+            written = 0
+            conn = get_db_connection(self.app)
+            cursor = conn.cursor()
+            try:
+                for i in range(0, len(rows), self.batch_size):
+                    batch = rows[i:i + self.batch_size]
+                    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(batch))
+                    try:
+                        cursor.execute(
+                            f"INSERT INTO pathfinder_test_history ({', '.join(INSERT_COLUMNS)}) VALUES {placeholders}",
+                            [value for row in batch for value in row]
+                        )
+                        conn.commit()
+                        written += len(batch)
+                    except Exception as e:
+                        conn.rollback()
+                        self.stats['failed_batches'] += 1
+                        print(f"ERROR: Nie udało się zapisać {len(batch)} wyników testów PathFinder: {e}")
+            finally:
+                cursor.close()
+                conn.close()
+            self.stats['written'] += written
+            return written
+
+    def prune(self):
+        """
+        Usuwa wpisy starsze niż `retention_days` oraz nadmiarowe ponad `max_rows` najnowszych,
+        porcjami po `prune_chunk` wierszy (każda porcja w osobnej transakcji). Zwraca liczbę usuniętych.
+        """
+        if self.app is None:
+            return 0
+
+        deleted = 0
+        conn = get_db_connection(self.app)
+        cursor = conn.cursor()
+        try:
+            conditions = []
+            if self.retention_days:
+                cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=self.retention_days)
+                conditions.append(("created_at < %s", cutoff))
+            if self.max_rows:
+                cursor.execute(
+                    "SELECT id FROM pathfinder_test_history ORDER BY id DESC LIMIT 1 OFFSET %s", (self.max_rows,)
+                )
+                row = cursor.fetchone()
+                if row:
+                    conditions.append(("id <= %s", row[0]))
+
+            for condition, value in conditions:
+                while True:
+                    cursor.execute(
+                        f"DELETE FROM pathfinder_test_history WHERE {condition} ORDER BY id LIMIT %s",
+                        (value, self.prune_chunk)
+                    )
+                    count = cursor.rowcount
+                    conn.commit()
+                    deleted += count
+                    if count < self.prune_chunk:
+                        break
+        finally:
+            cursor.close()
+            conn.close()
+
+        if deleted:
+            self.stats['pruned'] += deleted
+            print(f"INFO: Usunięto {deleted} starych wpisów historii testów PathFinder.")
+        return deleted
@@ -1,14 +1,96 @@
 # app/pathfinder_service.py
+import atexit
+import heapq
+import threading
+import uuid
+from collections import defaultdict, deque, OrderedDict
+from flask import current_app
 from .extensions import db
 import networkx as nx
 #from .db import get_db_connection  # Importujemy funkcję do połączenia z bazą danych
 #import mysql.connector # Added for mysql.connector.Error
 from .models import *
+from sqlalchemy.orm import joinedload
+from datetime import datetime, timezone
+from .pathfinder_backends import BACKENDS, LIVE, ALL
+from .pathfinder_analysis import (
+    compute_reachability_rows, analyze_critical_valves, create_analysis_pool, resilience_report, topology_health,
+    RESILIENCE_STAGES, run_cpu_bound
+)
+from . import topology_snapshots
+
+# Znacznik braku wpisu w cache tras (None jest poprawnym wynikiem - "brak ścieżki")
+_CACHE_MISS = object()
 
 
 class PathFinder:
     def __init__(self, app=None):
-        self.graph = nx.DiGraph()
+        # Silnik grafowy (networkx lub CSR, patrz pathfinder_backends). Trzyma pełny graf
+        # i widok tylko otwartych krawędzi - aktualizowany przyrostowo przy zmianie stanu
+        # zaworu, a nie przy każdym zapytaniu.
+        self.backend_name = 'networkx'
+        self.backend = BACKENDS[self.backend_name]((), {})
+        self.valve_states = {}
+        self.valve_state_version = 0
+        self._open_valves = set()
+        # Indeksy segmentów: nazwa segmentu -> {id, start, end, valve_name}
+        self.segments = {}
+        # Węzły rurociągu: nazwa -> id; cały sprzęt: nazwa -> typ_sprzetu
+        self.junctions = {}
+        self.equipment = {}
+        self._all_valves = frozenset()
+        # Segmenty zajęte przez aktywne operacje: nazwa segmentu -> ID operacji.
+        # Wczytywane z log_uzyte_segmenty przy ładowaniu topologii, aktualizowane przy
+        # rozpoczęciu/zakończeniu/anulowaniu operacji.
+        self.occupied_segments = {}
+        self.occupancy_version = 0
+        # Dziennik zmian stanów zaworów i zajętości segmentów (do eksportu przyrostowego):
+        # (numer zmiany, 'valve'/'segment', nazwa, nowa wartość). Czyszczony przy przeładowaniu topologii.
+        self.change_seq = 0
+        self.change_log_size = 1000
+        self._changes = deque(maxlen=self.change_log_size)
+        # Identyfikator instancji w tokenach eksportu - liczniki wersji są lokalne dla procesu
+        self._instance_id = uuid.uuid4().hex[:8]
+        self._export_static = None
+        # Cache odcinków tras LRU: (start, cel, wersja topologii, stan zaworów) -> segmenty
+        self.topology_version = 0
+        # Znacznik wersji z tabeli topologia_wersja, z którego pochodzi bieżący graf
+        self.db_topology_version = 0
+        # Migawka struktury mapy i jej skrót (patrz topology_snapshots). Wyniki zależne tylko
+        # od struktury (osiągalność 'all', krytyczne zawory 'all', odporność) są ważne dla skrótu,
+        # więc przeładowanie bez zmian w strukturze ich nie unieważnia.
+        self.snapshot = None
+        self.topology_hash = None
+        self.snapshots_enabled = True
+        self._reload_lock = threading.Lock()
+        self.route_cache_size = 512
+        self._route_cache = OrderedDict()
+        self.cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        # Porty sprzętu: nazwa portu -> {typ, sprzet, typ_sprzetu}; sprzęt -> lista jego portów
+        self.ports = {}
+        self._equipment_ports = defaultdict(list)
+        # Macierz osiągalności port -> port (bitsety w intach), osobno dla stanu bieżącego ('live')
+        # i dla wszystkich zaworów otwartych ('all'). Przebudowywana w tle po zmianie wersji.
+        self.reachability_background = True
+        self._reachability = {}
+        self._reach_lock = threading.Lock()
+        self._reach_dirty = False
+        self._reach_thread = None
+        # Analiza krytycznych zaworów, osobno 'live' i 'all' - ważna dla wersji jak macierz osiągalności.
+        # W tle odświeżana jest tylko 'all' (zależy od struktury), 'live' liczona jest na żądanie.
+        self.analysis_workers = 0
+        self._analysis_pool = None
+        self._critical_valves = {}
+        self._critical_lock = threading.Lock()
+        # Raport odporności (minimalne przekroje między klasami sprzętu) - liczony wyłącznie
+        # w tle, raz na wersję topologii; zapytania dostają gotowy wynik albo informację o liczeniu
+        self.resilience_enabled = True
+        self._resilience = None
+        self._resilience_lock = threading.Lock()
+        self._resilience_dirty = False
+        self._resilience_thread = None
+        # Przegląd stanu topologii (patrz topology_health) - ważny dla wersji topologii
+        self._health = None
         if app is not None:
             self.init_app(app)
 
@@ -19,124 +101,840 @@ class PathFinder:
         sys.stdout.flush()
         # Przechowujemy referencję do aplikacji, aby mieć dostęp do konfiguracji
         self.app = app
+        self.route_cache_size = app.config.get('PATHFINDER_ROUTE_CACHE_SIZE', self.route_cache_size)
+        self.reachability_background = app.config.get('PATHFINDER_REACHABILITY_BACKGROUND', True)
+        self.analysis_workers = app.config.get('PATHFINDER_ANALYSIS_WORKERS', self.analysis_workers)
+        self.change_log_size = app.config.get('PATHFINDER_CHANGE_LOG_SIZE', self.change_log_size)
+        self._changes = deque(maxlen=self.change_log_size)
+        self.resilience_enabled = app.config.get('PATHFINDER_RESILIENCE', self.resilience_enabled)
+        self.snapshots_enabled = app.config.get('PATHFINDER_SNAPSHOTS', self.snapshots_enabled)
+        self.backend_name = app.config.get('PATHFINDER_BACKEND', self.backend_name)
+        if self.backend_name not in BACKENDS:
+            raise ValueError(f"Nieznany silnik PathFindera: {self.backend_name} (dostępne: {', '.join(BACKENDS)})")
         # Wczytujemy topologię używając kontekstu aplikacji
         with app.app_context():
             self._load_topology()
 
+    def reload_topology(self):
+        """Przeładowuje topologię z bazy (np. po edycji zaworów, węzłów lub segmentów)."""
+        with self._reload_lock, self.app.app_context():
+            self._load_topology()
+
+    def reload_if_stale(self, db_topology_version=None):
+        """
+        Przeładowuje topologię, jeśli znacznik wersji w bazie jest nowszy niż wczytany graf.
+        Zwraca True, jeśli nastąpiło przeładowanie.
+        """
+        if db_topology_version is None:
+            with self.app.app_context():
+                db_topology_version = self.read_topology_stamp()
+        if db_topology_version <= self.db_topology_version:
+            return False
+
+        print(f"INFO: Wykryto nową wersję topologii ({self.db_topology_version} -> {db_topology_version}), przeładowanie grafu.")
+        self.reload_topology()
+        return True
+
     # def _get_db_connection(self):
     #     """Prywatna metoda do łączenia się z bazą, używająca konfiguracji z aplikacji."""
     #     return get_db_connection()
 
     def _load_topology(self):
-        """Wczytuje mapę instalacji z bazy danych przy użyciu SQLAlchemy ORM."""
+        """
+        Wczytuje mapę instalacji z bazy danych przy użyciu SQLAlchemy ORM.
+        Nowy graf budowany jest obok bieżącego i podmieniany na końcu, więc zapytania
+        obsługiwane w trakcie przeładowania widzą kompletny stary albo nowy graf.
+        Odczyt z bazy odbywa się w wątku wywołującym, budowa grafu (_build_topology)
+        przez run_cpu_bound - pod eventletem w wątku systemowym, poza pętlą zdarzeń.
+        """
         print("INFO: Rozpoczynanie ładowania topologii (wersja ORM)...")
-        
-        # Czyszczenie grafu przed ponownym załadowaniem
-        self.graph.clear()
 
-        # Pobieranie portów
-        porty_q = db.select(PortySprzetu.nazwa_portu)
-        porty = db.session.execute(porty_q).scalars().all()
-        for nazwa_portu in porty:
-            self.graph.add_node(nazwa_portu)
+        db_topology_version = self.read_topology_stamp()
+        nodes = []
+
+        # Pobieranie portów (razem z nazwą i typem sprzętu - potrzebne do macierzy osiągalności i analizy odporności)
+        porty_q = db.select(
+            PortySprzetu.nazwa_portu, PortySprzetu.typ_portu, Sprzet.nazwa_unikalna, Sprzet.typ_sprzetu
+        ).join(
+            Sprzet, PortySprzetu.id_sprzetu == Sprzet.id
+        )
+        ports = {}
+        equipment_ports = defaultdict(list)
+        for nazwa_portu, typ_portu, nazwa_sprzetu, typ_sprzetu in db.session.execute(porty_q).all():
+            nodes.append(nazwa_portu)
+            ports[nazwa_portu] = {'typ': typ_portu, 'sprzet': nazwa_sprzetu, 'typ_sprzetu': typ_sprzetu}
+            equipment_ports[nazwa_sprzetu].append(nazwa_portu)
+
+        # Cały sprzęt (także bez portów) - do przeglądu stanu topologii
+        equipment = {nazwa: typ for nazwa, typ in db.session.execute(db.select(Sprzet.nazwa_unikalna, Sprzet.typ_sprzetu)).all()}
 
         # Pobieranie węzłów
-        wezly_q = db.select(WezlyRurociagu.nazwa_wezla)
-        wezly = db.session.execute(wezly_q).scalars().all()
-        for nazwa_wezla in wezly:
-            self.graph.add_node(nazwa_wezla)
-
-        # Pobieranie segmentów z relacjami
-        segmenty_q = db.select(Segmenty)
-        segmenty = db.session.execute(segmenty_q).scalars().all()
+        wezly_q = db.select(WezlyRurociagu.nazwa_wezla, WezlyRurociagu.id)
+        junctions = {nazwa: id_wezla for nazwa, id_wezla in db.session.execute(wezly_q).all()}
+        nodes.extend(junctions)
+
+        # Pobieranie segmentów z relacjami (jednym zapytaniem, bez doładowywania relacji per segment)
+        segmenty_q = db.select(Segmenty).options(
+            joinedload(Segmenty.porty_sprzetu),
+            joinedload(Segmenty.porty_sprzetu_),
+            joinedload(Segmenty.wezly_rurociagu),
+            joinedload(Segmenty.wezly_rurociagu_),
+            joinedload(Segmenty.zawory)
+        )
+        segmenty = db.session.execute(segmenty_q).scalars().unique().all()
         
+        segments = {}
+        # Krawędzie grafu: (start, koniec) -> (segment, zawór); równoległy segment nadpisuje poprzedni
+        edges = {}
         for segment in segmenty:
             punkt_startowy = segment.porty_sprzetu_.nazwa_portu if segment.porty_sprzetu_ else (segment.wezly_rurociagu_.nazwa_wezla if segment.wezly_rurociagu_ else None)
             punkt_koncowy = segment.porty_sprzetu.nazwa_portu if segment.porty_sprzetu else (segment.wezly_rurociagu.nazwa_wezla if segment.wezly_rurociagu else None)
+            nazwa_zaworu = segment.zawory.nazwa_zaworu if segment.zawory else None
+
+            segments[segment.nazwa_segmentu] = {
+                'id': segment.id,
+                'start': punkt_startowy,
+                'end': punkt_koncowy,
+                'valve_name': nazwa_zaworu
+            }
             
             if punkt_startowy and punkt_koncowy:
-                self.graph.add_edge(
-                    punkt_startowy, 
-                    punkt_koncowy, 
-                    segment_name=segment.nazwa_segmentu,
-                    valve_name=segment.zawory.nazwa_zaworu
-                )
+                edges[(punkt_startowy, punkt_koncowy)] = (segment.nazwa_segmentu, nazwa_zaworu)
+
+        valve_states = self._read_valve_states()
+        occupied_segments = self._read_occupied_segments()
+        backend, snapshot, topology_hash, open_valves = run_cpu_bound(
+            _build_topology, self.backend_name, nodes, edges, ports, junctions, segments, valve_states
+        )
+        structure_changed = topology_hash != self.topology_hash
+
+        # Podmiana całego stanu naraz; wpisy cache dla poprzedniej wersji topologii są już bezużyteczne
+        self.backend = backend
+        self.ports = ports
+        self._equipment_ports = equipment_ports
+        self.segments = segments
+        self.junctions = junctions
+        self.equipment = equipment
+        self._all_valves = backend.valve_names
+        self.valve_states = valve_states
+        self._open_valves = open_valves
+        self.occupied_segments = occupied_segments
+        self.valve_state_version += 1
+        self.occupancy_version += 1
+        self.topology_version += 1
+        # Nowa topologia - klienci eksportu przyrostowego muszą pobrać pełny eksport
+        self._changes.clear()
+        self.change_seq += 1
+        self.db_topology_version = db_topology_version
+        self.snapshot = snapshot
+        self.topology_hash = topology_hash
+        self.clear_route_cache()
+        self._schedule_reachability_rebuild()
+        if self.resilience_enabled and structure_changed:
+            self._schedule_resilience_rebuild()
+        if self.snapshots_enabled:
+            self._store_snapshot(snapshot, topology_hash, db_topology_version)
         
-        print("INFO: Topologia instalacji załadowana (ORM), graf zbudowany.")
+        print(f"INFO: Topologia instalacji załadowana (ORM), graf zbudowany (silnik: {self.backend_name}, wersja w bazie: {db_topology_version}, migawka: {topology_hash[:12]}).")
+
+    def _store_snapshot(self, snapshot, topology_hash, db_topology_version):
+        try:
+            if topology_snapshots.store_snapshot(snapshot, topology_hash, db_topology_version):
+                print(f"INFO: Zapisano nową migawkę topologii {topology_hash[:12]}.")
+        except Exception as e:
+            # Np. baza bez migracji z tabelą topologia_snapshoty - graf działa bez historii migawek
+            db.session.rollback()
+            print(f"WARNING: Nie można zapisać migawki topologii: {e}")
+
+    def read_topology_stamp(self):
+        """Zwraca znacznik wersji topologii zapisany w bazie (0, jeśli go brak)."""
+        try:
+            wersja = db.session.execute(
+                db.select(TopologiaWersja.wersja).where(TopologiaWersja.id == 1)
+            ).scalar()
+            return wersja or 0
+        except Exception as e:
+            # Np. baza bez migracji z tabelą topologia_wersja
+            db.session.rollback()
+            print(f"WARNING: Nie można odczytać wersji topologii: {e}")
+            return 0
+
+    def _read_valve_states(self):
+        try:
+            rows = db.session.execute(db.select(Zawory.nazwa_zaworu, Zawory.stan)).all()
+        except Exception as e:
+            print(f"Błąd podczas pobierania stanów zaworów (ORM): {e}")
+            rows = []
+        return {nazwa: stan for nazwa, stan in rows}
+
+    def _read_occupied_segments(self):
+        try:
+            rows = db.session.execute(
+                db.select(Segmenty.nazwa_segmentu, OperacjeLog.id)
+                .join(t_log_uzyte_segmenty, t_log_uzyte_segmenty.c.id_segmentu == Segmenty.id)
+                .join(OperacjeLog, t_log_uzyte_segmenty.c.id_operacji_log == OperacjeLog.id)
+                .where(OperacjeLog.status_operacji == 'aktywna')
+            ).all()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Błąd podczas pobierania zajętych segmentów (ORM): {e}")
+            rows = []
+        return {nazwa: id_operacji for nazwa, id_operacji in rows}
+
+    # ================== ZAJĘTOŚĆ SEGMENTÓW ==================
+
+    def occupy_segments(self, operation_id, segment_names):
+        """Oznacza segmenty jako zajęte przez operację. Wywoływać po zatwierdzeniu wpisów w log_uzyte_segmenty."""
+        for nazwa in segment_names:
+            self.occupied_segments[nazwa] = operation_id
+            self._record_change('segment', nazwa, operation_id)
+        self.occupancy_version += 1
+
+    def release_operation(self, operation_id):
+        """Zwalnia wszystkie segmenty zajęte przez operację (po jej zakończeniu lub anulowaniu)."""
+        released = [nazwa for nazwa, op_id in self.occupied_segments.items() if op_id == operation_id]
+        for nazwa in released:
+            del self.occupied_segments[nazwa]
+            self._record_change('segment', nazwa, None)
+        if released:
+            self.occupancy_version += 1
+        return released
+
+    def refresh_occupancy(self):
+        """Wczytuje ponownie z bazy segmenty zajęte przez aktywne operacje."""
+        occupied_segments = self._read_occupied_segments()
+        if occupied_segments != self.occupied_segments:
+            previous = self.occupied_segments
+            self.occupied_segments = occupied_segments
+            for nazwa in previous.keys() | occupied_segments.keys():
+                if previous.get(nazwa) != occupied_segments.get(nazwa):
+                    self._record_change('segment', nazwa, occupied_segments.get(nazwa))
+            self.occupancy_version += 1
+
+    def occupied_in(self, segment_names):
+        """Zwraca listę podanych segmentów, które są zajęte przez aktywne operacje."""
+        return [nazwa for nazwa in segment_names if nazwa in self.occupied_segments]
+
+    def refresh_valve_states(self):
+        """Wczytuje stany wszystkich zaworów z bazy i odbudowuje graf otwartych krawędzi."""
+        new_states = self._read_valve_states()
+        if new_states.keys() == self.valve_states.keys():
+            # Ten sam zbiór zaworów - nanosimy tylko różnice
+            self.set_valve_states(new_states)
+            return
+
+        for nazwa, stan in new_states.items():
+            if self.valve_states.get(nazwa) != stan:
+                self._record_change('valve', nazwa, stan)
+        self.valve_states = new_states
+        self.valve_state_version += 1
+        self._rebuild_open_graph()
+        self._schedule_reachability_rebuild()
+
+    def set_valve_states(self, valve_states):
+        """
+        Nanosi zmiany stanów zaworów (nazwa -> 'OTWARTY'/'ZAMKNIETY') na graf
+        otwartych krawędzi. Dotyka wyłącznie krawędzi zmienionych zaworów.
+        Wywoływane po zatwierdzeniu zmian w tabeli `zawory`.
+        """
+        changed = {
+            nazwa: stan for nazwa, stan in valve_states.items()
+            if nazwa in self.valve_states and self.valve_states[nazwa] != stan
+        }
+        if not changed:
+            return
+
+        self.valve_states.update(changed)
+        self.valve_state_version += 1
+        for nazwa, stan in changed.items():
+            self._record_change('valve', nazwa, stan)
+
+        was_fallback = not self._open_valves
+        for nazwa, stan in changed.items():
+            if stan == 'OTWARTY':
+                self._open_valves.add(nazwa)
+            else:
+                self._open_valves.discard(nazwa)
+
+        # Przejście do/z trybu awaryjnego (brak otwartych zaworów) wymaga pełnej odbudowy
+        if was_fallback or not self._open_valves:
+            self._rebuild_open_graph()
+        else:
+            self.backend.update_live({nazwa: stan == 'OTWARTY' for nazwa, stan in changed.items()})
+
+        self._schedule_reachability_rebuild()
+
+    def with_valve_overrides(self, overrides):
+        """
+        Zwraca scenariusz "co jeśli" ze stanami zaworów nadpisanymi w pamięci
+        ({nazwa: 'OTWARTY'/'ZAMKNIETY'}). Scenariusz nie zmienia tabeli `zawory`
+        ani grafu otwartych krawędzi, więc może działać równolegle z operacjami.
+        """
+        return ValveOverlay(self, overrides)
+
+    def _rebuild_open_graph(self):
+        """Buduje od zera widok zawierający tylko krawędzie z otwartymi zaworami."""
+        self._open_valves = _rebuild_live(self.backend, self.valve_states)
+
+    @property
+    def graph(self):
+        """Pełny graf networkx (przy silniku CSR budowany na żądanie - tylko do debugowania)."""
+        return self.backend.graph
+
+    @property
+    def open_graph(self):
+        """Graf networkx tylko otwartych krawędzi (przy silniku CSR budowany na żądanie)."""
+        return self.backend.open_graph
+
+    # ================== EKSPORT TOPOLOGII ==================
+
+    def _record_change(self, kind, name, value):
+        self.change_seq += 1
+        self._changes.append((self.change_seq, kind, name, value))
+
+    def export_token(self):
+        """Token wersji eksportu: instancja, wersja topologii i numer ostatniej zmiany stanu (także jako ETag)."""
+        return f"{self._instance_id}-{self.topology_version}-{self.change_seq}"
+
+    def export_topology(self):
+        """
+        Zwraca pełny eksport mapy do wizualizacji: segmenty i porty (budowane raz na wersję
+        topologii) oraz bieżące stany zaworów i zajętość segmentów, razem z tokenem wersji.
+        """
+        # Token przed odczytem stanów - zmiana w trakcie zostanie powtórzona w kolejnej delcie
+        token = self.export_token()
+        static = self._export_static
+        if static is None or static['topology_version'] != self.topology_version:
+            static = {
+                'topology_version': self.topology_version,
+                'db_topology_version': self.db_topology_version,
+                'topology_hash': self.topology_hash,
+                'segment_fields': ['nazwa_segmentu', 'punkt_startowy', 'punkt_koncowy', 'nazwa_zaworu'],
+                'segments': [
+                    [nazwa, segment['start'], segment['end'], segment['valve_name']]
+                    for nazwa, segment in sorted(self.segments.items())
+                ],
+                'ports': {nazwa: [port['typ'], port['sprzet']] for nazwa, port in self.ports.items()},
+                'junctions': sorted(self.junctions)
+            }
+            self._export_static = static
+        return dict(
+            static, token=token, delta=False,
+            valves=dict(self.valve_states), occupied=dict(self.occupied_segments)
+        )
+
+    def export_changes(self, since_token):
+        """
+        Zwraca zmiany stanów zaworów i zajętości segmentów od tokenu `since_token`:
+        {'token', 'delta': True, 'valves': {zawór: stan}, 'occupied': {segment: id_operacji}, 'released': [...]}.
+        Zwraca None, gdy delta nie jest możliwa (inna instancja lub wersja topologii, zmiany
+        usunięte już z dziennika) - klient musi wtedy pobrać pełny eksport.
+        """
+        try:
+            instance_id, topology_version, seq = since_token.rsplit('-', 2)
+            topology_version, seq = int(topology_version), int(seq)
+        except (AttributeError, ValueError):
+            return None
+
+        token = self.export_token()
+        changes = list(self._changes)
+        if instance_id != self._instance_id or topology_version != self.topology_version or seq > self.change_seq:
+            return None
+        # Dziennik obcięty - brakuje zmian między tokenem a najstarszym wpisem
+        if changes and changes[0][0] > seq + 1:
+            return None
+        if not changes and seq != self.change_seq:
+            return None
+
+        valves, occupied, released = {}, {}, set()
+        for change_seq, kind, name, value in changes:
+            if change_seq <= seq:
+                continue
+            if kind == 'valve':
+                valves[name] = value
+            elif value is None:
+                occupied.pop(name, None)
+                released.add(name)
+            else:
+                occupied[name] = value
+                released.discard(name)
+        return {
+            'token': token,
+            'delta': True,
+            'topology_version': self.topology_version,
+            'valves': valves,
+            'occupied': occupied,
+            'released': sorted(released)
+        }
+
+    # ================== MACIERZ OSIĄGALNOŚCI ==================
+
+    def _reachability_version(self, kind):
+        """Wersja grafu, z której musi pochodzić macierz danego rodzaju, aby była aktualna."""
+        if kind == 'all':
+            return (self.topology_hash,)
+        return (self.topology_hash, self.valve_state_version)
+
+    def _schedule_reachability_rebuild(self):
+        """Zleca przebudowę macierzy osiągalności w tle (kolejne zlecenia w trakcie budowy są łączone)."""
+        if not self.reachability_background:
+            self.rebuild_reachability()
+            return
+
+        with self._reach_lock:
+            self._reach_dirty = True
+            if self._reach_thread is not None:
+                return
+            self._reach_thread = threading.Thread(
+                target=self._reachability_worker, name='pathfinder-reachability', daemon=True
+            )
+            self._reach_thread.start()
+
+    def _reachability_worker(self):
+        while True:
+            with self._reach_lock:
+                if not self._reach_dirty:
+                    self._reach_thread = None
+                    return
+                self._reach_dirty = False
+            try:
+                self.rebuild_reachability()
+            except Exception as e:
+                print(f"ERROR: Nie udało się przebudować macierzy osiągalności: {e}")
+            try:
+                # Przeliczamy tylko analizę 'all', i tylko jeśli ktoś już o nią pytał - zmienia się
+                # wyłącznie ze strukturą mapy. Analiza 'live' zależy od każdej zmiany zaworu,
+                # więc liczona jest na żądanie (critical_valves), a nie po każdej zmianie.
+                if 'all' in self._critical_valves:
+                    self.critical_valves(use_valve_states=False)
+            except Exception as e:
+                print(f"ERROR: Nie udało się przeliczyć krytycznych zaworów: {e}")
+
+    def rebuild_reachability(self):
+        """Buduje macierz osiągalności port -> port dla grafu bieżącego i grafu wszystkich zaworów."""
+        for kind in ('live', 'all'):
+            # Macierz 'all' zależy tylko od struktury - zmiana stanów zaworów jej nie unieważnia
+            entry = self._reachability.get(kind)
+            if entry is not None and entry['version'] == self._reachability_version(kind):
+                continue
+            # Migawka grafu - graf może być w tym czasie modyfikowany przez set_valve_states
+            for _ in range(3):
+                version = self._reachability_version(kind)
+                backend = self.backend
+                port_names = list(self.ports)
+                try:
+                    adjacency = backend.adjacency(backend.view(LIVE if kind == 'live' else ALL))
+                    break
+                except RuntimeError:
+                    continue
+            else:
+                print(f"WARNING: Nie udało się wykonać migawki grafu ({kind}), macierz nie została przebudowana.")
+                continue
+
+            # Pod eventletem liczone w wątku systemowym; podmiana wyniku już w wątku wywołującym
+            rows = run_cpu_bound(compute_reachability_rows, adjacency, port_names)
+            self._reachability[kind] = {'version': version, 'ports': port_names, 'rows': rows}
+
+    def reachable_ports(self, source_port, use_valve_states=True):
+        """
+        Zwraca zbiór portów osiągalnych z `source_port`. Przy `use_valve_states=False`
+        osiągalność liczona jest tak, jakby wszystkie zawory można było otworzyć.
+        """
+        kind = 'live' if use_valve_states else 'all'
+        entry = self._reachability.get(kind)
+        if entry is not None and entry['version'] == self._reachability_version(kind):
+            row = entry['rows'].get(source_port, 0)
+            ports = entry['ports']
+            reachable = set()
+            while row:
+                lowest = row & -row
+                reachable.add(ports[lowest.bit_length() - 1])
+                row ^= lowest
+            reachable.discard(source_port)
+            return reachable
+
+        # Macierz jeszcze się przebudowuje - jedno przeszukanie grafu zamiast czekania
+        self._schedule_reachability_rebuild()
+        backend = self.backend
+        if not backend.has_node(source_port):
+            return set()
+        descendants = backend.descendants(backend.view(LIVE if use_valve_states else ALL), source_port)
+        return {node for node in descendants if node in self.ports}
+
+    def reachable_equipment(self, equipment_name, use_valve_states=True):
+        """Zwraca zbiór nazw sprzętu, do którego portów IN można dotrzeć z portów OUT danego sprzętu."""
+        reachable = set()
+        for port in self._equipment_ports.get(equipment_name, ()):
+            if self.ports[port]['typ'] == 'OUT':
+                reachable |= self.reachable_ports(port, use_valve_states)
+        return {
+            self.ports[port]['sprzet'] for port in reachable
+            if self.ports[port]['typ'] == 'IN' and self.ports[port]['sprzet'] != equipment_name
+        }
+
+    def critical_valves(self, use_valve_states=True):
+        """
+        Zwraca analizę krytycznych zaworów dla wszystkich par portów (patrz pathfinder_analysis):
+        {'blocked': {zawór: [(start, cel), ...]}, 'pairs_total': liczba par z trasą, 'version': ...}.
+        Przy `use_valve_states=True` analizowane są zawory otwarte w bieżącym stanie, przy False -
+        wszystkie zawory, jakby każdy był otwarty (wynik zależy wtedy tylko od wersji topologii).
+        Wynik jest zapamiętywany dla wersji grafu; analiza 'all' odświeżana jest w tle po zmianie
+        struktury, analiza 'live' liczona przy pierwszym zapytaniu po zmianie stanów zaworów.
+        """
+        kind = 'live' if use_valve_states else 'all'
+        entry = self._critical_valves.get(kind)
+        if entry is not None and entry['version'] == self._reachability_version(kind):
+            return entry
+
+        with self._critical_lock:
+            # Inny wątek mógł w międzyczasie policzyć ten sam wynik
+            entry = self._critical_valves.get(kind)
+            version = self._reachability_version(kind)
+            if entry is not None and entry['version'] == version:
+                return entry
+
+            for _ in range(3):
+                version = self._reachability_version(kind)
+                backend = self.backend
+                port_names = list(self.ports)
+                try:
+                    edges = backend.edges(backend.view(LIVE if kind == 'live' else ALL))
+                    break
+                except RuntimeError:
+                    # Graf otwartych krawędzi zmieniany w trakcie odczytu
+                    continue
+            else:
+                raise RuntimeError("Nie udało się wykonać migawki grafu do analizy krytycznych zaworów.")
+
+            if self._analysis_pool is None:
+                # Pula tworzona przy pierwszej analizie - tylko w procesie, który o nią pyta
+                # (serwer WWW), a nie w każdym procesie importującym aplikację (worker, beat)
+                self._analysis_pool = create_analysis_pool(self.analysis_workers)
+                if self._analysis_pool is not None:
+                    atexit.register(self._analysis_pool.close)
+            blocked, pairs_total = analyze_critical_valves(edges, port_names, self.analysis_workers, self._analysis_pool)
+            # Zawory bez przejezdnych krawędzi też są raportowane (bez wpływu na trasy)
+            valves = self._open_valves if kind == 'live' else self._all_valves
+            for nazwa in valves:
+                blocked.setdefault(nazwa, [])
+
+            entry = {'version': version, 'blocked': blocked, 'pairs_total': pairs_total}
+            self._critical_valves[kind] = entry
+            return entry
+
+    # ================== ODPORNOŚĆ INSTALACJI ==================
+
+    def _schedule_resilience_rebuild(self):
+        """Zleca przeliczenie raportu odporności w tle (kolejne zlecenia w trakcie liczenia są łączone)."""
+        if not self.reachability_background:
+            self.rebuild_resilience()
+            return
+
+        with self._resilience_lock:
+            self._resilience_dirty = True
+            if self._resilience_thread is not None:
+                return
+            self._resilience_thread = threading.Thread(
+                target=self._resilience_worker, name='pathfinder-resilience', daemon=True
+            )
+            self._resilience_thread.start()
+
+    def _resilience_worker(self):
+        while True:
+            with self._resilience_lock:
+                if not self._resilience_dirty:
+                    self._resilience_thread = None
+                    return
+                self._resilience_dirty = False
+            try:
+                self.rebuild_resilience()
+            except Exception as e:
+                print(f"ERROR: Nie udało się przeliczyć raportu odporności: {e}")
+
+    def rebuild_resilience(self):
+        """
+        Liczy minimalne przekroje między klasami sprzętu (RESILIENCE_STAGES) na grafie
+        wszystkich zaworów. Wynik zależy tylko od struktury mapy, więc jest ważny dla skrótu migawki.
+        """
+        version = self.topology_hash
+        backend = self.backend
+        ports = self.ports
+        # Przepływy liczone poza pętlą zdarzeń (pod eventletem w wątku systemowym)
+        equipment = run_cpu_bound(resilience_report, backend.edges(backend.view(ALL)), ports)
+        self._resilience = {
+            'version': version,
+            'computed_at': datetime.now(timezone.utc).isoformat(),
+            'stages': [f"{source} -> {target}" for source, target in RESILIENCE_STAGES],
+            'equipment': equipment,
+            'single_points_of_failure': [
+                {'stage': entry['stage'], 'equipment': entry['equipment'], 'segment': entry['cut_segments'][0],
+                 'valves': entry['cut_valves']}
+                for entry in equipment if entry['single_point_of_failure']
+            ]
+        }
+        return self._resilience
+
+    def resilience_report(self):
+        """
+        Zwraca raport odporności dla bieżącej struktury mapy albo None, jeśli jest
+        jeszcze liczony. Nigdy nie liczy go w wątku wywołującym (przy włączonym trybie tła).
+        """
+        entry = self._resilience
+        if entry is not None and entry['version'] == self.topology_hash:
+            return entry
+        if self.resilience_enabled and self.reachability_background and self._resilience_thread is None:
+            # Np. poprzednie liczenie zakończyło się błędem - zlecamy ponownie
+            self._schedule_resilience_rebuild()
+        return None
+
+    def topology_health(self):
+        """
+        Zwraca przegląd stanu mapy (osierocone zawory, segmenty bez zaworów, izolowane węzły
+        i martwe końce, składowe spójności, nieosiągalny sprzęt, cykle), liczony z grafu
+        w pamięci i zapamiętywany dla wersji topologii.
+        """
+        entry = self._health
+        version = self.topology_version
+        if entry is not None and entry['version'] == version:
+            return entry
 
+        segments, junctions, ports, equipment = self.segments, self.junctions, self.ports, self.equipment
+        report = topology_health(segments, junctions, ports, equipment, list(self.valve_states))
+        entry = dict(report, version=version, analyzed_at=datetime.now(timezone.utc).isoformat())
+        self._health = entry
+        return entry
 
-    def find_path(self, start_node, end_node, open_valves=None):
-        """Znajduje najkrótszą ścieżkę między węzłami"""
+    # ================== INDEKSY SEGMENTÓW ==================
+
+    def valve_names(self):
+        """Zwraca zbiór nazw wszystkich zaworów występujących w grafie (np. do szukania trasy 'idealnej')."""
+        return self._all_valves
+
+    def valves_for_segments(self, segment_names):
+        """Zwraca zbiór nazw zaworów przypisanych do podanych segmentów."""
+        return {
+            self.segments[nazwa]['valve_name'] for nazwa in segment_names
+            if nazwa in self.segments and self.segments[nazwa]['valve_name']
+        }
+
+    def segment_ids(self, segment_names):
+        """Zwraca listę ID segmentów (w kolejności podanych nazw), pomijając nieznane nazwy."""
+        return [self.segments[nazwa]['id'] for nazwa in segment_names if nazwa in self.segments]
+
+    def segment_endpoints(self, segment_name):
+        """Zwraca krotkę (punkt_startowy, punkt_koncowy) segmentu lub None."""
+        segment = self.segments.get(segment_name)
+        if segment is None:
+            return None
+        return segment['start'], segment['end']
+
+    def segment_between(self, start_point, end_point):
+        """Zwraca nazwę segmentu łączącego bezpośrednio dwa punkty (w dowolnym kierunku) lub None."""
+        backend = self.backend
+        for a, b in ((start_point, end_point), (end_point, start_point)):
+            if not backend.has_node(a):
+                continue
+            for target, segment_name, _ in backend.out_edges(a):
+                if target == b:
+                    return segment_name
+        return None
+
+    def find_path(self, start_node, end_node, open_valves=None, via=None, avoid_occupied=False):
+        """
+        Znajduje najkrótszą ścieżkę między węzłami (opcjonalnie przez punkty pośrednie `via`).
+        Przy `avoid_occupied=True` pomija segmenty zajęte przez aktywne operacje.
+        Wyniki są zapamiętywane w cache LRU z kluczem zawierającym wersję topologii
+        i wersję stanów zaworów, więc zmiana któregokolwiek z nich unieważnia wpisy.
+        """
         print(f"DEBUG: PathFinder.find_path called with start='{start_node}', end='{end_node}'")
-        
-        # Jeśli nie podano stanów zaworów, pobierz z bazy lub użyj wszystkich
+
+        waypoints = (start_node, *(via or ()), end_node)
+        legs = self.find_route_legs(waypoints, open_valves, avoid_occupied)
+        if any(leg is None for leg in legs):
+            return None
+
+        path_segments = [segment for leg in legs for segment in leg]
+        print(f"DEBUG: Path segments: {path_segments}")
+        return path_segments
+
+    def find_route_legs(self, waypoints, open_valves=None, avoid_occupied=False):
+        """
+        Wyznacza trasę przez uporządkowaną listę punktów (np. start, FZ1_IN, FZ1_OUT, cel)
+        w jednym przebiegu: widok grafu jest wybierany raz dla wszystkich odcinków, a każdy
+        odcinek trafia do cache pod kluczem swoich końców, więc wspólne odcinki
+        (np. FZ1_IN -> FZ1_OUT) nie są liczone ponownie.
+
+        Zwraca listę odcinków (listy nazw segmentów), po jednym na parę kolejnych punktów.
+        Odcinek, dla którego nie ma trasy, oraz wszystkie kolejne mają wartość None.
+        """
+        valve_key, view = self._resolve_search_graph(open_valves, avoid_occupied)
+        legs = []
+        for start_node, end_node in zip(waypoints, waypoints[1:]):
+            if legs and legs[-1] is None:
+                # Trasa i tak jest przerwana - dalszych odcinków nie liczymy
+                legs.append(None)
+                continue
+            legs.append(self._find_leg(view, valve_key, start_node, end_node))
+        return legs
+
+    def _find_leg(self, view, valve_key, start_node, end_node):
+        cache_key = (start_node, end_node, self.topology_version, valve_key)
+        cached = self._route_cache.get(cache_key, _CACHE_MISS)
+        if cached is not _CACHE_MISS:
+            self._route_cache.move_to_end(cache_key)
+            self.cache_stats['hits'] += 1
+            return list(cached) if cached is not None else None
+
+        self.cache_stats['misses'] += 1
+        leg = self._search_leg(view, start_node, end_node)
+        self._store_route(cache_key, leg)
+        return leg
+
+    def find_paths_bulk(self, pairs, open_valves=None, avoid_occupied=False):
+        """
+        Wyznacza trasy dla wielu par (start, cel) naraz. Dla każdego różnego punktu
+        startowego wykonywane jest jedno przeszukanie BFS, z którego odczytywane są
+        trasy do wszystkich jego celów. Zwraca słownik {(start, cel): segmenty lub None}
+        w kolejności podanych par. Wyniki trafiają do tego samego cache co find_path.
+        """
+        backend = self.backend
+        valve_key, view = self._resolve_search_graph(open_valves, avoid_occupied)
+        results = {}
+        pending = defaultdict(list)
+
+        for start_node, end_node in pairs:
+            key = (start_node, end_node)
+            if key in results:
+                continue
+            cache_key = (start_node, end_node, self.topology_version, valve_key)
+            cached = self._route_cache.get(cache_key, _CACHE_MISS)
+            if cached is not _CACHE_MISS:
+                self._route_cache.move_to_end(cache_key)
+                self.cache_stats['hits'] += 1
+                results[key] = list(cached) if cached is not None else None
+            else:
+                self.cache_stats['misses'] += 1
+                results[key] = None
+                pending[start_node].append(end_node)
+
+        for start_node, end_nodes in pending.items():
+            if backend.has_node(start_node):
+                # Jedno drzewo BFS dla wszystkich celów z tego samego punktu startowego
+                tree = backend.shortest_paths_from(view, start_node, end_nodes)
+            else:
+                print(f"ERROR: Start node '{start_node}' not found in graph")
+                tree = {}
+
+            for end_node in end_nodes:
+                path_segments = tree.get(end_node)
+                results[(start_node, end_node)] = path_segments
+                self._store_route((start_node, end_node, self.topology_version, valve_key), path_segments)
+
+        return results
+
+    def find_k_paths(self, start_node, end_node, k=5, rank_by='hops'):
+        """
+        Wyznacza do `k` najkrótszych tras bez pętli (algorytm Yena) na pełnym grafie,
+        wyłącznie w pamięci - stany zaworów w bazie nie są zmieniane.
+
+        rank_by='hops'     - najpierw liczba segmentów, potem liczba zaworów do przełączenia,
+        rank_by='switches' - najpierw liczba zamkniętych zaworów, które trzeba otworzyć, potem długość.
+
+        Zwraca listę słowników {segments, hops, valves, valves_to_open, switches}.
+        """
+        if rank_by not in ('hops', 'switches'):
+            raise ValueError("rank_by musi mieć wartość 'hops' lub 'switches'")
+
+        backend = self.backend
+        if not backend.has_node(start_node) or not backend.has_node(end_node) or k < 1:
+            return []
+
+        valve_states = self.valve_states
+        # Waga krawędzi koduje porządek leksykograficzny: mnożnik większy niż
+        # maksymalna wartość drugiego kryterium (liczba krawędzi w ścieżce)
+        multiplier = len(self.segments) + 1
+
+        def weight(valve_name):
+            switch = 1 if valve_name and valve_states.get(valve_name) != 'OTWARTY' else 0
+            if rank_by == 'hops':
+                return multiplier + switch
+            return 1 + multiplier * switch
+
+        def out_edges(node):
+            for target, segment_name, valve_name in backend.out_edges(node):
+                yield target, segment_name, weight(valve_name)
+
+        paths = [
+            {'segments': segments, 'hops': len(segments), **self._describe_valves(segments)}
+            for segments in _yen_k_shortest_paths(out_edges, start_node, end_node, k)
+        ]
+        return paths
+
+    def _describe_valves(self, segment_names):
+        valves = []
+        for nazwa in segment_names:
+            valve_name = self.segments.get(nazwa, {}).get('valve_name')
+            if valve_name and valve_name not in valves:
+                valves.append(valve_name)
+        valves_to_open = [nazwa for nazwa in valves if self.valve_states.get(nazwa) != 'OTWARTY']
+        return {'valves': valves, 'valves_to_open': valves_to_open, 'switches': len(valves_to_open)}
+
+    def _store_route(self, cache_key, path_segments):
+        self._route_cache[cache_key] = tuple(path_segments) if path_segments is not None else None
+        if len(self._route_cache) > self.route_cache_size:
+            self._route_cache.popitem(last=False)
+            self.cache_stats['evictions'] += 1
+
+    def _resolve_search_graph(self, open_valves, avoid_occupied=False):
+        """Zwraca (klucz stanu zaworów do cache, widok silnika do przeszukania) dla podanej listy zaworów."""
+        # Bez jawnej listy zaworów korzystamy z utrzymywanego na bieżąco widoku otwartych krawędzi.
+        # Z jawną listą - z widoku filtrującego krawędzie (bez kopiowania grafu).
         if open_valves is None:
-            open_valves = self._get_open_valves()
-        
-        print(f"DEBUG: Using open_valves: {open_valves[:5]}... (total: {len(open_valves)})")
-        
+            valve_key, view = ('live', self.valve_state_version), self.backend.view(LIVE)
+        elif open_valves is self._all_valves:
+            valve_key, view = 'all', self.backend.view(ALL)
+        else:
+            open_valves = frozenset(open_valves)
+            valve_key, view = open_valves, self.backend.view(open_valves)
+
+        if not avoid_occupied:
+            return valve_key, view
+        # Segmenty zajęte przez aktywne operacje wyłączamy z przeszukiwania
+        occupied = frozenset(self.occupied_segments)
+        return (valve_key, 'occupied', self.occupancy_version), self.backend.exclude(view, occupied)
+
+    def _search_leg(self, view, start_node, end_node):
+        """Szuka najkrótszego odcinka trasy i zwraca listę nazw segmentów lub None."""
+        backend = self.backend
         # Sprawdź czy węzły istnieją w grafie
-        if start_node not in self.graph.nodes():
+        if not backend.has_node(start_node):
             print(f"ERROR: Start node '{start_node}' not found in graph")
-            print(f"Available nodes: {list(self.graph.nodes())[:10]}...")
             return None
-            
-        if end_node not in self.graph.nodes():
+
+        if not backend.has_node(end_node):
             print(f"ERROR: End node '{end_node}' not found in graph")
-            print(f"Available nodes: {list(self.graph.nodes())[:10]}...")
             return None
-        
-        temp_graph = self.graph.copy()
-        print(f"DEBUG: Temp graph has {len(temp_graph.nodes())} nodes and {len(temp_graph.edges())} edges")
-        
-        edges_to_remove = []
-        for u, v, data in temp_graph.edges(data=True):
-            if data['valve_name'] not in open_valves:
-                edges_to_remove.append((u, v))
-        
-        print(f"DEBUG: Removing {len(edges_to_remove)} edges due to closed valves")
-        temp_graph.remove_edges_from(edges_to_remove)
-        print(f"DEBUG: After removal: {len(temp_graph.edges())} edges remain")
 
-        try:
-            path_nodes = nx.shortest_path(temp_graph, source=start_node, target=end_node)
-            print(f"DEBUG: Found path nodes: {path_nodes}")
-            
-            path_segments = []
-            for i in range(len(path_nodes) - 1):
-                edge_data = self.graph.get_edge_data(path_nodes[i], path_nodes[i+1])
-                if edge_data:
-                    path_segments.append(edge_data['segment_name'])
-            
-            print(f"DEBUG: Path segments: {path_segments}")
-            return path_segments
-        except (nx.NetworkXNoPath, nx.NodeNotFound) as e:
-            print(f"DEBUG: No path found - {type(e).__name__}: {e}")
-            return None
-    
-    def _get_open_valves(self):
-        """Pobiera listę otwartych zaworów z bazy danych (wersja ORM)."""
-        try:
-            # Używamy sesji i modelu Zawory do zbudowania zapytania
-            query = db.select(Zawory.nazwa_zaworu).where(Zawory.stan == 'OTWARTY')
-            open_valves = db.session.execute(query).scalars().all()
-            
-            # Logika awaryjna pozostaje bez zmian, ale również używa ORM
-            if not open_valves:
-                print("WARNING: Brak otwartych zaworów w bazie. Używam wszystkich zaworów dla testów PathFinder.")
-                query_all = db.select(Zawory.nazwa_zaworu)
-                open_valves = db.session.execute(query_all).scalars().all()
-                
-            return open_valves
-        except Exception as e:
-            print(f"Błąd podczas pobierania stanów zaworów (ORM): {e}")
-            # W przypadku błędu, zachowanie awaryjne również używa ORM
-            try:
-                query_all = db.select(Zawory.nazwa_zaworu)
-                return db.session.execute(query_all).scalars().all()
-            except Exception as ex:
-                print(f"Błąd podczas pobierania wszystkich zaworów (ORM): {ex}")
-                return []
+        return backend.shortest_path(view, start_node, end_node)
+
+    def get_cache_stats(self):
+        """Zwraca statystyki cache tras (trafienia, chybienia, rozmiar, wersje)."""
+        lookups = self.cache_stats['hits'] + self.cache_stats['misses']
+        return {
+            **self.cache_stats,
+            'hit_ratio': round(self.cache_stats['hits'] / lookups, 4) if lookups else None,
+            'size': len(self._route_cache),
+            'max_size': self.route_cache_size,
+            'topology_version': self.topology_version,
+            'topology_hash': self.topology_hash,
+            'valve_state_version': self.valve_state_version,
+            'occupancy_version': self.occupancy_version,
+            'occupied_segments': len(self.occupied_segments)
+        }
+
+    def clear_route_cache(self):
+        """Czyści cache tras (statystyki pozostają bez zmian)."""
+        self._route_cache.clear()
 
     @staticmethod
     def release_path(zawory_names=None, segment_names=None):
@@ -161,10 +959,231 @@ class PathFinder:
             
             print(f"INFO: Pomyślnie zamknięto zawory (ORM): {zawory_names}")
 
+            # Aktualizujemy graf otwartych krawędzi w instancji zarejestrowanej w aplikacji
+            pathfinder = current_app.extensions.get('pathfinder')
+            if pathfinder is not None:
+                pathfinder.set_valve_states({nazwa: 'ZAMKNIETY' for nazwa in zawory_names})
+
         except Exception as e:
             db.session.rollback()
             print(f"Błąd bazy danych podczas zwalniania ścieżki (ORM): {e}")
             raise
 
 # USUWAMY globalną instancję. Będziemy ją tworzyć w __init__.py
-# pathfinder_instance = PathFinder()
\ No newline at end of file
+# pathfinder_instance = PathFinder()
+
+
+class ValveOverlay:
+    """
+    Scenariusz stanów zaworów nałożony na bieżący stan PathFindera.
+    Bazowy zbiór otwartych zaworów jest współdzielony, a kopiowany dopiero przy
+    nałożeniu zmian; widok grafu powstaje raz na scenariusz. Trasy liczone w scenariuszu
+    są zapamiętywane tylko w nim, żeby nie wypychać z cache tras bieżącego stanu.
+    Można używać jako menedżera kontekstu: `with pathfinder.with_valve_overrides({...}) as s:`.
+    """
+
+    def __init__(self, pathfinder, overrides):
+        self.pathfinder = pathfinder
+        # Migawka silnika - przeładowanie topologii w trakcie nie miesza widoków dwóch grafów
+        self.backend = pathfinder.backend
+        # Nieznane zawory są pomijane (tak jak w set_valve_states)
+        self.overrides = {
+            nazwa: stan for nazwa, stan in (overrides or {}).items()
+            if nazwa in pathfinder.valve_states
+        }
+
+        open_valves = pathfinder._open_valves
+        changed = {
+            nazwa: stan for nazwa, stan in self.overrides.items()
+            if (stan == 'OTWARTY') != (nazwa in open_valves)
+        }
+        if changed:
+            open_valves = set(open_valves)
+            for nazwa, stan in changed.items():
+                if stan == 'OTWARTY':
+                    open_valves.add(nazwa)
+                else:
+                    open_valves.discard(nazwa)
+        # Ta sama logika awaryjna co w grafie otwartych krawędzi: brak otwartych = wszystkie
+        self.open_valves = frozenset(open_valves) if open_valves else self.backend.valve_names
+        self._views = {}
+        self._legs = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._views.clear()
+        self._legs.clear()
+        return False
+
+    def valve_state(self, valve_name):
+        """Stan zaworu w scenariuszu."""
+        return self.overrides.get(valve_name, self.pathfinder.valve_states.get(valve_name))
+
+    def _view(self, avoid_occupied):
+        view = self._views.get(avoid_occupied)
+        if view is None:
+            view = self.backend.view(self.open_valves)
+            if avoid_occupied:
+                view = self.backend.exclude(view, frozenset(self.pathfinder.occupied_segments))
+            self._views[avoid_occupied] = view
+        return view
+
+    def _leg(self, start_node, end_node, avoid_occupied):
+        key = (start_node, end_node, avoid_occupied)
+        if key not in self._legs:
+            leg = None
+            if self.backend.has_node(start_node) and self.backend.has_node(end_node):
+                leg = self.backend.shortest_path(self._view(avoid_occupied), start_node, end_node)
+            self._legs[key] = leg
+        leg = self._legs[key]
+        return list(leg) if leg is not None else None
+
+    def find_path(self, start_node, end_node, via=None, avoid_occupied=False):
+        """Najkrótsza trasa w scenariuszu (opcjonalnie przez punkty `via`) lub None."""
+        waypoints = (start_node, *(via or ()), end_node)
+        path_segments = []
+        for a, b in zip(waypoints, waypoints[1:]):
+            leg = self._leg(a, b, avoid_occupied)
+            if leg is None:
+                return None
+            path_segments.extend(leg)
+        return path_segments
+
+    def find_paths_bulk(self, pairs, avoid_occupied=False):
+        """Trasy dla wielu par (start, cel) - jedno przeszukanie na punkt startowy, jak PathFinder.find_paths_bulk."""
+        view = self._view(avoid_occupied)
+        results = {}
+        pending = defaultdict(list)
+        for start_node, end_node in pairs:
+            key = (start_node, end_node)
+            if key in results:
+                continue
+            results[key] = None
+            if (start_node, end_node, avoid_occupied) in self._legs:
+                results[key] = self._leg(start_node, end_node, avoid_occupied)
+            else:
+                pending[start_node].append(end_node)
+
+        for start_node, end_nodes in pending.items():
+            tree = self.backend.shortest_paths_from(view, start_node, end_nodes) if self.backend.has_node(start_node) else {}
+            for end_node in end_nodes:
+                leg = tree.get(end_node)
+                self._legs[(start_node, end_node, avoid_occupied)] = leg
+                results[(start_node, end_node)] = list(leg) if leg is not None else None
+        return results
+
+
+def _build_topology(backend_name, nodes, edges, ports, junctions, segments, valve_states):
+    """Silnik grafu z widokiem otwartych krawędzi oraz migawka struktury i jej skrót (bez dostępu do bazy)."""
+    backend = BACKENDS[backend_name](nodes, edges)
+    snapshot = topology_snapshots.build_snapshot(ports, junctions, segments)
+    open_valves = _rebuild_live(backend, valve_states)
+    return backend, snapshot, topology_snapshots.snapshot_hash(snapshot), open_valves
+
+
+def _rebuild_live(backend, valve_states):
+    """Odbudowuje widok otwartych krawędzi silnika i zwraca zbiór otwartych zaworów."""
+    open_valves = {nazwa for nazwa, stan in valve_states.items() if stan == 'OTWARTY'}
+
+    usable_valves = open_valves
+    if not open_valves:
+        # Logika awaryjna pozostaje bez zmian: brak otwartych zaworów = wszystkie traktujemy jako otwarte
+        print("WARNING: Brak otwartych zaworów w bazie. Używam wszystkich zaworów dla testów PathFinder.")
+        usable_valves = valve_states.keys()
+
+    backend.rebuild_live(usable_valves)
+    return open_valves
+
+
+def _dijkstra(out_edges, source, target, removed_nodes=frozenset(), removed_edges=frozenset()):
+    """
+    Dijkstra po funkcji `out_edges(węzeł) -> (cel, segment, waga)`, z pominięciem
+    usuniętych węzłów i krawędzi. Zwraca (koszt, węzły, segmenty) lub None.
+    """
+    distances = {source: 0}
+    previous = {}
+    counter = 0
+    heap = [(0, counter, source)]
+    visited = set()
+    while heap:
+        cost, _, node = heapq.heappop(heap)
+        if node in visited:
+            continue
+        visited.add(node)
+        if node == target:
+            nodes, segments = [target], []
+            while node != source:
+                node, segment_name = previous[node]
+                nodes.append(node)
+                segments.append(segment_name)
+            nodes.reverse()
+            segments.reverse()
+            return cost, nodes, segments
+        for neighbour, segment_name, edge_weight in out_edges(node):
+            if neighbour in removed_nodes or (node, neighbour) in removed_edges:
+                continue
+            new_cost = cost + edge_weight
+            if new_cost < distances.get(neighbour, float('inf')):
+                distances[neighbour] = new_cost
+                previous[neighbour] = (node, segment_name)
+                counter += 1
+                heapq.heappush(heap, (new_cost, counter, neighbour))
+    return None
+
+
+def _yen_k_shortest_paths(out_edges, source, target, k):
+    """Algorytm Yena: zwraca do `k` najtańszych ścieżek bez pętli jako listy nazw segmentów."""
+    first = _dijkstra(out_edges, source, target)
+    if first is None:
+        return []
+
+    edge_costs = {}
+
+    def path_cost(nodes, count):
+        return sum(edge_costs[(nodes[i], nodes[i + 1])] for i in range(count))
+
+    def remember_costs(nodes):
+        for i in range(len(nodes) - 1):
+            if (nodes[i], nodes[i + 1]) not in edge_costs:
+                for neighbour, _, edge_weight in out_edges(nodes[i]):
+                    edge_costs[(nodes[i], neighbour)] = edge_weight
+
+    accepted = [first]
+    remember_costs(first[1])
+    candidates = []
+    seen = {tuple(first[1])}
+    counter = 0
+
+    while len(accepted) < k:
+        _, prev_nodes, prev_segments = accepted[-1]
+        for i in range(len(prev_nodes) - 1):
+            spur_node = prev_nodes[i]
+            root_nodes = prev_nodes[:i + 1]
+
+            # Krawędzie wychodzące z korzenia, użyte już przez zaakceptowane ścieżki o tym samym korzeniu
+            removed_edges = {
+                (nodes[i], nodes[i + 1]) for _, nodes, _ in accepted
+                if len(nodes) > i + 1 and nodes[:i + 1] == root_nodes
+            }
+            spur = _dijkstra(out_edges, spur_node, target, frozenset(root_nodes[:-1]), removed_edges)
+            if spur is None:
+                continue
+
+            spur_cost, spur_nodes, spur_segments = spur
+            total_nodes = root_nodes[:-1] + spur_nodes
+            if tuple(total_nodes) in seen:
+                continue
+            seen.add(tuple(total_nodes))
+            total_cost = path_cost(prev_nodes, i) + spur_cost
+            counter += 1
+            heapq.heappush(candidates, (total_cost, counter, total_nodes, prev_segments[:i] + spur_segments))
+
+        if not candidates:
+            break
+        cost, _, nodes, segments = heapq.heappop(candidates)
+        remember_costs(nodes)
+        accepted.append((cost, nodes, segments))
+
+    return [segments for _, _, segments in accepted]
@@ -0,0 +1,318 @@
+# app/perf.py
+"""
+Pomiar zapytań SQL w obrębie jednego zapytania HTTP lub zadania Celery.
+
+Dla każdej "jednostki pracy" (żądanie Flask, zadanie Celery, blok track()) zliczane są
+zapytania, łączny czas w bazie, najwolniejsze instrukcje oraz powtórzenia tego samego
+kształtu instrukcji (literały i listy parametrów zastąpione '?'). Kształt powtórzony
+co najmniej SQL_PERF_N_PLUS_ONE_THRESHOLD razy w jednej jednostce to sygnatura N+1
+(np. osobne zapytanie o pomiar dla każdego urządzenia w pętli).
+
+Źródła pomiarów:
+- zdarzenia before/after_cursor_execute silnika SQLAlchemy (sesje ORM),
+- kursory połączeń z get_db_connection (surowy SQL) - opakowywane przez instrument_connection,
+  bo wykonują instrukcje bezpośrednio na połączeniu mysql.connector, z pominięciem silnika.
+
+Pomiar jest domyślnie wyłączony (SQL_PERF_ENABLED). Po włączeniu agregaty per endpoint /
+zadanie są dostępne pod /api/debug/perf, a przy SQL_PERF_HEADERS każda odpowiedź dostaje
+nagłówki X-SQL-* i Server-Timing.
+Bieżąca jednostka trzymana jest w threading.local - pod eventletem lokalnym dla greenleta.
+"""
+
+import heapq
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from flask import request
+from sqlalchemy import event
+from .extensions import db
+
+SLOWEST_PER_UNIT = 5
+SLOWEST_GLOBAL = 20
+MAX_UNITS = 500
+
+_local = threading.local()
+_instrumented_engines = set()
+
+_LITERALS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|%\(\w+\)s))*\s*\)")
+_REPEATED_GROUPS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def statement_shape(statement):
+    """Kształt instrukcji: literały i listy parametrów zastąpione '?', białe znaki zwinięte."""
+    shape = _SPACES.sub(' ', _LITERALS.sub('?', statement)).strip()
+    shape = _REPEATED_GROUPS.sub('(?)', _PLACEHOLDER_LISTS.sub('(?)', shape))
+    return shape[:500]
+
+
+class UnitStats:
+    """Zapytania jednej jednostki pracy (żądania HTTP lub zadania)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.slowest = []
+        # kształt instrukcji -> [liczba wykonań, łączny czas ms]
+        self.shapes = {}
+
+    def record(self, statement, elapsed_ms):
+        self.queries += 1
+        self.db_ms += elapsed_ms
+        shape = statement_shape(statement) if isinstance(statement, str) else repr(statement)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            self.shapes[shape] = [1, elapsed_ms]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed_ms
+        if len(self.slowest) < SLOWEST_PER_UNIT:
+            heapq.heappush(self.slowest, (elapsed_ms, shape))
+        elif elapsed_ms > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (elapsed_ms, shape))
+
+    def n_plus_one(self, threshold):
+        """Kształty powtórzone co najmniej `threshold` razy: [(kształt, liczba, czas ms)], od najczęstszego."""
+        repeated = [(shape, count, ms) for shape, (count, ms) in self.shapes.items() if count >= threshold]
+        repeated.sort(key=lambda item: -item[1])
+        return repeated
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+class PerfRegistry:
+    """Agregaty jednostek pracy w procesie: per endpoint / zadanie oraz najwolniejsze instrukcje."""
+
+    def __init__(self, n_plus_one_threshold=5, headers=False):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.headers = headers
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.units = {}
+            self.slowest = []
+            self.since = time.time()
+
+    def record(self, unit, elapsed_ms):
+        """Dolicza zakończoną jednostkę. Zwraca wykryte sygnatury N+1."""
+        repeated = unit.n_plus_one(self.n_plus_one_threshold)
+        with self._lock:
+            entry = self.units.get(unit.name)
+            if entry is None:
+                if len(self.units) >= MAX_UNITS:
+                    return repeated
+                entry = self.units[unit.name] = {
+                    'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0, 'max_queries': 0,
+                    'db_ms': 0.0, 'n_plus_one': {}
+                }
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['queries'] += unit.queries
+            entry['max_queries'] = max(entry['max_queries'], unit.queries)
+            entry['db_ms'] += unit.db_ms
+            for shape, count, _ in repeated:
+                signature = entry['n_plus_one'].setdefault(shape, {'occurrences': 0, 'max_repeats': 0})
+                signature['occurrences'] += 1
+                signature['max_repeats'] = max(signature['max_repeats'], count)
+            for ms, shape in unit.slowest:
+                item = (ms, shape, unit.name)
+                if len(self.slowest) < SLOWEST_GLOBAL:
+                    heapq.heappush(self.slowest, item)
+                elif ms > self.slowest[0][0]:
+                    heapq.heapreplace(self.slowest, item)
+        return repeated
+
+    def snapshot(self):
+        with self._lock:
+            units = []
+            for name, entry in self.units.items():
+                count = entry['count']
+                units.append({
+                    'name': name,
+                    'count': count,
+                    'avg_ms': round(entry['total_ms'] / count, 3),
+                    'max_ms': round(entry['max_ms'], 3),
+                    'avg_queries': round(entry['queries'] / count, 2),
+                    'max_queries': entry['max_queries'],
+                    'avg_db_ms': round(entry['db_ms'] / count, 3),
+                    'db_share': round(entry['db_ms'] / entry['total_ms'], 4) if entry['total_ms'] else None,
+                    'n_plus_one': [
+                        dict(signature, shape=shape)
+                        for shape, signature in sorted(entry['n_plus_one'].items(), key=lambda item: -item[1]['occurrences'])
+                    ],
+                })
+            slowest = [
+                {'ms': round(ms, 3), 'shape': shape, 'unit': name}
+                for ms, shape, name in sorted(self.slowest, reverse=True)
+            ]
+        units.sort(key=lambda unit: -unit['avg_db_ms'] * unit['count'])
+        return {
+            'since': self.since,
+            'n_plus_one_threshold': self.n_plus_one_threshold,
+            'units': units,
+            'slowest_statements': slowest,
+        }
+
+
+# ================== BIEŻĄCA JEDNOSTKA PRACY ==================
+
+def current_unit():
+    return getattr(_local, 'unit', None)
+
+
+def record_query(statement, elapsed_ms):
+    unit = getattr(_local, 'unit', None)
+    if unit is not None:
+        unit.record(statement, elapsed_ms)
+
+
+def start_unit(name):
+    """Rozpoczyna jednostkę pracy; zwraca poprzednią (do przywrócenia w finish_unit)."""
+    previous = getattr(_local, 'unit', None)
+    _local.unit = UnitStats(name)
+    return previous
+
+
+def finish_unit(registry, previous=None):
+    """Kończy bieżącą jednostkę i dolicza ją do rejestru. Zwraca (jednostka, czas ms, sygnatury N+1)."""
+    unit = getattr(_local, 'unit', None)
+    _local.unit = previous
+    if unit is None:
+        return None, 0.0, []
+    elapsed_ms = unit.elapsed_ms()
+    repeated = registry.record(unit, elapsed_ms) if registry is not None else []
+    if repeated and registry is not None and registry.headers:
+        for shape, count, ms in repeated:
+            print(f"WARNING: Możliwe N+1 w '{unit.name}': {count}x ({ms:.1f} ms) {shape[:160]}")
+    return unit, elapsed_ms, repeated
+
+
+@contextmanager
+def track(name, registry):
+    """Mierzy zapytania SQL w bloku (np. w zadaniu Celery) jako osobną jednostkę pracy."""
+    if registry is None:
+        yield None
+        return
+    previous = start_unit(name)
+    try:
+        yield current_unit()
+    finally:
+        finish_unit(registry, previous)
+
+
+# ================== ŹRÓDŁA POMIARÓW ==================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('perf_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('perf_query_start')
+    if starts:
+        record_query(statement, (time.perf_counter() - starts.pop()) * 1000)
+
+
+class InstrumentedCursor:
+    """Kursor mysql.connector mierzący czas execute/executemany (reszta bez zmian)."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, *args, **kwargs)
+        finally:
+            record_query(operation, (time.perf_counter() - started) * 1000)
+
+    def executemany(self, operation, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, *args, **kwargs)
+        finally:
+            record_query(operation, (time.perf_counter() - started) * 1000)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Połączenie z puli, którego kursory są mierzone (patrz InstrumentedCursor)."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def instrument_connection(connection):
+    return InstrumentedConnection(connection)
+
+
+# ================== INTEGRACJA Z FLASK ==================
+
+def init_app(app):
+    """Włącza pomiar zapytań SQL dla żądań aplikacji (SQL_PERF_ENABLED)."""
+    if not app.config.get('SQL_PERF_ENABLED', False):
+        return None
+
+    registry = PerfRegistry(
+        n_plus_one_threshold=app.config.get('SQL_PERF_N_PLUS_ONE_THRESHOLD', 5),
+        headers=app.config.get('SQL_PERF_HEADERS', False)
+    )
+    app.extensions['sql_perf'] = registry
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if id(engine) not in _instrumented_engines:
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            _instrumented_engines.add(id(engine))
+
+    @app.before_request
+    def start_request_unit():
+        request.environ['sql_perf.previous'] = start_unit(f"{request.method} {request.endpoint or request.path}")
+
+    @app.after_request
+    def finish_request_unit(response):
+        unit, elapsed_ms, repeated = finish_unit(registry, request.environ.pop('sql_perf.previous', None))
+        if unit is not None and registry.headers:
+            response.headers['X-SQL-Queries'] = str(unit.queries)
+            response.headers['X-SQL-Time-Ms'] = f"{unit.db_ms:.1f}"
+            response.headers['X-SQL-N-Plus-One'] = str(len(repeated))
+            response.headers['Server-Timing'] = (
+                f'db;dur={unit.db_ms:.1f};desc="{unit.queries} queries", app;dur={elapsed_ms:.1f}'
+            )
+        return response
+
+    @app.teardown_request
+    def drop_request_unit(exc):
+        # Wyjątek przed after_request - jednostka i tak jest doliczana (z błędem też warto ją widzieć)
+        if 'sql_perf.previous' in request.environ:
+            finish_unit(registry, request.environ.pop('sql_perf.previous'))
+
+    return registry
@@ -0,0 +1,175 @@
+# app/replica.py
+"""
+Kierowanie odczytów raportowych (dashboard, historia pomiarów, palety, skład mieszanin,
+historia testów PathFindera) na replikę MySQL, aby nie konkurowały z zapisami operacji
+i zadania czujników na bazie głównej.
+
+Replika to dodatkowy bind 'replica' (SQLALCHEMY_BINDS), ustawiany gdy podano
+REPLICA_DATABASE_URI. Funkcje i widoki oznaczone @read_replica (lub blok
+`with replica_reads():`) wykonują zapytania db.session na replice - patrz
+RoutingSession.get_bind - a get_db_connection(replica=True) wypożycza surowe
+połączenie z puli repliki. Zapisy (flush sesji) zawsze trafiają do bazy głównej.
+Oznaczane są widoki HTTP, a nie serwisy: te same metody budują rozgłoszenia po zapisie
+(Socket.IO, zadania Celery), które muszą czytać z bazy głównej świeżo zatwierdzony stan.
+
+Gdy replika nie odpowiada, replikacja stoi albo opóźnienie przekracza
+REPLICA_MAX_LAG_SECONDS, odczyty wracają na bazę główną. Opóźnienie sprawdzane jest
+najwyżej raz na REPLICA_LAG_CHECK_SECONDS (instancja, która nie jest repliką - np.
+druga lokalna baza MySQL lub SQLite do testów - ma opóźnienie 0).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, has_app_context
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = 'replica'
+
+# Głębokość zagnieżdżenia bloków "odczyt z repliki" - pod eventletem lokalna dla greenleta
+_local = threading.local()
+
+
+def using_replica():
+    return getattr(_local, 'depth', 0) > 0
+
+
+@contextmanager
+def replica_reads():
+    """Blok, w którym zapytania db.session (odczyty) mogą trafić na replikę."""
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+
+
+def read_replica(func):
+    """Dekorator metod/widoków tylko do odczytu - ich zapytania ORM trafiają na replikę."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def __init__(self, engine, max_lag_seconds=5.0, check_seconds=10.0):
+        self.engine = engine
+        self.max_lag_seconds = max_lag_seconds
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self.healthy = False
+        self.lag_seconds = None
+        self.last_error = None
+        self.stats = {'replica_reads': 0, 'primary_fallbacks': 0, 'lag_checks': 0}
+
+    def available(self):
+        """Czy odczyty mogą teraz iść na replikę (wynik sprawdzenia opóźnienia jest zapamiętywany)."""
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self.check_seconds:
+            return self.healthy
+        # Sprawdza tylko jeden wątek/greenlet naraz, pozostałe używają poprzedniego wyniku
+        if not self._lock.acquire(blocking=False):
+            return self.healthy
+        try:
+            self.check()
+        finally:
+            self._lock.release()
+        return self.healthy
+
+    def check(self):
+        was_healthy = self.healthy
+        self.stats['lag_checks'] += 1
+        try:
+            lag = self._measure_lag()
+            self.lag_seconds = lag
+            self.last_error = None if lag is not None else 'Replikacja zatrzymana (brak Seconds_Behind_Source).'
+            self.healthy = lag is not None and lag <= self.max_lag_seconds
+        except Exception as e:
+            self.lag_seconds = None
+            self.last_error = str(e)
+            self.healthy = False
+        self._checked_at = time.monotonic()
+
+        if was_healthy and not self.healthy:
+            print(f"WARNING: Odczyty wracają na bazę główną - replika niedostępna lub opóźniona "
+                  f"(opóźnienie: {self.lag_seconds}, błąd: {self.last_error}).")
+        elif self.healthy and not was_healthy:
+            print(f"INFO: Odczyty raportowe kierowane na replikę (opóźnienie: {self.lag_seconds}s).")
+        return self.healthy
+
+    def _measure_lag(self):
+        """Opóźnienie repliki w sekundach, None gdy replikacja stoi."""
+        with self.engine.connect() as conn:
+            if conn.dialect.name != 'mysql':
+                conn.exec_driver_sql("SELECT 1")
+                return 0.0
+            try:
+                row = conn.exec_driver_sql("SHOW REPLICA STATUS").mappings().first()
+            except Exception:
+                # MySQL < 8.0.22
+                row = conn.exec_driver_sql("SHOW SLAVE STATUS").mappings().first()
+        if row is None:
+            # Zwykła instancja (nie replika) - np. druga baza do testów lokalnych
+            return 0.0
+        lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+        return float(lag) if lag is not None else None
+
+    def engine_for_read(self):
+        """Silnik repliki albo None (odczyt ma iść na bazę główną)."""
+        if self.available():
+            self.stats['replica_reads'] += 1
+            return self.engine
+        self.stats['primary_fallbacks'] += 1
+        return None
+
+    def status(self):
+        return {
+            'configured': True,
+            'healthy': self.healthy,
+            'lag_seconds': self.lag_seconds,
+            'max_lag_seconds': self.max_lag_seconds,
+            'last_error': self.last_error,
+            **self.stats,
+        }
+
+
+def init_app(app, db):
+    """Rejestruje router repliki, jeśli w SQLALCHEMY_BINDS jest bind 'replica'."""
+    if REPLICA_BIND not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+        return None
+    with app.app_context():
+        engine = db.engines[REPLICA_BIND]
+    router = ReplicaRouter(
+        engine,
+        max_lag_seconds=app.config.get('REPLICA_MAX_LAG_SECONDS', 5.0),
+        check_seconds=app.config.get('REPLICA_LAG_CHECK_SECONDS', 10.0)
+    )
+    app.extensions['replica'] = router
+    print(f"INFO: Skonfigurowano replikę do odczytów raportowych (maks. opóźnienie: {router.max_lag_seconds}s).")
+    return router
+
+
+def replica_engine(app=None):
+    """Silnik repliki dla bieżącego odczytu albo None (brak repliki, opóźnienie, błąd)."""
+    if app is None:
+        if not has_app_context():
+            return None
+        app = current_app
+    router = app.extensions.get('replica')
+    return router.engine_for_read() if router is not None else None
+
+
+class RoutingSession(Session):
+    """Sesja Flask-SQLAlchemy kierująca odczyty z bloków @read_replica na replikę."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # Zapisy: flush obiektów ORM oraz insert()/update()/delete() wykonywane przez db.session.execute
+        is_write = self._flushing or (clause is not None and getattr(clause, 'is_dml', False))
+        if bind is None and not is_write and using_replica():
+            engine = replica_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
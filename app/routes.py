@@ -14,11 +14,11 @@ from app.sockets import broadcast_apollo_update
 from app.dashboard_service import DashboardService
 from .models import Sprzet
 from .extensions import db
+from .replica import read_replica
 
 def get_pathfinder():
-    if 'pathfinder' not in g:
-        g.pathfinder = PathFinder(get_db_connection())
-    return g.pathfinder
+    """Pobiera instancję serwisu PathFinder zarejestrowaną w aplikacji."""
+    return current_app.extensions['pathfinder']
 
 def get_sensor_service():
     """Pobiera instancję serwisu SensorService z kontekstu aplikacji."""
@@ -127,6 +127,9 @@ def zmien_stan_zaworu():
     cursor.close()
     conn.close()
 
+    # Zmiana stanu zaworu musi trafić do grafu otwartych krawędzi PathFindera
+    get_pathfinder().refresh_valve_states()
+
     return jsonify({"status": "success", "message": f"Zmieniono stan zaworu {id_zaworu} na {nowy_stan}."})
 
 @bp.route('/api/punkty_startowe', methods=['GET'])
@@ -150,7 +153,12 @@ def get_punkty_startowe():
 
 @bp.route('/api/punkty_docelowe', methods=['GET'])
 def get_punkty_docelowe():
-    """Zwraca listę wszystkich portów wejściowych (IN)."""
+    """
+    Zwraca listę wszystkich portów wejściowych (IN).
+    Opcjonalny parametr `?start=<port>` zawęża listę do portów osiągalnych z danego portu
+    (odczyt jednego wiersza macierzy osiągalności PathFindera).
+    """
+    start_port = request.args.get('start')
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     # Wybieramy porty ze sprzętu, który może być celem (np. nie beczki brudne)
@@ -165,56 +173,46 @@ def get_punkty_docelowe():
     porty = cursor.fetchall()
     cursor.close()
     conn.close()
+
+    if start_port:
+        osiagalne = get_pathfinder().reachable_ports(start_port, use_valve_states=False)
+        porty = [p for p in porty if p['nazwa_portu'] in osiagalne]
     return jsonify(porty)
 
 
 
 @bp.route('/api/topologia', methods=['GET'])
 def get_topologia():
-    """Zwraca pełną listę połączeń (segmentów) do wizualizacji."""
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    
-    # To samo zapytanie, którego używa PathFinder do budowy grafu
-    query = """
-        SELECT 
-            s.id as id_segmentu,
-            s.nazwa_segmentu, 
-            z.nazwa_zaworu,
-            z.stan as stan_zaworu,
-            -- Dodajemy ID dla debugowania
-            s.id_portu_startowego, s.id_wezla_startowego,
-            s.id_portu_koncowego, s.id_wezla_koncowego,
-            COALESCE(p_start.nazwa_portu, w_start.nazwa_wezla) AS punkt_startowy,
-            COALESCE(p_koniec.nazwa_portu, w_koniec.nazwa_wezla) AS punkt_koncowy
-        FROM segmenty s
-        JOIN zawory z ON s.id_zaworu = z.id
-        LEFT JOIN porty_sprzetu p_start ON s.id_portu_startowego = p_start.id
-        LEFT JOIN wezly_rurociagu w_start ON s.id_wezla_startowego = w_start.id
-        LEFT JOIN porty_sprzetu p_koniec ON s.id_portu_koncowego = p_koniec.id
-        LEFT JOIN wezly_rurociagu w_koniec ON s.id_wezla_koncowego = w_koniec.id
     """
-    cursor.execute(query)
-    segmenty = cursor.fetchall()
-
-    # Dodatkowo, pobierzmy listę aktualnie zajętych segmentów
-    sql_zajete = """
-        SELECT s.id as id_segmentu FROM log_uzyte_segmenty lus
-        JOIN operacje_log ol ON lus.id_operacji_log = ol.id
-        JOIN segmenty s ON lus.id_segmentu = s.id
-        WHERE ol.status_operacji = 'aktywna'
+    Zwraca pełną listę połączeń (segmentów) do wizualizacji - z grafu PathFindera, bez zapytań
+    do bazy. ETag = token wersji eksportu, więc niezmieniona mapa zwraca 304 Not Modified.
     """
-    cursor.execute(sql_zajete)
-    zajete_ids = {row['id_segmentu'] for row in cursor.fetchall()}
-
-    # Dodaj informację o zajętości do każdego segmentu
-    for seg in segmenty:
-        seg['zajety'] = seg.get('id_segmentu') in zajete_ids
-
-    cursor.close()
-    conn.close()
-    return jsonify(segmenty)
+    pathfinder = get_pathfinder()
+    token = pathfinder.export_token()
+    if request.if_none_match.contains(token):
+        response = current_app.response_class(status=304)
+        response.set_etag(token)
+        return response
+
+    eksport = pathfinder.export_topology()
+    segmenty = []
+    for nazwa_segmentu, punkt_startowy, punkt_koncowy, nazwa_zaworu in eksport['segments']:
+        if not nazwa_zaworu:
+            continue
+        segmenty.append({
+            'id_segmentu': pathfinder.segments[nazwa_segmentu]['id'],
+            'nazwa_segmentu': nazwa_segmentu,
+            'nazwa_zaworu': nazwa_zaworu,
+            'stan_zaworu': eksport['valves'].get(nazwa_zaworu),
+            'punkt_startowy': punkt_startowy,
+            'punkt_koncowy': punkt_koncowy,
+            'zajety': nazwa_segmentu in eksport['occupied']
+        })
 
+    response = jsonify(segmenty)
+    response.set_etag(eksport['token'])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
 @bp.route('/api/trasy/sugeruj', methods=['POST'])
@@ -235,28 +233,21 @@ def sugeruj_trase():
     pathfinder = get_pathfinder()
     
     # WAŻNE: Do szukania "idealnej" trasy przekazujemy WSZYSTKIE zawory jako otwarte.
-    # W tym celu pobieramy ich nazwy z grafu Pathfindera.
-    wszystkie_zawory = [data['valve_name'] for u, v, data in pathfinder.graph.edges(data=True)]
+    # W tym celu pobieramy ich nazwy z indeksu Pathfindera.
+    wszystkie_zawory = pathfinder.valve_names()
     
     sciezka_segmentow = []
-    sciezka_zaworow = set() # Używamy seta, aby uniknąć duplikatów zaworów
 
     try :
         if sprzet_posredni:
-            posredni_in = f"{sprzet_posredni}_IN"
-            posredni_out = f"{sprzet_posredni}_OUT"
+            # Trasa do sprzętu pośredniego, wewnątrz niego i od niego do celu - jednym wywołaniem
+            punkty = [start_point, f"{sprzet_posredni}_IN", f"{sprzet_posredni}_OUT", end_point]
+            odcinki = pathfinder.find_route_legs(punkty, wszystkie_zawory)
 
-            # Trasa do sprzętu pośredniego
-            sciezka_1 = pathfinder.find_path(start_point, posredni_in, wszystkie_zawory)
-            # Trasa wewnątrz sprzętu pośredniego
-            sciezka_wewnetrzna = pathfinder.find_path(posredni_in, posredni_out, wszystkie_zawory)
-            # Trasa od sprzętu pośredniego do celu
-            sciezka_2 = pathfinder.find_path(posredni_out, end_point, wszystkie_zawory)
-
-            if not all([sciezka_1, sciezka_wewnetrzna, sciezka_2]):
+            if any(odcinek is None for odcinek in odcinki):
                 raise Exception("Nie można zbudować pełnej trasy przez punkt pośredni.")
 
-            sciezka_segmentow = sciezka_1 + sciezka_wewnetrzna + sciezka_2
+            sciezka_segmentow = [segment for odcinek in odcinki for segment in odcinek]
         else:
             sciezka_segmentow = pathfinder.find_path(start_point, end_point, wszystkie_zawory)
 
@@ -264,12 +255,7 @@ def sugeruj_trase():
             raise Exception("Nie znaleziono ścieżki.")
 
         # Na podstawie nazw segmentów, znajdź nazwy przypisanych do nich zaworów
-        for segment_name in sciezka_segmentow:
-            # Przeszukujemy krawędzie grafu, aby znaleźć zawór dla danego segmentu
-            for u, v, data in pathfinder.graph.edges(data=True):
-                if data['segment_name'] == segment_name:
-                    sciezka_zaworow.add(data['valve_name'])
-                    break
+        sciezka_zaworow = pathfinder.valves_for_segments(sciezka_segmentow)
         
         return jsonify({
             "status": "success",
@@ -321,7 +307,7 @@ def test_sensors():
 @bp.route('/api/pomiary/historia', methods=['GET'])
 def get_historia_pomiarow():
     """Pobiera historię pomiarów z ostatnich 24 godzin"""
-    conn = get_db_connection()
+    conn = get_db_connection(replica=True)
     cursor = conn.cursor(dictionary=True)
     
     try:
@@ -435,6 +421,7 @@ def get_filtry_status_scada():
                 temperatura_aktualna, cisnienie_aktualne, poziom_aktualny_procent,
                 temperatura_max, cisnienie_max, ostatnia_aktualizacja
             FROM sprzet 
+            LEFT JOIN sprzet_telemetria ON sprzet_telemetria.id_sprzetu = sprzet.id
             WHERE typ_sprzetu = 'filtr'
             ORDER BY nazwa_unikalna
         """)
@@ -1085,6 +1072,7 @@ def get_parametry_sprzetu():
                     ELSE 'AKTUALNE'
                 END as status_danych
             FROM sprzet 
+            LEFT JOIN sprzet_telemetria ON sprzet_telemetria.id_sprzetu = sprzet.id
             ORDER BY typ_sprzetu, nazwa_unikalna
         """)
         
@@ -1140,6 +1128,7 @@ def get_parametry_konkretnego_sprzetu(sprzet_id):
                 END as status_danych,
                 TIMESTAMPDIFF(MINUTE, ostatnia_aktualizacja, NOW()) as minuty_od_aktualizacji
             FROM sprzet 
+            LEFT JOIN sprzet_telemetria ON sprzet_telemetria.id_sprzetu = sprzet.id
             WHERE id = %s
         """, (sprzet_id,))
         
@@ -1201,6 +1190,7 @@ def get_alarmy_parametryczne():
                     ELSE 0
                 END as przekroczenie_wartosci
             FROM sprzet 
+            LEFT JOIN sprzet_telemetria ON sprzet_telemetria.id_sprzetu = sprzet.id
             WHERE 
                 (temperatura_aktualna > temperatura_max AND temperatura_aktualna IS NOT NULL)
                 OR 
@@ -1536,6 +1526,7 @@ def dashboard_view():
     return render_template('index.html')
 
 @bp.route('/api/dashboard/main-status')
+@read_replica
 def api_dashboard_status():
     """Zwraca zagregowane dane dla głównego dashboardu."""
     try:
@@ -1601,4 +1592,4 @@ def get_predefined_intervals():
         intervals = SchedulerService.get_predefined_intervals()
         return jsonify(intervals)
     except Exception as e:
-        return jsonify({'error': f'Błąd pobierania interwałów: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'Błąd pobierania interwałów: {str(e)}'}), 500
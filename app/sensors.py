@@ -33,19 +33,17 @@ class SensorService:
             return []
 
         try:
-            # Używamy UPDATE, aby zmienić tylko te dwa pola
-            stmt = db.update(Sprzet).where(
-                Sprzet.nazwa_unikalna.in_(equipment_names)
-            ).values(
-                temperatura_aktualna=temperatura,
-                ostatnia_aktualizacja=datetime.now(timezone.utc)
-            )
-            
-            # `execute` zwraca obiekt result, z którego możemy odczytać, ile wierszy zmieniono
-            result = db.session.execute(stmt)
+            # Zmieniamy tylko te dwa pola - są w sprzet_telemetria (wiersz konfiguracji `sprzet` bez zmian)
+            sprzety = db.session.execute(
+                db.select(Sprzet).where(Sprzet.nazwa_unikalna.in_(equipment_names))
+            ).scalars().all()
+            current_time = datetime.now(timezone.utc)
+            for sprzet in sprzety:
+                sprzet.temperatura_aktualna = temperatura
+                sprzet.ostatnia_aktualizacja = current_time
             db.session.commit()
             
-            print(f"Zaktualizowano `temperatura_aktualna` dla {result.rowcount} urządzeń.")
+            print(f"Zaktualizowano `temperatura_aktualna` dla {len(sprzety)} urządzeń.")
             
             # Zwracamy listę podanych nazw, aby potwierdzić, że polecenie zostało przyjęte
             # (nawet jeśli niektóre nazwy nie istniały w bazie)
@@ -113,6 +111,8 @@ class SensorService:
         - Odczytuje rzeczywisty poziom cieczy z API iPomiar.pl.
         - Symuluje zmiany temperatury dla reaktorów.
         - Zapisuje wszystkie pomiary do tabeli historia_pomiarow.
+        Bieżące wartości trafiają do małych wierszy sprzet_telemetria - cykl nie
+        modyfikuje wierszy konfiguracji w tabeli `sprzet`.
         """
         current_time = datetime.now(timezone.utc)
         print(f"\n--- SCHEDULER: Uruchamiam read_sensors o {current_time} ---")
@@ -148,7 +148,7 @@ class SensorService:
                 
                 nowe_cisnienie = self._simulate_pressure(item.typ_sprzetu)
 
-                # 3. Zaktualizuj stan obiektu `Sprzet` w pamięci sesji
+                # 3. Zaktualizuj bieżące odczyty (atrybuty Sprzet zapisują do sprzet_telemetria)
                 item.temperatura_aktualna = nowa_temperatura
                 item.cisnienie_aktualne = nowe_cisnienie
                 item.ostatnia_aktualizacja = current_time
@@ -206,15 +206,11 @@ class SensorService:
             nazwy_zaktualizowane = [s.nazwa_unikalna for s in sprzety_do_aktualizacji]
             current_time = datetime.now(timezone.utc)
 
-            # Krok 2: Użyj `update` do masowej aktualizacji w tabeli `sprzet`
-            stmt_sprzet = db.update(Sprzet).where(
-                Sprzet.id.in_(ids_do_aktualizacji)
-            ).values(
-                temperatura_aktualna=temperatura,
-                temperatura_docelowa=temperatura,
-                ostatnia_aktualizacja=current_time
-            )
-            db.session.execute(stmt_sprzet)
+            # Krok 2: Temperatura docelowa w `sprzet`, bieżący odczyt w `sprzet_telemetria`
+            for sprzet in sprzety_do_aktualizacji:
+                sprzet.temperatura_docelowa = temperatura
+                sprzet.temperatura_aktualna = temperatura
+                sprzet.ostatnia_aktualizacja = current_time
 
             # Krok 3: Dodaj wpisy do historii `operator_temperatures`
             # Robimy to w pętli, ponieważ musimy dodać osobne wiersze
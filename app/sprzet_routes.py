@@ -9,6 +9,7 @@ from .sensors import SensorService
 
 from decimal import Decimal, InvalidOperation
 from .extensions import db
+from .db import get_db_connection
 from .models import Sprzet
 from .batch_management_service import BatchManagementService
 from sqlalchemy.orm import joinedload
@@ -70,7 +71,7 @@ def get_aktualne_pomiary_sprzetu():
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     
-    # Zapytanie jest teraz bardzo proste, ponieważ wszystkie potrzebne dane są w jednej tabeli.
+    # Bieżące odczyty czujników są w sprzet_telemetria, konfiguracja w sprzet.
     query = """
         SELECT
             id,
@@ -84,6 +85,7 @@ def get_aktualne_pomiary_sprzetu():
             cisnienie_max,
             ostatnia_aktualizacja
         FROM sprzet
+        LEFT JOIN sprzet_telemetria ON sprzet_telemetria.id_sprzetu = sprzet.id
         ORDER BY typ_sprzetu, nazwa_unikalna;
     """
     
@@ -139,13 +141,21 @@ def set_temperatura(sprzet_id):
 
 @sprzet_bp.route('/dostepne-cele', methods=['GET'])
 def get_dostepne_cele():
-    """Zwraca listę wszystkich reaktorów i beczek jako potencjalnych celów transferu, używając nowego systemu TankMixes."""
+    """
+    Zwraca listę wszystkich reaktorów i beczek jako potencjalnych celów transferu, używając nowego systemu TankMixes.
+    Opcjonalny parametr `?zrodlo=<nazwa_unikalna>` zawęża listę do sprzętu osiągalnego rurociągiem ze źródła.
+    """
     try:
         sprzet_q = db.select(Sprzet).options(
             joinedload(Sprzet.active_mix)
         ).where(
             Sprzet.typ_sprzetu.in_(['reaktor', 'beczka_brudna', 'beczka_czysta'])
         ).order_by(Sprzet.typ_sprzetu, Sprzet.nazwa_unikalna)
+
+        zrodlo = request.args.get('zrodlo')
+        if zrodlo:
+            osiagalne = current_app.extensions['pathfinder'].reachable_equipment(zrodlo, use_valve_states=False)
+            sprzet_q = sprzet_q.where(Sprzet.nazwa_unikalna.in_(osiagalne))
         
         wszystkie_cele = db.session.execute(sprzet_q).scalars().unique().all()
         
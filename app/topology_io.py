@@ -0,0 +1,184 @@
+# app/topology_io.py
+"""
+Format wymiany mapy rurociągu (import/eksport hurtowy).
+
+JSON:
+    {
+      "format": "mes-topologia", "wersja": 1,
+      "zawory":   [{"nazwa_zaworu": "V1", "stan": "ZAMKNIETY"}],
+      "wezly":    [{"nazwa_wezla": "W1"}],
+      "porty":    [{"nazwa_portu": "R1_OUT", "typ_portu": "OUT", "sprzet": "R1"}],
+      "segmenty": [{"nazwa_segmentu": "SEG1", "zawor": "V1", "start": "R1_OUT", "koniec": "W1"}]
+    }
+
+CSV (jeden plik, rodzaj rekordu w pierwszej kolumnie):
+    rekord,nazwa,stan,typ_portu,sprzet,zawor,start,koniec
+    zawor,V1,ZAMKNIETY,,,,,
+    wezel,W1,,,,,,
+    port,R1_OUT,,OUT,R1,,,
+    segment,SEG1,,,,V1,R1_OUT,W1
+
+Punkty `start`/`koniec` segmentu to nazwy portów lub węzłów. Sprzęt portów musi już
+istnieć w bazie (import nie tworzy sprzętu).
+"""
+
+import csv
+import io
+import json
+
+FORMAT_NAME = 'mes-topologia'
+FORMAT_VERSION = 1
+CSV_COLUMNS = ['rekord', 'nazwa', 'stan', 'typ_portu', 'sprzet', 'zawor', 'start', 'koniec']
+VALVE_STATES = ('OTWARTY', 'ZAMKNIETY')
+PORT_TYPES = ('IN', 'OUT')
+
+
+def empty_topology():
+    return {'zawory': [], 'wezly': [], 'porty': [], 'segmenty': []}
+
+
+def parse_json(data):
+    """Normalizuje opis mapy w formacie JSON (słownik lub tekst) do list rekordów."""
+    if isinstance(data, (str, bytes)):
+        data = json.loads(data)
+    if not isinstance(data, dict):
+        raise ValueError("Opis topologii musi być obiektem JSON.")
+
+    topology = empty_topology()
+    for key in topology:
+        rows = data.get(key) or []
+        if not isinstance(rows, list):
+            raise ValueError(f"Pole '{key}' musi być listą.")
+        topology[key] = [_clean(row) for row in rows]
+    return topology
+
+
+def parse_csv(text):
+    """Normalizuje opis mapy w formacie CSV (patrz docstring modułu) do list rekordów."""
+    if isinstance(text, bytes):
+        text = text.decode('utf-8-sig')
+    topology = empty_topology()
+    for line_no, row in enumerate(csv.DictReader(io.StringIO(text)), start=2):
+        row = _clean(row)
+        rekord = (row.get('rekord') or '').lower()
+        nazwa = row.get('nazwa')
+        if rekord == 'zawor':
+            topology['zawory'].append({'nazwa_zaworu': nazwa, 'stan': row.get('stan') or 'ZAMKNIETY'})
+        elif rekord == 'wezel':
+            topology['wezly'].append({'nazwa_wezla': nazwa})
+        elif rekord == 'port':
+            topology['porty'].append({'nazwa_portu': nazwa, 'typ_portu': row.get('typ_portu'), 'sprzet': row.get('sprzet')})
+        elif rekord == 'segment':
+            topology['segmenty'].append({
+                'nazwa_segmentu': nazwa, 'zawor': row.get('zawor'),
+                'start': row.get('start'), 'koniec': row.get('koniec')
+            })
+        else:
+            raise ValueError(f"Wiersz {line_no}: nieznany rodzaj rekordu '{row.get('rekord')}'.")
+    return topology
+
+
+def _clean(row):
+    if not isinstance(row, dict):
+        raise ValueError("Każdy rekord musi być obiektem.")
+    return {key: (value.strip() or None) if isinstance(value, str) else value for key, value in row.items()}
+
+
+def validate(topology, existing):
+    """
+    Sprawdza opis mapy w pamięci, razem z tym, co już jest w bazie.
+    `existing`: {'zawory', 'wezly', 'porty', 'segmenty', 'sprzet'} - zbiory istniejących nazw.
+    Zwraca listę błędów: {'typ', 'rekord', 'nazwa', 'message'} (pusta = poprawny).
+    """
+    errors = []
+
+    def error(typ, rekord, nazwa, message):
+        errors.append({'typ': typ, 'rekord': rekord, 'nazwa': nazwa, 'message': message})
+
+    def unique_names(rows, field, rekord, existing_names):
+        seen = set()
+        for row in rows:
+            nazwa = row.get(field)
+            if not nazwa:
+                error('brak_nazwy', rekord, None, f"Rekord '{rekord}' bez nazwy ({field}).")
+            elif nazwa in seen:
+                error('duplikat', rekord, nazwa, f"Nazwa '{nazwa}' występuje w pliku więcej niż raz.")
+            elif nazwa in existing_names:
+                error('duplikat', rekord, nazwa, f"Nazwa '{nazwa}' już istnieje w bazie.")
+            seen.add(nazwa)
+        return seen
+
+    new_valves = unique_names(topology['zawory'], 'nazwa_zaworu', 'zawor', existing['zawory'])
+    new_nodes = unique_names(topology['wezly'], 'nazwa_wezla', 'wezel', existing['wezly'])
+    new_ports = unique_names(topology['porty'], 'nazwa_portu', 'port', existing['porty'])
+    unique_names(topology['segmenty'], 'nazwa_segmentu', 'segment', existing['segmenty'])
+
+    for row in topology['zawory']:
+        if (row.get('stan') or 'ZAMKNIETY') not in VALVE_STATES:
+            error('niepoprawna_wartosc', 'zawor', row.get('nazwa_zaworu'), f"Stan zaworu musi być jednym z: {', '.join(VALVE_STATES)}.")
+    for row in topology['porty']:
+        if row.get('typ_portu') not in PORT_TYPES:
+            error('niepoprawna_wartosc', 'port', row.get('nazwa_portu'), f"Typ portu musi być jednym z: {', '.join(PORT_TYPES)}.")
+        if not row.get('sprzet'):
+            error('brak_odwolania', 'port', row.get('nazwa_portu'), "Port bez sprzętu.")
+        elif row['sprzet'] not in existing['sprzet']:
+            error('brak_odwolania', 'port', row.get('nazwa_portu'), f"Sprzęt '{row['sprzet']}' nie istnieje.")
+
+    ports = new_ports | existing['porty']
+    nodes = new_nodes | existing['wezly']
+    valves = new_valves | existing['zawory']
+    for nazwa in sorted((new_ports & nodes) | (new_nodes & ports)):
+        error('duplikat', 'punkt', nazwa, f"Nazwa '{nazwa}' jest jednocześnie portem i węzłem.")
+
+    for row in topology['segmenty']:
+        nazwa = row.get('nazwa_segmentu')
+        if not row.get('zawor'):
+            error('brak_odwolania', 'segment', nazwa, "Segment bez zaworu.")
+        elif row['zawor'] not in valves:
+            error('brak_odwolania', 'segment', nazwa, f"Zawór '{row['zawor']}' nie istnieje.")
+        for field in ('start', 'koniec'):
+            punkt = row.get(field)
+            if not punkt:
+                error('brak_punktu', 'segment', nazwa, f"Segment bez punktu '{field}'.")
+            elif punkt not in ports and punkt not in nodes:
+                error('brak_odwolania', 'segment', nazwa, f"Punkt '{punkt}' nie jest znanym portem ani węzłem.")
+        if row.get('start') and row.get('start') == row.get('koniec'):
+            error('niepoprawna_wartosc', 'segment', nazwa, "Punkt startowy i końcowy segmentu są takie same.")
+    return errors
+
+
+def dump_json(records):
+    """
+    Generator fragmentów JSON dla rekordów (rodzaj, słownik) podawanych kolejno:
+    zawory, węzły, porty, segmenty - bez budowania całego dokumentu w pamięci.
+    """
+    yield json.dumps({'format': FORMAT_NAME, 'wersja': FORMAT_VERSION}, ensure_ascii=False)[:-1]
+    current = None
+    first = True
+    for key, row in records:
+        if key != current:
+            yield ('], ' if current is not None else ', ') + json.dumps(key) + ': ['
+            current, first = key, True
+        yield ('' if first else ', ') + json.dumps(row, ensure_ascii=False)
+        first = False
+    yield (']' if current is not None else '') + '}\n'
+
+
+def dump_csv(records):
+    """Generator wierszy CSV dla rekordów (rodzaj, słownik)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(CSV_COLUMNS)
+    for key, row in records:
+        if key == 'zawory':
+            writer.writerow(['zawor', row['nazwa_zaworu'], row['stan'], '', '', '', '', ''])
+        elif key == 'wezly':
+            writer.writerow(['wezel', row['nazwa_wezla'], '', '', '', '', '', ''])
+        elif key == 'porty':
+            writer.writerow(['port', row['nazwa_portu'], '', row['typ_portu'], row['sprzet'], '', '', ''])
+        else:
+            writer.writerow(['segment', row['nazwa_segmentu'], '', '', '', row['zawor'], row['start'], row['koniec']])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
@@ -5,6 +5,8 @@ import mysql.connector
 from flask import current_app, jsonify
 from datetime import datetime, timezone
 from .db import get_db_connection
+from .topology_sync import bump_topology_version
+from . import topology_io
 import json
 
 class TopologyManager:
@@ -13,6 +15,26 @@ class TopologyManager:
     def __init__(self):
         pass
     
+    def _notify_topology_changed(self, db_topology_version=None):
+        """
+        Informuje PathFinder o zmianie mapy, aby unieważnił graf i cache tras.
+        Bez numeru wersji (zmiana samego stanu zaworu) wystarczy przyrostowa aktualizacja
+        grafu otwartych krawędzi; zmianę struktury (znacznik podbity w transakcji edycji)
+        zgłasza TopologySync - graf przeładowuje nasłuch zmian, a nie żądanie edycji.
+        """
+        pathfinder = current_app.extensions.get('pathfinder')
+        if pathfinder is None:
+            return
+        if db_topology_version is None:
+            pathfinder.refresh_valve_states()
+            return
+
+        topology_sync = current_app.extensions.get('topology_sync')
+        if topology_sync is not None:
+            topology_sync.notify(db_topology_version)
+        else:
+            pathfinder.reload_if_stale(db_topology_version)
+    
     # ================== ZAWORY ==================
     
     def get_zawory(self, include_segments=False):
@@ -84,7 +106,9 @@ class TopologyManager:
                 INSERT INTO zawory (nazwa_zaworu, stan)
                 VALUES (%s, %s)
             """, (nazwa_zaworu, stan))
+            wersja = bump_topology_version(conn)
             conn.commit()
+            self._notify_topology_changed(wersja)
             return cursor.lastrowid
         finally:
             cursor.close()
@@ -113,8 +137,13 @@ class TopologyManager:
                     SET {', '.join(updates)}
                     WHERE id = %s
                 """, params)
+                zmieniono = cursor.rowcount > 0
+                # Zmiana nazwy zaworu zmienia mapę, zmiana samego stanu - tylko graf otwartych krawędzi
+                wersja = bump_topology_version(conn) if zmieniono and nazwa_zaworu is not None else None
                 conn.commit()
-                return cursor.rowcount > 0
+                if zmieniono:
+                    self._notify_topology_changed(wersja)
+                return zmieniono
             return False
         finally:
             cursor.close()
@@ -132,7 +161,9 @@ class TopologyManager:
                 return False, "Zawór jest używany w segmentach i nie może być usunięty"
             
             cursor.execute("DELETE FROM zawory WHERE id = %s", (zawor_id,))
+            wersja = bump_topology_version(conn)
             conn.commit()
+            self._notify_topology_changed(wersja)
             return True, "Zawór został usunięty"
         finally:
             cursor.close()
@@ -213,7 +244,9 @@ class TopologyManager:
                 INSERT INTO wezly_rurociagu (nazwa_wezla)
                 VALUES (%s)
             """, (nazwa_wezla,))
+            wersja = bump_topology_version(conn)
             conn.commit()
+            self._notify_topology_changed(wersja)
             return cursor.lastrowid
         finally:
             cursor.close()
@@ -229,8 +262,12 @@ class TopologyManager:
                 SET nazwa_wezla = %s
                 WHERE id = %s
             """, (nazwa_wezla, wezel_id))
+            zmieniono = cursor.rowcount > 0
+            wersja = bump_topology_version(conn) if zmieniono else None
             conn.commit()
-            return cursor.rowcount > 0
+            if zmieniono:
+                self._notify_topology_changed(wersja)
+            return zmieniono
         finally:
             cursor.close()
             conn.close()
@@ -250,7 +287,9 @@ class TopologyManager:
                 return False, "Węzeł jest używany w segmentach i nie może być usunięty"
             
             cursor.execute("DELETE FROM wezly_rurociagu WHERE id = %s", (wezel_id,))
+            wersja = bump_topology_version(conn)
             conn.commit()
+            self._notify_topology_changed(wersja)
             return True, "Węzeł został usunięty"
         finally:
             cursor.close()
@@ -334,7 +373,9 @@ class TopologyManager:
                 VALUES (%s, %s, %s, %s, %s, %s)
             """, (nazwa_segmentu, id_portu_startowego, id_wezla_startowego,
                   id_portu_koncowego, id_wezla_koncowego, id_zaworu))
+            wersja = bump_topology_version(conn)
             conn.commit()
+            self._notify_topology_changed(wersja)
             return cursor.lastrowid, "Segment został utworzony"
         finally:
             cursor.close()
@@ -363,8 +404,12 @@ class TopologyManager:
                     SET {', '.join(updates)}
                     WHERE id = %s
                 """, params)
+                zmieniono = cursor.rowcount > 0
+                wersja = bump_topology_version(conn) if zmieniono else None
                 conn.commit()
-                return cursor.rowcount > 0, "Segment został zaktualizowany"
+                if zmieniono:
+                    self._notify_topology_changed(wersja)
+                return zmieniono, "Segment został zaktualizowany"
             return False, "Brak danych do aktualizacji"
         finally:
             cursor.close()
@@ -376,8 +421,12 @@ class TopologyManager:
         cursor = conn.cursor()
         try:
             cursor.execute("DELETE FROM segmenty WHERE id = %s", (segment_id,))
+            usunieto = cursor.rowcount > 0
+            wersja = bump_topology_version(conn) if usunieto else None
             conn.commit()
-            return cursor.rowcount > 0, "Segment został usunięty"
+            if usunieto:
+                self._notify_topology_changed(wersja)
+            return usunieto, "Segment został usunięty"
         finally:
             cursor.close()
             conn.close()
@@ -418,6 +467,135 @@ class TopologyManager:
             cursor.close()
             conn.close()
     
+    # ================== IMPORT / EKSPORT HURTOWY ==================
+    
+    def _existing_names(self, cursor):
+        """Nazwy istniejących obiektów mapy: rodzaj -> {nazwa: id}."""
+        queries = {
+            'zawory': "SELECT nazwa_zaworu, id FROM zawory",
+            'wezly': "SELECT nazwa_wezla, id FROM wezly_rurociagu",
+            'porty': "SELECT nazwa_portu, id FROM porty_sprzetu",
+            'segmenty': "SELECT nazwa_segmentu, id FROM segmenty",
+            'sprzet': "SELECT nazwa_unikalna, id FROM sprzet",
+        }
+        existing = {}
+        for key, query in queries.items():
+            cursor.execute(query)
+            existing[key] = {nazwa: id_ for nazwa, id_ in cursor.fetchall() if nazwa is not None}
+        return existing
+    
+    @staticmethod
+    def _insert_many(cursor, table, columns, rows, chunk_size=500):
+        """Wstawia wiersze wielowierszowymi INSERT-ami (po `chunk_size` wierszy)."""
+        placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([placeholder] * len(chunk))}",
+                [value for row in chunk for value in row]
+            )
+    
+    def bulk_import(self, topology, dry_run=False):
+        """
+        Importuje zawory, węzły, porty i segmenty (patrz topology_io) w jednej transakcji.
+        Opis jest najpierw w całości sprawdzany w pamięci (duplikaty, brakujące odwołania
+        i punkty segmentów); przy błędach nic nie jest zapisywane.
+        Zwraca (sukces, wynik) - wynik zawiera liczby rekordów albo listę błędów.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            existing = self._existing_names(cursor)
+            errors = topology_io.validate(topology, {key: set(names) for key, names in existing.items()})
+            counts = {key: len(rows) for key, rows in topology.items()}
+            if errors:
+                return False, {'errors': errors, 'counts': counts}
+            if dry_run or not any(counts.values()):
+                return True, {'counts': counts, 'dry_run': dry_run}
+            
+            self._insert_many(cursor, 'zawory', ('nazwa_zaworu', 'stan'), [
+                (row['nazwa_zaworu'], row.get('stan') or 'ZAMKNIETY') for row in topology['zawory']
+            ])
+            self._insert_many(cursor, 'wezly_rurociagu', ('nazwa_wezla',), [
+                (row['nazwa_wezla'],) for row in topology['wezly']
+            ])
+            self._insert_many(cursor, 'porty_sprzetu', ('id_sprzetu', 'nazwa_portu', 'typ_portu'), [
+                (existing['sprzet'][row['sprzet']], row['nazwa_portu'], row['typ_portu']) for row in topology['porty']
+            ])
+            
+            # ID nowych zaworów, węzłów i portów potrzebne do segmentów
+            if topology['segmenty']:
+                ids = self._existing_names(cursor)
+                rows = []
+                for row in topology['segmenty']:
+                    start, koniec = row['start'], row['koniec']
+                    rows.append((
+                        row['nazwa_segmentu'], ids['zawory'][row['zawor']],
+                        ids['porty'].get(start), ids['wezly'].get(start) if start not in ids['porty'] else None,
+                        ids['porty'].get(koniec), ids['wezly'].get(koniec) if koniec not in ids['porty'] else None,
+                    ))
+                self._insert_many(cursor, 'segmenty', (
+                    'nazwa_segmentu', 'id_zaworu', 'id_portu_startowego', 'id_wezla_startowego',
+                    'id_portu_koncowego', 'id_wezla_koncowego'
+                ), rows)
+            
+            wersja = bump_topology_version(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+        
+        self._notify_topology_changed(wersja)
+        return True, {'counts': counts, 'dry_run': False, 'topology_version': wersja}
+    
+    def iter_topology_records(self):
+        """
+        Generator rekordów mapy (rodzaj, słownik) w kolejności: zawory, węzły, porty, segmenty.
+        Wiersze czytane są kursorem niebuforowanym, więc eksport nie trzyma całej mapy w pamięci.
+        """
+        queries = [
+            ('zawory', "SELECT nazwa_zaworu, stan FROM zawory ORDER BY nazwa_zaworu"),
+            ('wezly', "SELECT nazwa_wezla FROM wezly_rurociagu ORDER BY nazwa_wezla"),
+            ('porty', """
+                SELECT p.nazwa_portu, p.typ_portu, s.nazwa_unikalna AS sprzet
+                FROM porty_sprzetu p
+                JOIN sprzet s ON p.id_sprzetu = s.id
+                ORDER BY p.nazwa_portu
+            """),
+            ('segmenty', """
+                SELECT s.nazwa_segmentu, z.nazwa_zaworu AS zawor,
+                       COALESCE(ps_start.nazwa_portu, ws_start.nazwa_wezla) AS start,
+                       COALESCE(ps_end.nazwa_portu, ws_end.nazwa_wezla) AS koniec
+                FROM segmenty s
+                LEFT JOIN zawory z ON s.id_zaworu = z.id
+                LEFT JOIN porty_sprzetu ps_start ON s.id_portu_startowego = ps_start.id
+                LEFT JOIN porty_sprzetu ps_end ON s.id_portu_koncowego = ps_end.id
+                LEFT JOIN wezly_rurociagu ws_start ON s.id_wezla_startowego = ws_start.id
+                LEFT JOIN wezly_rurociagu ws_end ON s.id_wezla_koncowego = ws_end.id
+                ORDER BY s.nazwa_segmentu
+            """),
+        ]
+        conn = get_db_connection()
+        try:
+            for key, query in queries:
+                cursor = conn.cursor(dictionary=True, buffered=False)
+                try:
+                    cursor.execute(query)
+                    for row in cursor:
+                        yield key, row
+                finally:
+                    cursor.close()
+        finally:
+            conn.close()
+    
+    def export_topology(self, fmt='json'):
+        """Zwraca generator eksportu mapy w formacie importu ('json' lub 'csv')."""
+        records = self.iter_topology_records()
+        return topology_io.dump_csv(records) if fmt == 'csv' else topology_io.dump_json(records)
+    
     # ================== WIZUALIZACJA TOPOLOGII ==================
     
     def get_topology_graph(self):
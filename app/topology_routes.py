@@ -1,10 +1,11 @@
 # app/topology_routes.py
 # type: ignore
 
-from flask import Blueprint, jsonify, request, render_template
+from flask import Blueprint, jsonify, request, render_template, current_app, Response, stream_with_context
 from datetime import datetime, timezone
 from .topology_manager import TopologyManager
 from .pathfinder_tester import PathFinderTester
+from . import topology_io, topology_snapshots
 from .db import get_db_connection
 import time
 import json
@@ -426,6 +427,95 @@ def api_topology_graph():
             'message': f'Błąd podczas generowania grafu: {str(e)}'
         }), 500
 
+@topology_bp.route('/api/export', methods=['GET'])
+def api_topology_export():
+    """
+    API: Eksport mapy z grafu PathFindera z tokenem wersji (ETag - 304, gdy nic się nie zmieniło).
+    ?since=<token> zwraca tylko zmiany stanów zaworów i zajętości segmentów od tego tokenu
+    (albo pełny eksport z 'delta': false, gdy zmieniła się topologia).
+    """
+    try:
+        pathfinder = current_app.extensions['pathfinder']
+        token = pathfinder.export_token()
+        if request.if_none_match.contains(token):
+            response = current_app.response_class(status=304)
+            response.set_etag(token)
+            return response
+
+        since = request.args.get('since')
+        data = pathfinder.export_changes(since) if since else None
+        if data is None:
+            data = pathfinder.export_topology()
+
+        response = jsonify({
+            'success': True,
+            'data': data
+        })
+        response.set_etag(data['token'])
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Błąd podczas eksportu topologii: {str(e)}'
+        }), 500
+
+@topology_bp.route('/api/bulk/import', methods=['POST'])
+def api_bulk_import():
+    """
+    API: Import hurtowy mapy (zawory, węzły, porty, segmenty) w jednej transakcji.
+    Przyjmuje JSON w treści, CSV (text/csv) albo plik w polu 'file'; ?dry_run=1 - tylko walidacja.
+    """
+    dry_run = request.args.get('dry_run', 'false').lower() in ('true', '1', 't')
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            content = upload.read()
+            is_csv = upload.filename.lower().endswith('.csv')
+        else:
+            content = request.get_data()
+            is_csv = request.mimetype == 'text/csv'
+        topology = topology_io.parse_csv(content) if is_csv else topology_io.parse_json(content)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({
+            'success': False,
+            'message': f'Niepoprawny opis topologii: {str(e)}'
+        }), 400
+
+    try:
+        success, result = topology_manager.bulk_import(topology, dry_run=dry_run)
+        if not success:
+            return jsonify({
+                'success': False,
+                'message': f"Opis topologii zawiera {len(result['errors'])} błędów - nic nie zostało zapisane",
+                'data': result
+            }), 422
+        return jsonify({
+            'success': True,
+            'message': 'Walidacja zakończona pomyślnie' if dry_run else 'Topologia została zaimportowana',
+            'data': result
+        }), 200 if dry_run else 201
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Błąd podczas importu topologii: {str(e)}'
+        }), 500
+
+@topology_bp.route('/api/bulk/export', methods=['GET'])
+def api_bulk_export():
+    """API: Eksport mapy w formacie importu (?format=json|csv), strumieniowo"""
+    fmt = request.args.get('format', 'json').lower()
+    if fmt not in ('json', 'csv'):
+        return jsonify({
+            'success': False,
+            'message': 'Dostępne formaty: json, csv'
+        }), 400
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/json'
+    response = Response(stream_with_context(topology_manager.export_topology(fmt)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=topologia.{fmt}'
+    return response
+
 @topology_bp.route('/api/visualization/text', methods=['GET'])
 def api_topology_text():
     """API: Pobiera tekstowy opis topologii"""
@@ -512,7 +602,8 @@ def api_find_paths():
         result = pathfinder_tester.find_all_paths(
             start_point=data['start_point'],
             end_point=data['end_point'],
-            max_paths=data.get('max_paths', 5)
+            max_paths=data.get('max_paths', 5),
+            rank_by=data.get('rank_by', 'hops')
         )
         
         execution_time = int((time.time() - start_time) * 1000)
@@ -522,7 +613,7 @@ def api_find_paths():
             test_type='find_paths',
             start_point=data['start_point'],
             end_point=data['end_point'],
-            test_parameters={'max_paths': data.get('max_paths', 5)},
+            test_parameters={'max_paths': data.get('max_paths', 5), 'rank_by': data.get('rank_by', 'hops')},
             result=result,
             success=result.get('count', 0) > 0,
             execution_time_ms=execution_time
@@ -539,6 +630,63 @@ def api_find_paths():
             'message': f'Błąd podczas wyszukiwania ścieżek: {str(e)}'
         }), 500
 
+@topology_bp.route('/api/pathfinder/bulk', methods=['POST'])
+def api_pathfinder_bulk():
+    """
+    API: Wyznacza trasy dla wielu par punktów w jednym żądaniu.
+    Oczekuje JSON: {"pairs": [{"start_point": "...", "end_point": "..."}, ...],
+                    "open_valves": [...] (opcjonalnie), "all_valves": false}
+    """
+    data = request.get_json()
+    if not data or not isinstance(data.get('pairs'), list):
+        return jsonify({
+            'success': False,
+            'message': 'Wymagane pole: pairs (lista par start_point/end_point)'
+        }), 400
+
+    try:
+        pairs = [
+            (p['start_point'], p['end_point']) if isinstance(p, dict) else (p[0], p[1])
+            for p in data['pairs']
+        ]
+    except (KeyError, IndexError, TypeError):
+        return jsonify({
+            'success': False,
+            'message': 'Każda para musi zawierać start_point i end_point'
+        }), 400
+
+    start_time = time.time()
+
+    try:
+        pathfinder = current_app.extensions['pathfinder']
+        open_valves = data.get('open_valves')
+        if data.get('all_valves'):
+            open_valves = pathfinder.valve_names()
+
+        results = pathfinder.find_paths_bulk(pairs, open_valves=open_valves)
+
+        execution_time = int((time.time() - start_time) * 1000)
+
+        return jsonify({
+            'success': True,
+            'data': [
+                {
+                    'start_point': start,
+                    'end_point': end,
+                    'available': path is not None,
+                    'path': path,
+                    'path_length': len(path) if path is not None else 0
+                }
+                for (start, end), path in results.items()
+            ],
+            'execution_time_ms': execution_time
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Błąd podczas wyznaczania tras: {str(e)}'
+        }), 500
+
 @topology_bp.route('/api/pathfinder/simulate-valves', methods=['POST'])
 def api_simulate_valves():
     """API: Symuluje zmiany stanów zaworów"""
@@ -580,11 +728,12 @@ def api_simulate_valves():
 
 @topology_bp.route('/api/pathfinder/critical-valves', methods=['GET'])
 def api_critical_valves():
-    """API: Analizuje krytyczne zawory"""
+    """API: Analizuje krytyczne zawory (?all_valves=1 - jakby wszystkie zawory były otwarte)"""
     start_time = time.time()
+    all_valves = request.args.get('all_valves', 'false').lower() in ('true', '1', 't')
     
     try:
-        result = pathfinder_tester.analyze_critical_valves()
+        result = pathfinder_tester.analyze_critical_valves(use_valve_states=not all_valves)
         
         execution_time = int((time.time() - start_time) * 1000)
         
@@ -599,6 +748,138 @@ def api_critical_valves():
             'message': f'Błąd podczas analizy krytycznych zaworów: {str(e)}'
         }), 500
 
+@topology_bp.route('/api/pathfinder/cache-stats', methods=['GET'])
+def api_pathfinder_cache_stats():
+    """API: Statystyki cache tras PathFinder"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': current_app.extensions['pathfinder'].get_cache_stats()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Błąd podczas pobierania statystyk cache: {str(e)}'
+        }), 500
+
+@topology_bp.route('/api/resilience', methods=['GET'])
+def api_resilience():
+    """API: Minimalne przekroje między klasami sprzętu (liczone w tle raz na wersję topologii)"""
+    try:
+        pathfinder = current_app.extensions['pathfinder']
+        if not pathfinder.resilience_enabled:
+            return jsonify({
+                'success': False,
+                'message': 'Raport odporności jest wyłączony (PATHFINDER_RESILIENCE).'
+            }), 503
+
+        report = pathfinder.resilience_report()
+        if report is None:
+            return jsonify({
+                'success': True,
+                'pending': True,
+                'topology_version': pathfinder.topology_version,
+                'topology_hash': pathfinder.topology_hash,
+                'message': 'Raport odporności jest przeliczany, spróbuj ponownie za chwilę.'
+            }), 202
+
+        return jsonify({
+            'success': True,
+            'pending': False,
+            'data': report
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Błąd podczas pobierania raportu odporności: {str(e)}'
+        }), 500
+
+@topology_bp.route('/api/snapshots', methods=['GET'])
+def api_topology_snapshots():
+    """API: Lista migawek struktury mapy (od najnowszej) i skrót bieżącej"""
+    try:
+        pathfinder = current_app.extensions['pathfinder']
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        return jsonify({
+            'success': True,
+            'current': pathfinder.topology_hash,
+            'data': topology_snapshots.list_snapshots(limit)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Błąd podczas pobierania migawek topologii: {str(e)}'
+        }), 500
+
+@topology_bp.route('/api/snapshots/<snapshot_hash>', methods=['GET'])
+def api_topology_snapshot(snapshot_hash):
+    """API: Treść migawki (pełny skrót lub jego prefiks, 'current' - bieżąca struktura)"""
+    try:
+        found = _find_snapshot(snapshot_hash)
+        if found is None:
+            return jsonify({
+                'success': False,
+                'message': f'Migawka {snapshot_hash} nie istnieje'
+            }), 404
+        content_hash, snapshot = found
+        response = jsonify({
+            'success': True,
+            'hash': content_hash,
+            'data': snapshot
+        })
+        # Migawki są niezmienne - skrót jest naturalnym ETagiem
+        response.set_etag(content_hash)
+        return response
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Błąd podczas pobierania migawki topologii: {str(e)}'
+        }), 500
+
+@topology_bp.route('/api/snapshots/diff', methods=['GET'])
+def api_topology_snapshots_diff():
+    """
+    API: Różnica struktury między migawkami ?from=<skrót>&to=<skrót> (domyślnie to=current):
+    dodane, usunięte i zmienione porty, węzły i segmenty (także zmiana przypisanego zaworu).
+    """
+    try:
+        old_hash = request.args.get('from')
+        if not old_hash:
+            return jsonify({'success': False, 'message': 'Brak wymaganego parametru: from'}), 400
+
+        found = {}
+        for key, value in (('from', old_hash), ('to', request.args.get('to', 'current'))):
+            found[key] = _find_snapshot(value)
+            if found[key] is None:
+                return jsonify({
+                    'success': False,
+                    'message': f'Migawka {value} nie istnieje'
+                }), 404
+
+        (from_hash, old), (to_hash, new) = found['from'], found['to']
+        return jsonify({
+            'success': True,
+            'from': from_hash,
+            'to': to_hash,
+            'data': topology_snapshots.diff_snapshots(old, new)
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Błąd podczas porównywania migawek topologii: {str(e)}'
+        }), 500
+
+def _find_snapshot(snapshot_hash):
+    """(skrót, migawka) - bieżąca z pamięci PathFindera albo zapisana w bazie."""
+    pathfinder = current_app.extensions['pathfinder']
+    if snapshot_hash == 'current' or (pathfinder.topology_hash and snapshot_hash == pathfinder.topology_hash):
+        return pathfinder.topology_hash, pathfinder.snapshot
+    return topology_snapshots.load_snapshot(snapshot_hash)
+
 @topology_bp.route('/api/pathfinder/history', methods=['GET'])
 def api_pathfinder_history():
     """API: Pobiera historię testów PathFinder"""
@@ -706,73 +987,68 @@ def api_get_sprzet_ports(sprzet_id):
 
 @topology_bp.route('/api/health-check', methods=['GET'])
 def api_health_check():
-    """API: Sprawdza stan zdrowia topologii i wykrywa problemy"""
+    """API: Sprawdza stan zdrowia topologii i wykrywa problemy (z grafu PathFindera, bez zapytań do bazy)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        health = current_app.extensions['pathfinder'].topology_health()
         
         health_issues = []
         warnings = []
+        info = []
         
-        # Sprawdź zawory bez segmentów
-        cursor.execute("""
-            SELECT z.nazwa_zaworu 
-            FROM zawory z 
-            LEFT JOIN segmenty s ON z.id = s.id_zaworu 
-            WHERE s.id IS NULL
-        """)
-        orphaned_valves = cursor.fetchall()
-        if orphaned_valves:
-            warnings.append({
-                'type': 'orphaned_valves',
-                'message': f'Znaleziono {len(orphaned_valves)} zaworów bez segmentów',
-                'items': [v['nazwa_zaworu'] for v in orphaned_valves]
-            })
-        
-        # Sprawdź segmenty bez zaworów
-        cursor.execute("""
-            SELECT s.nazwa_segmentu 
-            FROM segmenty s 
-            LEFT JOIN zawory z ON s.id_zaworu = z.id 
-            WHERE z.id IS NULL
-        """)
-        segments_without_valves = cursor.fetchall()
-        if segments_without_valves:
+        if health['segments_without_valves']:
             health_issues.append({
                 'type': 'segments_without_valves',
-                'message': f'Znaleziono {len(segments_without_valves)} segmentów bez zaworów',
-                'items': [s['nazwa_segmentu'] for s in segments_without_valves]
+                'message': f"Znaleziono {len(health['segments_without_valves'])} segmentów bez zaworów",
+                'items': health['segments_without_valves']
             })
-        
-        # Sprawdź węzły bez połączeń
-        cursor.execute("""
-            SELECT w.nazwa_wezla 
-            FROM wezly_rurociagu w 
-            LEFT JOIN segmenty s1 ON w.id = s1.id_wezla_startowego 
-            LEFT JOIN segmenty s2 ON w.id = s2.id_wezla_koncowego 
-            WHERE s1.id IS NULL AND s2.id IS NULL
-        """)
-        isolated_nodes = cursor.fetchall()
-        if isolated_nodes:
+        if health['segments_without_endpoints']:
+            health_issues.append({
+                'type': 'segments_without_endpoints',
+                'message': f"Znaleziono {len(health['segments_without_endpoints'])} segmentów bez punktu początkowego lub końcowego",
+                'items': health['segments_without_endpoints']
+            })
+        if health['orphaned_valves']:
+            warnings.append({
+                'type': 'orphaned_valves',
+                'message': f"Znaleziono {len(health['orphaned_valves'])} zaworów bez segmentów",
+                'items': health['orphaned_valves']
+            })
+        if health['isolated_nodes']:
             warnings.append({
                 'type': 'isolated_nodes',
-                'message': f'Znaleziono {len(isolated_nodes)} izolowanych węzłów',
-                'items': [n['nazwa_wezla'] for n in isolated_nodes]
+                'message': f"Znaleziono {len(health['isolated_nodes'])} izolowanych węzłów",
+                'items': [n['nazwa_wezla'] for n in health['isolated_nodes']]
             })
-        
-        # Sprawdź sprzęt bez portów
-        cursor.execute("""
-            SELECT s.nazwa_unikalna 
-            FROM sprzet s 
-            LEFT JOIN porty_sprzetu p ON s.id = p.id_sprzetu 
-            WHERE p.id IS NULL
-        """)
-        equipment_without_ports = cursor.fetchall()
-        if equipment_without_ports:
+        if health['equipment_without_ports']:
             warnings.append({
                 'type': 'equipment_without_ports',
-                'message': f'Znaleziono {len(equipment_without_ports)} sprzętów bez portów',
-                'items': [e['nazwa_unikalna'] for e in equipment_without_ports]
+                'message': f"Znaleziono {len(health['equipment_without_ports'])} sprzętów bez portów",
+                'items': health['equipment_without_ports']
+            })
+        if health['unreachable_equipment']:
+            warnings.append({
+                'type': 'unreachable_equipment',
+                'message': f"Znaleziono {len(health['unreachable_equipment'])} sprzętów bez dopływu lub odpływu do innego sprzętu",
+                'items': health['unreachable_equipment']
+            })
+        if len(health['components']) > 1:
+            warnings.append({
+                'type': 'disconnected_components',
+                'message': f"Instalacja składa się z {len(health['components'])} niepołączonych części",
+                'items': [c['equipment'] or c['nodes'] for c in health['components']]
+            })
+        if health['dead_end_nodes']:
+            info.append({
+                'type': 'dead_end_nodes',
+                'message': f"Znaleziono {len(health['dead_end_nodes'])} węzłów z jednym połączeniem",
+                'items': [n['nazwa_wezla'] for n in health['dead_end_nodes']]
+            })
+        if health['cycles']:
+            # Obiegi (np. praca "w koło") są zamierzone - tylko informacja
+            info.append({
+                'type': 'directed_cycles',
+                'message': f"Znaleziono {len(health['cycles'])} obiegów zamkniętych w grafie",
+                'items': health['cycles']
             })
         
         # Oblicz ogólny stan zdrowia
@@ -789,9 +1065,6 @@ def api_health_check():
             status = 'healthy'
             status_message = 'Topologia w dobrym stanie'
         
-        cursor.close()
-        conn.close()
-        
         return jsonify({
             'success': True,
             'data': {
@@ -799,10 +1072,13 @@ def api_health_check():
                 'message': status_message,
                 'issues': health_issues,
                 'warnings': warnings,
+                'info': info,
                 'summary': {
                     'total_issues': total_issues,
                     'total_warnings': total_warnings,
-                    'checked_at': datetime.now(timezone.utc).isoformat()
+                    'counts': health['counts'],
+                    'topology_version': health['version'],
+                    'checked_at': health['analyzed_at']
                 }
             }
         })
@@ -815,49 +1091,20 @@ def api_health_check():
 
 @topology_bp.route('/api/isolated-nodes', methods=['GET'])
 def api_isolated_nodes():
-    """API: Znajduje izolowane węzły w topologii"""
+    """API: Znajduje izolowane węzły i martwe końce w topologii"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Znajdź węzły bez połączeń
-        cursor.execute("""
-            SELECT w.id, w.nazwa_wezla, w.opis,
-                   COUNT(s1.id) + COUNT(s2.id) as connections_count
-            FROM wezly_rurociagu w 
-            LEFT JOIN segmenty s1 ON w.id = s1.id_wezla_startowego 
-            LEFT JOIN segmenty s2 ON w.id = s2.id_wezla_koncowego 
-            GROUP BY w.id, w.nazwa_wezla, w.opis
-            HAVING connections_count = 0
-            ORDER BY w.nazwa_wezla
-        """)
-        isolated_nodes = cursor.fetchall()
-        
-        # Znajdź węzły z tylko jednym połączeniem (martwe końce)
-        cursor.execute("""
-            SELECT w.id, w.nazwa_wezla, w.opis,
-                   COUNT(s1.id) + COUNT(s2.id) as connections_count
-            FROM wezly_rurociagu w 
-            LEFT JOIN segmenty s1 ON w.id = s1.id_wezla_startowego 
-            LEFT JOIN segmenty s2 ON w.id = s2.id_wezla_koncowego 
-            GROUP BY w.id, w.nazwa_wezla, w.opis
-            HAVING connections_count = 1
-            ORDER BY w.nazwa_wezla
-        """)
-        dead_end_nodes = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        health = current_app.extensions['pathfinder'].topology_health()
         
         return jsonify({
             'success': True,
             'data': {
-                'isolated_nodes': isolated_nodes,
-                'dead_end_nodes': dead_end_nodes,
+                'isolated_nodes': health['isolated_nodes'],
+                'dead_end_nodes': health['dead_end_nodes'],
                 'summary': {
-                    'isolated_count': len(isolated_nodes),
-                    'dead_end_count': len(dead_end_nodes),
-                    'analyzed_at': datetime.now(timezone.utc).isoformat()
+                    'isolated_count': len(health['isolated_nodes']),
+                    'dead_end_count': len(health['dead_end_nodes']),
+                    'topology_version': health['version'],
+                    'analyzed_at': health['analyzed_at']
                 }
             }
         })
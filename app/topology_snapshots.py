@@ -0,0 +1,175 @@
+# app/topology_snapshots.py
+"""
+Migawki struktury mapy rurociągu (porty ze sprzętem, węzły, segmenty z przypisanymi zaworami).
+
+Migawka to kanoniczny słownik, którego skrót SHA-256 identyfikuje strukturę mapy
+niezależnie od ID w bazie i kolejności wierszy. PathFinder liczy ją przy każdym
+wczytaniu topologii i zapisuje w tabeli `topologia_snapshoty`, jeśli takiej struktury
+jeszcze nie było (wiersze nie są nigdy modyfikowane). Stany zaworów i zajętość
+segmentów nie wchodzą do migawki - to stan pracy, a nie struktura.
+
+Porównanie dwóch migawek opiera się na zbiorach rekordów (nazwa, zawartość), więc
+kosztuje O(n) niezależnie od liczby zmian.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from sqlalchemy.exc import IntegrityError
+from .extensions import db
+from .models import TopologiaSnapshot
+
+SNAPSHOT_FORMAT = 1
+# Pola rekordów migawki (w tej kolejności zapisywane są listy wartości)
+RECORD_FIELDS = {
+    'porty': ('typ_portu', 'sprzet', 'typ_sprzetu'),
+    'segmenty': ('start', 'koniec', 'zawor'),
+}
+
+
+def build_snapshot(ports, junctions, segments):
+    """
+    Buduje migawkę z indeksów PathFindera: `ports` {nazwa: {typ, sprzet, typ_sprzetu}},
+    `junctions` {nazwa: id}, `segments` {nazwa: {start, end, valve_name, ...}}.
+    """
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'porty': {nazwa: [port['typ'], port['sprzet'], port['typ_sprzetu']] for nazwa, port in ports.items()},
+        'wezly': sorted(junctions),
+        'segmenty': {
+            nazwa: [segment['start'], segment['end'], segment['valve_name']]
+            for nazwa, segment in segments.items()
+        },
+    }
+
+
+def snapshot_hash(snapshot):
+    """Skrót SHA-256 kanonicznej postaci JSON migawki (klucze posortowane)."""
+    canonical = json.dumps(snapshot, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _records(snapshot, kind):
+    """Rekordy danego rodzaju jako słownik nazwa -> krotka wartości (węzły nie mają wartości)."""
+    if kind == 'wezly':
+        return {nazwa: () for nazwa in snapshot.get('wezly', ())}
+    return {nazwa: tuple(values) for nazwa, values in snapshot.get(kind, {}).items()}
+
+
+def diff_snapshots(old, new):
+    """
+    Różnica struktury między migawkami: dla portów, węzłów i segmentów listy dodanych,
+    usuniętych i zmienionych rekordów (zmienione - z wartościami przed i po oraz listą pól).
+    """
+    diff = {}
+    for kind in ('porty', 'wezly', 'segmenty'):
+        before, after = _records(old, kind), _records(new, kind)
+        # Rekordy różniące się nazwą lub zawartością - jedna różnica symetryczna zbiorów
+        differing = set(before.items()) ^ set(after.items())
+        names = {nazwa for nazwa, _ in differing}
+        fields = RECORD_FIELDS.get(kind, ())
+
+        added, removed, changed = [], [], []
+        for nazwa in sorted(names):
+            if nazwa not in before:
+                added.append(_as_record(nazwa, after[nazwa], fields))
+            elif nazwa not in after:
+                removed.append(_as_record(nazwa, before[nazwa], fields))
+            else:
+                changed.append({
+                    'nazwa': nazwa,
+                    'przed': dict(zip(fields, before[nazwa])),
+                    'po': dict(zip(fields, after[nazwa])),
+                    'pola': [field for field, a, b in zip(fields, before[nazwa], after[nazwa]) if a != b],
+                })
+        diff[kind] = {'dodane': added, 'usuniete': removed, 'zmienione': changed}
+
+    diff['bez_zmian'] = not any(
+        entry['dodane'] or entry['usuniete'] or entry['zmienione'] for entry in diff.values()
+    )
+    return diff
+
+
+def _as_record(nazwa, values, fields):
+    return dict(zip(fields, values), nazwa=nazwa)
+
+
+def summarize(snapshot):
+    return {
+        'porty': len(snapshot.get('porty', {})),
+        'wezly': len(snapshot.get('wezly', ())),
+        'segmenty': len(snapshot.get('segmenty', {})),
+    }
+
+
+# ================== ZAPIS / ODCZYT ==================
+
+def store_snapshot(snapshot, content_hash, db_topology_version):
+    """
+    Zapisuje migawkę, jeśli tej struktury jeszcze nie ma w bazie. Zwraca True, gdy
+    dodano nowy wiersz. Kilka procesów może wczytać tę samą wersję jednocześnie -
+    unikalny indeks na skrócie rozstrzyga, który z nich zapisze migawkę.
+    """
+    exists = db.session.execute(
+        db.select(TopologiaSnapshot.id).where(TopologiaSnapshot.hash_sha256 == content_hash)
+    ).first()
+    if exists:
+        return False
+
+    counts = summarize(snapshot)
+    db.session.add(TopologiaSnapshot(
+        hash_sha256=content_hash,
+        wersja_topologii=db_topology_version,
+        liczba_portow=counts['porty'],
+        liczba_wezlow=counts['wezly'],
+        liczba_segmentow=counts['segmenty'],
+        dane=snapshot,
+        utworzono_at=datetime.now(timezone.utc).replace(tzinfo=None),
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+
+def list_snapshots(limit=50):
+    """Zwraca metadane ostatnich migawek (bez treści), od najnowszej."""
+    rows = db.session.execute(
+        db.select(
+            TopologiaSnapshot.id, TopologiaSnapshot.hash_sha256, TopologiaSnapshot.wersja_topologii,
+            TopologiaSnapshot.liczba_portow, TopologiaSnapshot.liczba_wezlow, TopologiaSnapshot.liczba_segmentow,
+            TopologiaSnapshot.utworzono_at
+        ).order_by(TopologiaSnapshot.id.desc()).limit(limit)
+    ).all()
+    return [{
+        'id': row.id,
+        'hash': row.hash_sha256,
+        'wersja_topologii': row.wersja_topologii,
+        'porty': row.liczba_portow,
+        'wezly': row.liczba_wezlow,
+        'segmenty': row.liczba_segmentow,
+        'utworzono_at': row.utworzono_at.isoformat() if row.utworzono_at else None,
+    } for row in rows]
+
+
+def load_snapshot(hash_prefix):
+    """
+    Zwraca (skrót, migawka) dla pełnego skrótu lub jego jednoznacznego prefiksu
+    (min. 8 znaków), albo None. Przy niejednoznacznym prefiksie zgłasza ValueError.
+    """
+    hash_prefix = (hash_prefix or '').lower()
+    if len(hash_prefix) < 8:
+        raise ValueError("Skrót migawki musi mieć co najmniej 8 znaków.")
+
+    rows = db.session.execute(
+        db.select(TopologiaSnapshot.hash_sha256, TopologiaSnapshot.dane)
+        .where(TopologiaSnapshot.hash_sha256.startswith(hash_prefix, autoescape=True))
+        .limit(2)
+    ).all()
+    if not rows:
+        return None
+    if len(rows) > 1:
+        raise ValueError(f"Skrót '{hash_prefix}' pasuje do więcej niż jednej migawki.")
+    return rows[0].hash_sha256, rows[0].dane
@@ -0,0 +1,166 @@
+# app/topology_sync.py
+"""
+Synchronizacja mapy rurociągu między procesami (gunicorn, worker i beat Celery).
+
+Każda zmiana topologii podbija znacznik w tabeli `topologia_wersja` (w tej samej
+transakcji co zmiana) i publikuje komunikat na kanale Redis. Każdy proces nasłuchuje
+kanału w wątku w tle i przeładowuje swój PathFinder, gdy znacznik w bazie jest nowszy
+od wczytanego. Okresowy odczyt znacznika z bazy zabezpiecza przed zgubionymi komunikatami
+(np. przy chwilowym braku połączenia z Redisem); przy tym samym odczycie odświeżane
+są też stany zaworów i lista segmentów zajętych przez aktywne operacje - zmiany
+wykonane w innych procesach (lub wprost w bazie) nie trafiają inaczej do grafu.
+"""
+
+import json
+import os
+import threading
+import time
+
+TOPOLOGY_CHANNEL = 'mes:topologia'
+
+
+def bump_topology_version(conn):
+    """
+    Podbija znacznik wersji topologii w bazie. Wywoływać na połączeniu transakcji,
+    która zmienia mapę (przed commit), aby znacznik i zmiana zapisały się razem.
+    Używa osobnego kursora, więc nie nadpisuje rowcount/lastrowid kursora wywołującego.
+    Zwraca nowy numer wersji.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO topologia_wersja (id, wersja, zmieniono_at)
+            VALUES (1, 1, UTC_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE wersja = wersja + 1, zmieniono_at = UTC_TIMESTAMP()
+        """)
+        cursor.execute("SELECT wersja FROM topologia_wersja WHERE id = 1")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+class TopologySync:
+    def __init__(self, app=None):
+        self.app = None
+        self.redis_url = None
+        self.poll_seconds = 30
+        self._redis = None
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Uruchamia nasłuch zmian topologii (o ile nie jest wyłączony w konfiguracji)."""
+        self.app = app
+        self.redis_url = app.config.get('REDIS_URL')
+        self.poll_seconds = app.config.get('PATHFINDER_TOPOLOGY_POLL_SECONDS', self.poll_seconds)
+
+        if not app.config.get('PATHFINDER_HOT_RELOAD', True) or app.testing:
+            print("INFO: Przeładowanie topologii między procesami wyłączone.")
+            return
+
+        self.start()
+        # Worker Celery (prefork) tworzy procesy potomne przez fork - wątki nie są dziedziczone
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart_after_fork)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name='topology-sync', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _restart_after_fork(self):
+        self._redis = None
+        self._thread = None
+        self.start()
+
+    def _get_redis(self):
+        if not self.redis_url:
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def notify(self, db_topology_version):
+        """
+        Zgłasza zmianę topologii zapisaną w tym procesie. Przy działającym nasłuchu
+        wystarczy komunikat - graf przeładowuje nasłuch (także w tym procesie, bo
+        subskrybuje ten sam kanał), więc żądanie edycji nie czeka na budowę grafu.
+        Bez nasłuchu (testy, PATHFINDER_HOT_RELOAD=False, brak Redisa) przeładowuje od razu.
+        """
+        if self.publish(db_topology_version) and self._thread is not None and self._thread.is_alive():
+            return
+        self._pathfinder().reload_if_stale(db_topology_version)
+
+    def publish(self, db_topology_version):
+        """Powiadamia procesy nasłuchujące o nowej wersji topologii. Zwraca True, jeśli komunikat wysłano."""
+        try:
+            client = self._get_redis()
+            if client is None:
+                return False
+            client.publish(TOPOLOGY_CHANNEL, json.dumps({
+                'wersja': db_topology_version,
+                'pid': os.getpid()
+            }))
+            return True
+        except Exception as e:
+            # Brak Redisa nie może blokować edycji mapy - pozostałe procesy dogonią przez odczyt z bazy
+            print(f"WARNING: Nie udało się opublikować zmiany topologii: {e}")
+            return False
+
+    def _listen(self):
+        print(f"INFO: [PID: {os.getpid()}] Start nasłuchu zmian topologii (Redis: {bool(self.redis_url)}, co {self.poll_seconds}s z bazy).")
+        pubsub = None
+        last_poll = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if pubsub is None and self.redis_url:
+                    pubsub = self._get_redis().pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(TOPOLOGY_CHANNEL)
+
+                message = None
+                if pubsub is not None:
+                    message = pubsub.get_message(timeout=self.poll_seconds)
+                else:
+                    self._stop.wait(self.poll_seconds)
+
+                if message and message.get('type') == 'message':
+                    payload = json.loads(message['data'])
+                    self._pathfinder().reload_if_stale(payload.get('wersja'))
+                elif time.monotonic() - last_poll >= self.poll_seconds:
+                    last_poll = time.monotonic()
+                    self.poll()
+            except Exception as e:
+                print(f"WARNING: Błąd nasłuchu zmian topologii: {e}")
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+                pubsub = None
+                self._redis = None
+                self._stop.wait(5)
+
+    def poll(self):
+        """
+        Okresowy odczyt z bazy: przeładowanie przy nowszym znaczniku topologii, a bez niego
+        stany zaworów i zajętość segmentów zmienione przez inne procesy (workery gunicorna,
+        Celery, ręczne zmiany w bazie). Wywoływane z wątku nasłuchu.
+        """
+        pathfinder = self._pathfinder()
+        if pathfinder.reload_if_stale():
+            return
+        with self.app.app_context():
+            pathfinder.refresh_valve_states()
+            # Operacje rozpoczęte/zakończone w innych procesach - zajętość segmentów
+            pathfinder.refresh_occupancy()
+
+    def _pathfinder(self):
+        return self.app.extensions['pathfinder']
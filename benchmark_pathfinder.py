@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Benchmark PathFindera na syntetycznych topologiach instalacji.
+
+Generuje mapy o zadanej liczbie segmentów (sprzęt z portami IN/OUT, kolektory
+w wezly_rurociagu z wieloma dopływami i odpływami, jak obecne kolektory),
+zapisuje je do bazy i mierzy:
+- czas `_load_topology` i czas do gotowej macierzy osiągalności,
+- czasy `find_path` (p50/p99, bez cache i z cache),
+- pamięć procesu (RSS) przed i po wczytaniu topologii,
+- czas analizy krytycznych zaworów i raportu odporności (do `--max-analysis-segments`).
+
+Każdy rozmiar liczony jest w osobnym procesie, więc pomiar pamięci nie zależy
+od poprzednich rozmiarów. Wyniki zapisywane są do JSON, aby porównywać kolejne przebiegi.
+
+Użycie:
+    python benchmark_pathfinder.py                                  # SQLite w katalogu tymczasowym
+    python benchmark_pathfinder.py --sizes 100,1000,10000,100000 --backends networkx,csr
+    python benchmark_pathfinder.py --database-url mysql+mysqlconnector://root:@localhost/mes_bench --reset
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import multiprocessing
+
+# Tabele potrzebne PathFinderowi do wczytania topologii i zajętości segmentów
+TOPOLOGY_TABLES = [
+    'sprzet', 'porty_sprzetu', 'wezly_rurociagu', 'zawory', 'segmenty',
+    'operacje_log', 'log_uzyte_segmenty', 'topologia_wersja'
+]
+
+# Udział typów sprzętu w syntetycznej instalacji
+EQUIPMENT_TYPES = [
+    ('apollo', 1), ('reaktor', 4), ('filtr', 2), ('beczka_brudna', 3), ('beczka_czysta', 3)
+]
+
+
+def generate_plant(segment_count, seed=0):
+    """
+    Generuje syntetyczną topologię o dokładnie `segment_count` segmentach.
+    Zwraca słownik wierszy dla tabel: sprzet, porty_sprzetu, wezly_rurociagu, zawory, segmenty.
+
+    Każdy sprzęt ma port IN i OUT. Porty OUT spływają do kolektorów, kolektory zasilają
+    porty IN, a sąsiednie kolektory są połączone w obu kierunkach (magistrala).
+    Co 50. zawór steruje dwoma segmentami (jak zawory wielodrogowe).
+    """
+    rng = random.Random(seed)
+    equipment_count = max(5, segment_count // 20)
+    collector_count = max(2, segment_count // 40)
+
+    types = [typ for typ, waga in EQUIPMENT_TYPES for _ in range(waga)]
+    sprzet, porty, wezly = [], [], []
+    out_ports, in_ports = [], []
+    for i in range(equipment_count):
+        typ = types[i % len(types)]
+        sprzet.append({'id': i + 1, 'nazwa_unikalna': f"S{i + 1}", 'typ_sprzetu': typ})
+        porty.append({'id': 2 * i + 1, 'id_sprzetu': i + 1, 'nazwa_portu': f"S{i + 1}_IN", 'typ_portu': 'IN'})
+        porty.append({'id': 2 * i + 2, 'id_sprzetu': i + 1, 'nazwa_portu': f"S{i + 1}_OUT", 'typ_portu': 'OUT'})
+        in_ports.append(2 * i + 1)
+        out_ports.append(2 * i + 2)
+    for k in range(collector_count):
+        wezly.append({'id': k + 1, 'nazwa_wezla': f"K{k + 1}"})
+
+    # (rodzaj_startu, id_startu, rodzaj_końca, id_końca) - rodzaj: 'port' lub 'wezel'
+    links = []
+    for port_id in out_ports:
+        links.append(('port', port_id, 'wezel', rng.randint(1, collector_count)))
+    for port_id in in_ports:
+        links.append(('wezel', rng.randint(1, collector_count), 'port', port_id))
+    for k in range(1, collector_count):
+        links.append(('wezel', k, 'wezel', k + 1))
+        links.append(('wezel', k + 1, 'wezel', k))
+    del links[segment_count:]
+
+    # Pozostałe segmenty: dodatkowe dopływy/odpływy kolektorów i obejścia między kolektorami
+    while len(links) < segment_count:
+        roll = rng.random()
+        if roll < 0.4:
+            links.append(('port', rng.choice(out_ports), 'wezel', rng.randint(1, collector_count)))
+        elif roll < 0.8:
+            links.append(('wezel', rng.randint(1, collector_count), 'port', rng.choice(in_ports)))
+        else:
+            a, b = rng.sample(range(1, collector_count + 1), 2)
+            links.append(('wezel', a, 'wezel', b))
+
+    zawory, segmenty = [], []
+    for i, (start_kind, start_id, end_kind, end_id) in enumerate(links):
+        if i % 50 == 49:
+            valve_id = zawory[-1]['id']
+        else:
+            valve_id = len(zawory) + 1
+            zawory.append({
+                'id': valve_id,
+                'nazwa_zaworu': f"V{valve_id}",
+                'stan': 'OTWARTY' if rng.random() < 0.8 else 'ZAMKNIETY'
+            })
+        segmenty.append({
+            'id': i + 1,
+            'nazwa_segmentu': f"SEG{i + 1}",
+            'id_zaworu': valve_id,
+            'id_portu_startowego': start_id if start_kind == 'port' else None,
+            'id_wezla_startowego': start_id if start_kind == 'wezel' else None,
+            'id_portu_koncowego': end_id if end_kind == 'port' else None,
+            'id_wezla_koncowego': end_id if end_kind == 'wezel' else None,
+        })
+
+    return {
+        'sprzet': sprzet, 'porty_sprzetu': porty, 'wezly_rurociagu': wezly,
+        'zawory': zawory, 'segmenty': segmenty
+    }
+
+
+def _use_sqlite_dialect():
+    """Dostosowuje modele MySQL do SQLite (typy ENUM/TINYINT, kolacja, strefa czasowa sesji)."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.ext.compiler import compiles
+    from sqlalchemy.dialects.mysql import ENUM, TINYINT
+    from app import extensions
+
+    if event.contains(Engine, 'connect', extensions.set_utc_timezone):
+        event.remove(Engine, 'connect', extensions.set_utc_timezone)
+
+    @event.listens_for(Engine, 'connect')
+    def _register_collation(dbapi_connection, connection_record):
+        dbapi_connection.create_collation('utf8mb4_unicode_ci', lambda a, b: (a > b) - (a < b))
+
+    @compiles(ENUM, 'sqlite')
+    def _enum_as_varchar(element, compiler, **kw):
+        return 'VARCHAR(50)'
+
+    @compiles(TINYINT, 'sqlite')
+    def _tinyint_as_integer(element, compiler, **kw):
+        return 'INTEGER'
+
+
+def _create_app(database_url, backend):
+    """Minimalna aplikacja Flask z samą bazą - bez Socket.IO, Celery i nasłuchu topologii."""
+    from flask import Flask
+    from app.extensions import db
+
+    app = Flask('benchmark_pathfinder')
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=database_url,
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        PATHFINDER_BACKEND=backend,
+        PATHFINDER_ANALYSIS_WORKERS=0,
+        PATHFINDER_RESILIENCE=False,
+    )
+    db.init_app(app)
+    return app
+
+
+def load_plant(app, plant, reset=False):
+    """Zapisuje syntetyczną topologię do bazy (tabele są tworzone, jeśli ich brak)."""
+    from app.extensions import db
+    from app import models  # noqa: F401 - rejestracja tabel w metadata
+
+    with app.app_context():
+        tables = [db.metadata.tables[nazwa] for nazwa in TOPOLOGY_TABLES]
+        db.metadata.create_all(db.engine, tables=tables)
+
+        existing = db.session.execute(db.select(db.func.count()).select_from(db.metadata.tables['segmenty'])).scalar()
+        if existing and not reset:
+            raise RuntimeError(
+                f"Baza zawiera już {existing} segmentów - użyj osobnej bazy albo opcji --reset."
+            )
+        for table in reversed(tables):
+            db.session.execute(table.delete())
+        for nazwa in ('sprzet', 'porty_sprzetu', 'wezly_rurociagu', 'zawory', 'segmenty'):
+            rows = plant[nazwa]
+            for i in range(0, len(rows), 5000):
+                db.session.execute(db.metadata.tables[nazwa].insert(), rows[i:i + 5000])
+        db.session.commit()
+
+
+def _rss_mb():
+    import psutil
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _timings(samples):
+    ms = [s * 1000 for s in samples]
+    return {
+        'count': len(ms),
+        'p50_ms': round(_percentile(ms, 50), 4) if ms else None,
+        'p99_ms': round(_percentile(ms, 99), 4) if ms else None,
+        'mean_ms': round(statistics.fmean(ms), 4) if ms else None,
+        'max_ms': round(max(ms), 4) if ms else None,
+    }
+
+
+def run_size(options):
+    """Mierzy jeden rozmiar topologii dla jednego silnika (wywoływane w osobnym procesie)."""
+    size, backend, database_url, queries, seed, max_analysis, reset = (
+        options['size'], options['backend'], options['database_url'], options['queries'],
+        options['seed'], options['max_analysis_segments'], options['reset']
+    )
+    if database_url.startswith('sqlite'):
+        _use_sqlite_dialect()
+
+    from app.pathfinder_service import PathFinder
+
+    generated_at = time.perf_counter()
+    plant = generate_plant(size, seed)
+    generate_s = time.perf_counter() - generated_at
+
+    app = _create_app(database_url, backend)
+    started = time.perf_counter()
+    load_plant(app, plant, reset=reset)
+    insert_s = time.perf_counter() - started
+
+    result = {
+        'segments': size,
+        'backend': backend,
+        'equipment': len(plant['sprzet']),
+        'ports': len(plant['porty_sprzetu']),
+        'collectors': len(plant['wezly_rurociagu']),
+        'valves': len(plant['zawory']),
+        'generate_s': round(generate_s, 4),
+        'insert_s': round(insert_s, 4),
+    }
+
+    with app.app_context():
+        rss_before = _rss_mb()
+        pathfinder = PathFinder()
+        pathfinder.app = app
+        pathfinder.backend_name = backend
+        pathfinder.analysis_workers = 0
+        pathfinder.resilience_enabled = False
+
+        started = time.perf_counter()
+        pathfinder._load_topology()
+        result['load_topology_s'] = round(time.perf_counter() - started, 4)
+
+        # Macierz osiągalności budowana w tle - czekamy, aby nie zakłócała pomiarów tras
+        thread = pathfinder._reach_thread
+        if thread is not None:
+            thread.join()
+        result['reachability_ready_s'] = round(time.perf_counter() - started, 4)
+        rss_after = _rss_mb()
+        result['rss_before_mb'] = round(rss_before, 2)
+        result['rss_after_load_mb'] = round(rss_after, 2)
+        result['rss_topology_mb'] = round(rss_after - rss_before, 2)
+
+        rng = random.Random(seed + 1)
+        out_ports = [p['nazwa_portu'] for p in plant['porty_sprzetu'] if p['typ_portu'] == 'OUT']
+        in_ports = [p['nazwa_portu'] for p in plant['porty_sprzetu'] if p['typ_portu'] == 'IN']
+        pairs = [(rng.choice(out_ports), rng.choice(in_ports)) for _ in range(queries)]
+
+        pathfinder.clear_route_cache()
+        cold, found = [], 0
+        for start, end in pairs:
+            t0 = time.perf_counter()
+            path = pathfinder.find_path(start, end)
+            cold.append(time.perf_counter() - t0)
+            found += path is not None
+        cached = []
+        for start, end in pairs:
+            t0 = time.perf_counter()
+            pathfinder.find_path(start, end)
+            cached.append(time.perf_counter() - t0)
+        result['find_path'] = dict(_timings(cold), found=found)
+        result['find_path_cached'] = _timings(cached)
+
+        if size <= max_analysis:
+            t0 = time.perf_counter()
+            analysis = pathfinder.critical_valves(use_valve_states=True)
+            result['critical_valves_s'] = round(time.perf_counter() - t0, 4)
+            result['critical_valves_pairs'] = analysis['pairs_total']
+
+            t0 = time.perf_counter()
+            pathfinder.rebuild_resilience()
+            result['resilience_s'] = round(time.perf_counter() - t0, 4)
+        else:
+            result['critical_valves_s'] = None
+            result['resilience_s'] = None
+        result['rss_peak_mb'] = round(_rss_mb(), 2)
+
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark PathFindera na syntetycznych topologiach.')
+    parser.add_argument('--sizes', default='100,1000,10000',
+                        help='Liczby segmentów, rozdzielone przecinkami (np. 100,1000,10000,100000)')
+    parser.add_argument('--backends', default='networkx,csr', help='Silniki PathFindera do porównania')
+    parser.add_argument('--queries', type=int, default=500, help='Liczba zapytań find_path na rozmiar')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-analysis-segments', type=int, default=10000,
+                        help='Największy rozmiar, dla którego liczona jest analiza zaworów i odporności')
+    parser.add_argument('--database-url', default=None,
+                        help='Adres bazy SQLAlchemy (domyślnie plik SQLite w katalogu tymczasowym)')
+    parser.add_argument('--reset', action='store_true',
+                        help='Czyści tabele topologii w podanej bazie przed wczytaniem (tylko baza testowa!)')
+    parser.add_argument('--output', default=None, help='Plik wynikowy JSON')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+    output = args.output or os.path.join(
+        'benchmark_results', f"pathfinder-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+
+    temp_dir = None
+    database_url = args.database_url
+    if database_url is None:
+        temp_dir = tempfile.mkdtemp(prefix='pathfinder-bench-')
+
+    results = []
+    # Osobny proces na każdy pomiar - czysty pomiar pamięci i brak stanu z poprzednich rozmiarów
+    context = multiprocessing.get_context('spawn')
+    for size in sizes:
+        for backend in backends:
+            url = database_url or f"sqlite:///{os.path.join(temp_dir, f'bench-{size}-{backend}.db')}"
+            print(f"INFO: Benchmark: {size} segmentów, silnik {backend}...")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_size, {
+                    'size': size, 'backend': backend, 'database_url': url, 'queries': args.queries,
+                    'seed': args.seed, 'max_analysis_segments': args.max_analysis_segments,
+                    'reset': args.reset or database_url is None
+                }).result()
+            results.append(result)
+            print(
+                f"INFO:   load {result['load_topology_s']}s, find_path p50 {result['find_path']['p50_ms']} ms, "
+                f"p99 {result['find_path']['p99_ms']} ms, pamięć +{result['rss_topology_mb']} MB, "
+                f"krytyczne zawory {result['critical_valves_s']}s"
+            )
+
+    report = {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'database': 'sqlite' if database_url is None else database_url.split(':', 1)[0],
+        'queries': args.queries,
+        'seed': args.seed,
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"INFO: Wyniki zapisane do {output}")
+    return report
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
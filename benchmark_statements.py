@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Mikrobenchmark przygotowania zapytań gorących ścieżek (dashboard, stan Apollo, sprawdzanie alarmów).
+
+Przed wykonaniem instrukcji SQLAlchemy buduje jej klucz cache i szuka skompilowanego SQL
+w cache silnika. Zapytanie budowane od nowa w każdym wywołaniu płaci za konstrukcję
+obiektu select() i za przejście jego drzewa przy liczeniu klucza; zapytanie zbudowane raz
+na poziomie modułu (parametry wiązane) ma klucz zapamiętany na obiekcie. Benchmark mierzy:
+- `inline`  - budowa konstrukcji + klucz cache (dotychczasowe zachowanie),
+- `cached`  - klucz cache zapytania modułowego (obecne zachowanie),
+- `compile` - pełna kompilacja do SQL MySQL, czyli koszt każdego wywołania bez cache silnika.
+
+Nie potrzebuje bazy danych - mierzy wyłącznie przygotowanie instrukcji. Koszt jednego
+odświeżenia dashboardu liczony jest dla `--devices` urządzeń (zapytanie o ostatni poziom
+wykonywane jest dla każdego z nich).
+
+Użycie:
+    python benchmark_statements.py
+    python benchmark_statements.py --devices 40 --repeat 5000
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+
+def _statements():
+    """(nazwa, budowa zapytania od nowa, zapytanie modułowe, ile razy na odświeżenie dashboardu)."""
+    from app import dashboard_service, apollo_service
+    # `app.monitoring` to w pakiecie instancja MonitoringService - stałe importowane z modułu
+    from app.monitoring import ALL_EQUIPMENT_Q, ACTIVE_ALARMS_Q
+    from app.extensions import db
+    from app.models import ApolloSesje, ApolloTracking, Sprzet, Alarmy
+    from sqlalchemy import func
+
+    def apollo_sesja():
+        return db.select(ApolloSesje).filter_by(id_sprzetu=1, status_sesji='aktywna')
+
+    def apollo_suma():
+        return db.select(func.sum(ApolloTracking.waga_kg)).where(
+            ApolloTracking.id_sesji == 1, ApolloTracking.typ_zdarzenia == 'DODANIE_SUROWCA'
+        )
+
+    def apollo_ostatni_transfer():
+        return db.select(ApolloTracking).where(
+            ApolloTracking.id_sesji == 1, ApolloTracking.typ_zdarzenia == 'TRANSFER_WYJSCIOWY'
+        ).order_by(ApolloTracking.czas_zdarzenia.desc())
+
+    return [
+        ('dashboard.sprzet', dashboard_service._equipment_query, dashboard_service.EQUIPMENT_Q, 1),
+        ('dashboard.ostatni_poziom', dashboard_service._latest_level_query, dashboard_service.LATEST_LEVEL_Q, 'devices'),
+        ('dashboard.alarmy', dashboard_service._active_alarms_query, dashboard_service.ACTIVE_ALARMS_Q, 1),
+        ('dashboard.operacje', dashboard_service._active_operations_query, dashboard_service.ACTIVE_OPERATIONS_Q, 1),
+        ('apollo.sesja', apollo_sesja, apollo_service.AKTYWNA_SESJA_Q, 0),
+        # Dawniej dwa zapytania sumujące (po jednym na typ zdarzenia), teraz jedno grupowane
+        ('apollo.bilans', apollo_suma, apollo_service.BILANS_SESJI_Q, 0),
+        ('apollo.ostatni_transfer', apollo_ostatni_transfer, apollo_service.OSTATNI_TRANSFER_Q, 0),
+        ('monitoring.sprzet', lambda: db.select(Sprzet), ALL_EQUIPMENT_Q, 0),
+        ('monitoring.alarmy', lambda: db.select(Alarmy).where(Alarmy.status_alarmu == 'AKTYWNY'), ACTIVE_ALARMS_Q, 0),
+    ]
+
+
+def _time_us(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return round(statistics.median(samples), 2)
+
+
+def measure(repeat, devices):
+    from sqlalchemy.dialects import mysql
+    dialect = mysql.dialect()
+
+    results = []
+    inline_build_us = cached_build_us = 0.0
+    for name, build, cached, per_build in _statements():
+        inline_us = _time_us(lambda: build()._generate_cache_key(), repeat)
+        cached_us = _time_us(lambda: cached._generate_cache_key(), repeat)
+        compile_us = _time_us(lambda: cached.compile(dialect=dialect), max(repeat // 10, 10))
+        count = devices if per_build == 'devices' else per_build
+        inline_build_us += inline_us * count
+        cached_build_us += cached_us * count
+        results.append({
+            'statement': name,
+            'inline_us': inline_us,
+            'cached_us': cached_us,
+            'compile_us': compile_us,
+            'per_dashboard_build': count,
+        })
+        print(f"INFO:   {name:<26} inline {inline_us:>8} µs   cached {cached_us:>6} µs   compile {compile_us:>8} µs")
+
+    return results, {
+        'devices': devices,
+        'inline_us': round(inline_build_us, 1),
+        'cached_us': round(cached_build_us, 1),
+        'saved_us': round(inline_build_us - cached_build_us, 1),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mikrobenchmark przygotowania zapytań gorących ścieżek.')
+    parser.add_argument('--repeat', type=int, default=2000, help='Liczba powtórzeń pomiaru na zapytanie')
+    parser.add_argument('--devices', type=int, default=20,
+                        help='Liczba urządzeń na dashboardzie (zapytań o ostatni poziom na odświeżenie)')
+    parser.add_argument('--output', default=None, help='Plik wynikowy JSON')
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.join(
+        'benchmark_results', f"statements-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    print(f"INFO: Przygotowanie zapytań (mediana z {args.repeat} powtórzeń):")
+    results, dashboard = measure(args.repeat, args.devices)
+    print(
+        f"INFO: Odświeżenie dashboardu ({args.devices} urządzeń): inline {dashboard['inline_us']} µs, "
+        f"cached {dashboard['cached_us']} µs - oszczędność {dashboard['saved_us']} µs"
+    )
+
+    report = {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results,
+        'dashboard_build': dashboard,
+    }
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"INFO: Wyniki zapisane do {output}")
+    return report
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
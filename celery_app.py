@@ -1,5 +1,6 @@
 # celery_app.py
 from app import create_app
+from app.perf import track
 from celery import Celery
 import os
 import sys
@@ -46,7 +47,7 @@ def make_celery(app):
 
     class ContextTask(celery.Task):
         def __call__(self, *args, **kwargs):
-            with app.app_context():
+            with app.app_context(), track(f"task {self.name}", app.extensions.get('sql_perf')):
                 return self.run(*args, **kwargs)
     
     celery.Task = ContextTask
@@ -208,4 +208,63 @@ def seed_tasks_command():
             print(f"-> Stworzono zadanie: '{task_name_2}'")
 
         db.session.commit()
-        print("Zakończono inicjalizację domyślnych zadań.")
\ No newline at end of file
+        print("Zakończono inicjalizację domyślnych zadań.")
+@app.cli.command("topology-import")
+@click.argument("plik", type=click.Path(exists=True, dir_okay=False))
+@click.option("--dry-run", is_flag=True, help="Tylko walidacja, bez zapisu do bazy.")
+def topology_import_command(plik, dry_run):
+    """
+    Importuje zawory, węzły, porty i segmenty z pliku JSON lub CSV w jednej transakcji.
+
+    Przykład użycia:
+    flask topology-import mapa.json --dry-run
+    flask topology-import mapa.csv
+    """
+    from app import topology_io
+    from app.topology_manager import TopologyManager
+
+    with open(plik, 'rb') as f:
+        content = f.read()
+    try:
+        topology = topology_io.parse_csv(content) if plik.lower().endswith('.csv') else topology_io.parse_json(content)
+    except (ValueError, UnicodeDecodeError) as e:
+        click.echo(click.style(f"Niepoprawny opis topologii: {e}", fg="red"))
+        raise click.Abort()
+
+    with app.app_context():
+        success, result = TopologyManager().bulk_import(topology, dry_run=dry_run)
+
+    counts = ', '.join(f"{key}: {count}" for key, count in result['counts'].items())
+    if not success:
+        click.echo(tabulate(
+            [[e['typ'], e['rekord'], e['nazwa'] or '', e['message']] for e in result['errors']],
+            headers=['Błąd', 'Rekord', 'Nazwa', 'Opis']
+        ))
+        click.echo(click.style(f"Znaleziono {len(result['errors'])} błędów - nic nie zostało zapisane ({counts}).", fg="red"))
+        raise click.Abort()
+
+    if dry_run:
+        click.echo(click.style(f"Walidacja zakończona pomyślnie ({counts}).", fg="green"))
+    else:
+        click.echo(click.style(f"Sukces! Zaimportowano: {counts}.", fg="green"))
+
+@app.cli.command("topology-export")
+@click.argument("plik", type=click.Path(dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(['json', 'csv']), default=None,
+              help="Format pliku (domyślnie z rozszerzenia, inaczej json).")
+def topology_export_command(plik, fmt):
+    """
+    Eksportuje mapę rurociągu do pliku w formacie importu.
+
+    Przykład użycia:
+    flask topology-export mapa.json
+    flask topology-export mapa.csv
+    """
+    from app.topology_manager import TopologyManager
+
+    fmt = fmt or ('csv' if plik.lower().endswith('.csv') else 'json')
+    with app.app_context():
+        with open(plik, 'w', encoding='utf-8', newline='') as f:
+            for chunk in TopologyManager().export_topology(fmt):
+                f.write(chunk)
+    click.echo(click.style(f"Sukces! Mapa zapisana do {plik}.", fg="green"))
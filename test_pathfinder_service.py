@@ -1,14 +1,24 @@
 # test_pathfinder_service.py
+import threading
 import unittest
+from unittest import mock
+from datetime import datetime, timezone
 from app import create_app, db
 from app.config import TestConfig
-from app.models import Sprzet, PortySprzetu, WezlyRurociagu, Zawory, Segmenty
+from app.models import Sprzet, PortySprzetu, WezlyRurociagu, Zawory, Segmenty, TopologiaWersja, OperacjeLog, TopologiaSnapshot
 from app.pathfinder_service import PathFinder
+from app.topology_sync import TopologySync
+from app import topology_snapshots, pathfinder_analysis
 from sqlalchemy import text
 
 class TestPathFinderService(unittest.TestCase):
+    # Silnik grafowy PathFindera (None = domyślny z konfiguracji)
+    BACKEND = None
+
     def setUp(self):
         self.app = create_app(TestConfig)
+        if self.BACKEND:
+            self.app.config['PATHFINDER_BACKEND'] = self.BACKEND
         self.app_context = self.app.app_context()
         self.app_context.push()
         
@@ -238,4 +248,532 @@ class TestPathFinderService(unittest.TestCase):
         self.assertEqual(path, ['SEG-R01-W1', 'SEG-W1-B01c'])
         
         # Sprawdźmy też, czy graf został poprawnie zaktualizowany
-        self.assertIn('B01c_IN', self.pathfinder.graph.nodes())
\ No newline at end of file
+        self.assertIn('B01c_IN', self.pathfinder.graph.nodes())
+
+    # --- Graf otwartych krawędzi utrzymywany w pamięci ---
+
+    def test_13_open_graph_contains_only_open_valve_edges(self):
+        """Sprawdza, czy graf otwartych krawędzi pomija segment z zamkniętym zaworem V3."""
+        self.assertEqual(len(self.pathfinder.open_graph.edges()), 3)
+        self.assertFalse(self.pathfinder.open_graph.has_edge('FZ1_OUT', 'R02_IN'))
+
+    def test_14_set_valve_states_updates_open_graph_incrementally(self):
+        """Sprawdza, czy otwarcie i zamknięcie zaworu w pamięci zmienia wynik find_path bez odczytu z bazy."""
+        version_before = self.pathfinder.valve_state_version
+
+        self.pathfinder.set_valve_states({'V3': 'OTWARTY'})
+        path = self.pathfinder.find_path('R01_OUT', 'R02_IN')
+        self.assertEqual(path, ['SEG-R01-W1', 'SEG-W1-FZ1', 'SEG-FZ1-INTERNAL', 'SEG-FZ1-R02'])
+        self.assertGreater(self.pathfinder.valve_state_version, version_before)
+
+        self.pathfinder.set_valve_states({'V1': 'ZAMKNIETY'})
+        self.assertIsNone(self.pathfinder.find_path('R01_OUT', 'R02_IN'))
+
+    def test_15_refresh_valve_states_picks_up_database_changes(self):
+        """Sprawdza, czy refresh_valve_states nanosi zmiany wykonane bezpośrednio w bazie."""
+        zawor_v3 = db.session.get(Zawory, 103)
+        zawor_v3.stan = 'OTWARTY'
+        db.session.commit()
+
+        self.assertIsNone(self.pathfinder.find_path('FZ1_OUT', 'R02_IN'))
+        self.pathfinder.refresh_valve_states()
+        self.assertEqual(self.pathfinder.find_path('FZ1_OUT', 'R02_IN'), ['SEG-FZ1-R02'])
+
+    def test_16_segment_indexes_resolve_valves_and_ids(self):
+        """Sprawdza, czy indeksy segmentów zwracają zawory, ID i końce segmentów bez przeszukiwania grafu."""
+        segmenty = ['SEG-R01-W1', 'SEG-W1-FZ1', 'NIE_ISTNIEJE']
+
+        self.assertEqual(self.pathfinder.valves_for_segments(segmenty), {'V1', 'V2'})
+        self.assertEqual(self.pathfinder.segment_ids(segmenty), [1001, 1002])
+        self.assertEqual(self.pathfinder.segment_endpoints('SEG-FZ1-R02'), ('FZ1_OUT', 'R02_IN'))
+        self.assertIsNone(self.pathfinder.segment_endpoints('NIE_ISTNIEJE'))
+        self.assertEqual(self.pathfinder.valve_names(), {'V1', 'V2', 'V3', 'V-FZ1-INT'})
+
+    def test_17_find_path_with_all_valves_ignores_valve_states(self):
+        """Sprawdza, czy przekazanie valve_names() wyszukuje trasę po pełnym grafie."""
+        path = self.pathfinder.find_path('R01_OUT', 'R02_IN', self.pathfinder.valve_names())
+        self.assertEqual(path, ['SEG-R01-W1', 'SEG-W1-FZ1', 'SEG-FZ1-INTERNAL', 'SEG-FZ1-R02'])
+
+    def test_18_route_cache_hits_on_repeated_query(self):
+        """Sprawdza, czy powtórne zapytanie o tę samą trasę jest obsługiwane z cache."""
+        self.pathfinder.find_path('R01_OUT', 'FZ1_IN')
+        misses = self.pathfinder.cache_stats['misses']
+        hits = self.pathfinder.cache_stats['hits']
+
+        path = self.pathfinder.find_path('R01_OUT', 'FZ1_IN')
+        self.assertEqual(path, ['SEG-R01-W1', 'SEG-W1-FZ1'])
+        self.assertEqual(self.pathfinder.cache_stats['hits'], hits + 1)
+        self.assertEqual(self.pathfinder.cache_stats['misses'], misses)
+
+        # Modyfikacja zwróconej listy nie może psuć wpisu w cache
+        path.append('SMIECI')
+        self.assertEqual(self.pathfinder.find_path('R01_OUT', 'FZ1_IN'), ['SEG-R01-W1', 'SEG-W1-FZ1'])
+
+    def test_19_route_cache_invalidated_by_valve_and_topology_changes(self):
+        """Sprawdza, czy zmiana stanu zaworu i przeładowanie topologii unieważniają wpisy cache."""
+        self.assertIsNone(self.pathfinder.find_path('FZ1_OUT', 'R02_IN'))
+
+        self.pathfinder.set_valve_states({'V3': 'OTWARTY'})
+        self.assertEqual(self.pathfinder.find_path('FZ1_OUT', 'R02_IN'), ['SEG-FZ1-R02'])
+
+        topology_version = self.pathfinder.topology_version
+        self.pathfinder.reload_topology()
+        self.assertEqual(self.pathfinder.topology_version, topology_version + 1)
+        self.assertEqual(self.pathfinder.get_cache_stats()['size'], 0)
+        # Po przeładowaniu stany zaworów pochodzą z bazy (V3 zamknięty)
+        self.assertIsNone(self.pathfinder.find_path('FZ1_OUT', 'R02_IN'))
+
+    def test_20_find_path_via_intermediate_points(self):
+        """Sprawdza wyszukiwanie trasy przez punkty pośrednie (via)."""
+        path = self.pathfinder.find_path('R01_OUT', 'FZ1_OUT', via=['FZ1_IN'])
+        self.assertEqual(path, ['SEG-R01-W1', 'SEG-W1-FZ1', 'SEG-FZ1-INTERNAL'])
+        self.assertIsNone(self.pathfinder.find_path('R01_OUT', 'FZ1_OUT', via=['NIE_ISTNIEJE']))
+
+    def test_21_reachability_matrix_respects_valve_states(self):
+        """Sprawdza macierz osiągalności portów dla bieżących stanów zaworów i dla wszystkich zaworów."""
+        self.pathfinder.rebuild_reachability()
+
+        self.assertEqual(self.pathfinder.reachable_ports('R01_OUT'), {'FZ1_IN', 'FZ1_OUT'})
+        self.assertEqual(
+            self.pathfinder.reachable_ports('R01_OUT', use_valve_states=False),
+            {'FZ1_IN', 'FZ1_OUT', 'R02_IN'}
+        )
+        self.assertEqual(self.pathfinder.reachable_equipment('R01', use_valve_states=False), {'FZ1', 'R02'})
+        self.assertEqual(self.pathfinder.reachable_ports('NIE_ISTNIEJE'), set())
+
+    def test_22_reachability_follows_valve_changes(self):
+        """Sprawdza, czy po zmianie zaworu odczyt osiągalności jest zgodny z nowym stanem (także przed przebudową)."""
+        self.pathfinder.set_valve_states({'V3': 'OTWARTY'})
+        self.assertIn('R02_IN', self.pathfinder.reachable_ports('R01_OUT'))
+
+        self.pathfinder.rebuild_reachability()
+        self.assertEqual(self.pathfinder.reachable_ports('R01_OUT'), {'FZ1_IN', 'FZ1_OUT', 'R02_IN'})
+        self.assertEqual(self.pathfinder.reachable_equipment('R01'), {'FZ1', 'R02'})
+
+    def test_23_find_paths_bulk_matches_single_queries(self):
+        """Sprawdza, czy find_paths_bulk zwraca te same trasy co pojedyncze wywołania find_path."""
+        pairs = [('R01_OUT', 'FZ1_IN'), ('R01_OUT', 'FZ1_OUT'), ('R01_OUT', 'R02_IN'), ('W1', 'FZ1_OUT'), ('NIE_ISTNIEJE', 'R02_IN')]
+        results = self.pathfinder.find_paths_bulk(pairs)
+
+        self.assertEqual(list(results), pairs)
+        self.assertEqual(results[('R01_OUT', 'FZ1_OUT')], ['SEG-R01-W1', 'SEG-W1-FZ1', 'SEG-FZ1-INTERNAL'])
+        self.assertIsNone(results[('R01_OUT', 'R02_IN')])
+        self.assertIsNone(results[('NIE_ISTNIEJE', 'R02_IN')])
+        for start, end in pairs:
+            self.assertEqual(results[(start, end)], self.pathfinder.find_path(start, end))
+
+        # Trafienie w cache przez find_paths_bulk odświeża pozycję wpisu w LRU
+        self.pathfinder.find_paths_bulk([('R01_OUT', 'FZ1_IN')])
+        self.assertEqual(next(reversed(self.pathfinder._route_cache))[:2], ('R01_OUT', 'FZ1_IN'))
+
+        # Z pełnym zestawem zaworów trasa przez V3 jest dostępna
+        results = self.pathfinder.find_paths_bulk([('R01_OUT', 'R02_IN')], self.pathfinder.valve_names())
+        self.assertEqual(results[('R01_OUT', 'R02_IN')], ['SEG-R01-W1', 'SEG-W1-FZ1', 'SEG-FZ1-INTERNAL', 'SEG-FZ1-R02'])
+
+    def test_24_reload_if_stale_follows_database_topology_stamp(self):
+        """Sprawdza, czy nowszy znacznik wersji topologii w bazie powoduje przeładowanie grafu."""
+        self.assertFalse(self.pathfinder.reload_if_stale())
+
+        db.session.add(TopologiaWersja(id=1, wersja=5))
+        # Zmiana mapy wykonana "w innym procesie": nowy segment FZ1_OUT -> W1 z otwartym zaworem
+        db.session.add(Segmenty(id=1005, nazwa_segmentu='SEG-FZ1-W1', id_zaworu=104, id_portu_startowego=31, id_wezla_koncowego=100))
+        db.session.commit()
+
+        topology_version = self.pathfinder.topology_version
+        self.assertTrue(self.pathfinder.reload_if_stale())
+        self.assertEqual(self.pathfinder.db_topology_version, 5)
+        self.assertEqual(self.pathfinder.topology_version, topology_version + 1)
+        self.assertEqual(self.pathfinder.find_path('FZ1_OUT', 'W1'), ['SEG-FZ1-W1'])
+
+        # Ta sama lub starsza wersja nie powoduje ponownego ładowania
+        self.assertFalse(self.pathfinder.reload_if_stale(5))
+        self.assertFalse(self.pathfinder.reload_if_stale(4))
+
+    def test_25_backend_is_selected_from_config(self):
+        """Sprawdza, czy PathFinder używa silnika wskazanego w konfiguracji."""
+        self.assertEqual(self.pathfinder.backend.name, self.BACKEND or TestConfig.PATHFINDER_BACKEND)
+
+
+    def test_27_find_k_paths_ranks_by_hops_or_switches(self):
+        """Sprawdza k najkrótszych tras (Yen) i ranking po długości oraz liczbie zaworów do przełączenia."""
+        # Obejście W1 -> FZ1_OUT przez zamknięty zawór V3
+        db.session.add(Segmenty(id=1006, nazwa_segmentu='SEG-W1-FZ1OUT', id_zaworu=103, id_wezla_startowego=100, id_portu_koncowego=31))
+        db.session.commit()
+        self.pathfinder.reload_topology()
+        zawory_przed = {z.nazwa_zaworu: z.stan for z in db.session.execute(db.select(Zawory)).scalars()}
+
+        by_hops = self.pathfinder.find_k_paths('R01_OUT', 'FZ1_OUT', k=5)
+        self.assertEqual([p['segments'] for p in by_hops], [
+            ['SEG-R01-W1', 'SEG-W1-FZ1OUT'],
+            ['SEG-R01-W1', 'SEG-W1-FZ1', 'SEG-FZ1-INTERNAL']
+        ])
+        self.assertEqual(by_hops[0]['valves_to_open'], ['V3'])
+        self.assertEqual(by_hops[1]['switches'], 0)
+
+        by_switches = self.pathfinder.find_k_paths('R01_OUT', 'FZ1_OUT', k=5, rank_by='switches')
+        self.assertEqual([p['switches'] for p in by_switches], [0, 1])
+
+        self.assertEqual(len(self.pathfinder.find_k_paths('R01_OUT', 'FZ1_OUT', k=1)), 1)
+        self.assertEqual(self.pathfinder.find_k_paths('R01_OUT', 'NIE_ISTNIEJE'), [])
+
+        # Wyszukiwanie nie zmienia stanów zaworów w bazie
+        db.session.expire_all()
+        zawory_po = {z.nazwa_zaworu: z.stan for z in db.session.execute(db.select(Zawory)).scalars()}
+        self.assertEqual(zawory_przed, zawory_po)
+
+    def test_28_find_path_avoids_segments_of_active_operations(self):
+        """Sprawdza, czy trasa omija segmenty zajęte przez aktywne operacje (z bazy i po occupy/release)."""
+        # Obejście W1 -> FZ1_OUT przez otwarty zawór V2, zajęte przez aktywną operację
+        obejscie = Segmenty(id=1006, nazwa_segmentu='SEG-W1-FZ1OUT', id_zaworu=102, id_wezla_startowego=100, id_portu_koncowego=31)
+        operacja = OperacjeLog(id=500, typ_operacji='TRANSFER', status_operacji='aktywna', czas_rozpoczecia=datetime.now(timezone.utc))
+        operacja.segmenty = [obejscie]
+        db.session.add_all([obejscie, operacja])
+        db.session.commit()
+        self.pathfinder.reload_topology()
+
+        self.assertEqual(self.pathfinder.occupied_segments, {'SEG-W1-FZ1OUT': 500})
+        self.assertEqual(self.pathfinder.find_path('R01_OUT', 'FZ1_OUT'), ['SEG-R01-W1', 'SEG-W1-FZ1OUT'])
+        self.assertEqual(
+            self.pathfinder.find_path('R01_OUT', 'FZ1_OUT', avoid_occupied=True),
+            ['SEG-R01-W1', 'SEG-W1-FZ1', 'SEG-FZ1-INTERNAL']
+        )
+
+        # Nowa operacja zajmuje drugą trasę - wolnej trasy nie ma
+        self.pathfinder.occupy_segments(501, ['SEG-FZ1-INTERNAL'])
+        self.assertIsNone(self.pathfinder.find_path('R01_OUT', 'FZ1_OUT', avoid_occupied=True))
+        results = self.pathfinder.find_paths_bulk([('R01_OUT', 'FZ1_OUT'), ('R01_OUT', 'FZ1_IN')], avoid_occupied=True)
+        self.assertIsNone(results[('R01_OUT', 'FZ1_OUT')])
+        self.assertEqual(results[('R01_OUT', 'FZ1_IN')], ['SEG-R01-W1', 'SEG-W1-FZ1'])
+
+        # Zakończenie operacji zwalnia jej segmenty
+        self.assertEqual(self.pathfinder.release_operation(500), ['SEG-W1-FZ1OUT'])
+        self.assertEqual(
+            self.pathfinder.find_path('R01_OUT', 'FZ1_OUT', avoid_occupied=True),
+            ['SEG-R01-W1', 'SEG-W1-FZ1OUT']
+        )
+
+        # Odświeżenie z bazy: w bazie aktywna jest tylko operacja 500
+        self.pathfinder.refresh_occupancy()
+        self.assertEqual(self.pathfinder.occupied_segments, {'SEG-W1-FZ1OUT': 500})
+
+    def test_29_find_route_legs_reuses_cached_legs(self):
+        """Sprawdza trasę wieloodcinkową: odcinki w kolejności punktów i ponowne użycie wspólnych odcinków z cache."""
+        wszystkie = self.pathfinder.valve_names()
+        legs = self.pathfinder.find_route_legs(['R01_OUT', 'FZ1_IN', 'FZ1_OUT', 'R02_IN'], wszystkie)
+        self.assertEqual(legs, [['SEG-R01-W1', 'SEG-W1-FZ1'], ['SEG-FZ1-INTERNAL'], ['SEG-FZ1-R02']])
+
+        # Odcinek wewnątrz filtra jest już w cache - inna trasa przez ten sam filtr go nie przelicza
+        misses = self.pathfinder.cache_stats['misses']
+        legs = self.pathfinder.find_route_legs(['W1', 'FZ1_IN', 'FZ1_OUT', 'R02_IN'], wszystkie)
+        self.assertEqual(legs, [['SEG-W1-FZ1'], ['SEG-FZ1-INTERNAL'], ['SEG-FZ1-R02']])
+        self.assertEqual(self.pathfinder.cache_stats['misses'], misses + 1)
+
+        # Przerwany odcinek (zamknięty V3) - ten i kolejne mają wartość None
+        legs = self.pathfinder.find_route_legs(['R01_OUT', 'FZ1_OUT', 'R02_IN', 'W1'])
+        self.assertEqual(legs, [['SEG-R01-W1', 'SEG-W1-FZ1', 'SEG-FZ1-INTERNAL'], None, None])
+        self.assertIsNone(self.pathfinder.find_path('R01_OUT', 'W1', via=['FZ1_OUT', 'R02_IN']))
+
+    def test_30_valve_overrides_do_not_touch_live_state(self):
+        """Sprawdza scenariusz with_valve_overrides: trasy wg nadpisanych stanów, bez zmian w bazie i w grafie bieżącym."""
+        valve_state_version = self.pathfinder.valve_state_version
+        cache_size = len(self.pathfinder._route_cache)
+
+        with self.pathfinder.with_valve_overrides({'V3': 'OTWARTY', 'V2': 'ZAMKNIETY', 'NIE_ISTNIEJE': 'OTWARTY'}) as scenario:
+            self.assertEqual(scenario.valve_state('V3'), 'OTWARTY')
+            self.assertEqual(scenario.find_path('FZ1_OUT', 'R02_IN'), ['SEG-FZ1-R02'])
+            self.assertIsNone(scenario.find_path('R01_OUT', 'FZ1_IN'))
+            results = scenario.find_paths_bulk([('FZ1_IN', 'R02_IN'), ('R01_OUT', 'W1')])
+            self.assertEqual(results[('FZ1_IN', 'R02_IN')], ['SEG-FZ1-INTERNAL', 'SEG-FZ1-R02'])
+            self.assertEqual(results[('R01_OUT', 'W1')], ['SEG-R01-W1'])
+
+        # Bieżący stan, cache tras i baza bez zmian
+        self.assertEqual(self.pathfinder.valve_state_version, valve_state_version)
+        self.assertEqual(len(self.pathfinder._route_cache), cache_size)
+        self.assertIsNone(self.pathfinder.find_path('FZ1_OUT', 'R02_IN'))
+        self.assertEqual(self.pathfinder.find_path('R01_OUT', 'FZ1_IN'), ['SEG-R01-W1', 'SEG-W1-FZ1'])
+        self.assertEqual(db.session.get(Zawory, 103).stan, 'ZAMKNIETY')
+        self.assertEqual(db.session.get(Zawory, 102).stan, 'OTWARTY')
+
+    def test_31_critical_valves_cover_all_port_pairs(self):
+        """Sprawdza analizę krytycznych zaworów (dominatory) dla wszystkich par portów i jej zapamiętywanie."""
+        live = self.pathfinder.critical_valves()
+        self.assertEqual(live['pairs_total'], 3)
+        self.assertEqual(sorted(live['blocked']['V1']), [('R01_OUT', 'FZ1_IN'), ('R01_OUT', 'FZ1_OUT')])
+        self.assertEqual(sorted(live['blocked']['V-FZ1-INT']), [('FZ1_IN', 'FZ1_OUT'), ('R01_OUT', 'FZ1_OUT')])
+        self.assertNotIn('V3', live['blocked'])
+
+        all_valves = self.pathfinder.critical_valves(use_valve_states=False)
+        self.assertEqual(all_valves['pairs_total'], 6)
+        self.assertEqual(len(all_valves['blocked']['V3']), 3)
+
+        # Wynik zapamiętany dla wersji grafu; zmiana zaworu unieważnia tylko analizę 'live'
+        self.assertIs(self.pathfinder.critical_valves(), live)
+        self.pathfinder.set_valve_states({'V3': 'OTWARTY'})
+        self.assertIs(self.pathfinder.critical_valves(use_valve_states=False), all_valves)
+        self.assertEqual(self.pathfinder.critical_valves()['pairs_total'], 6)
+
+    def test_32_resilience_report_min_cuts(self):
+        """Sprawdza raport odporności (minimalne przekroje) liczony w tle dla struktury mapy (skrótu migawki)."""
+        thread = self.pathfinder._resilience_thread
+        if thread is not None:
+            thread.join(5)
+        report = self.pathfinder.resilience_report()
+        self.assertIsNotNone(report)
+        self.assertEqual(report['version'], self.pathfinder.topology_hash)
+
+        fz1 = next(e for e in report['equipment'] if e['stage'] == 'reaktor -> filtr' and e['equipment'] == 'FZ1')
+        self.assertTrue(fz1['reachable'])
+        self.assertEqual(fz1['min_cut_size'], 1)
+        self.assertEqual(len(fz1['cut_segments']), 1)
+        self.assertIn(fz1['cut_segments'][0], ('SEG-R01-W1', 'SEG-W1-FZ1'))
+        self.assertTrue(fz1['single_point_of_failure'])
+        self.assertIn('FZ1', [e['equipment'] for e in report['single_points_of_failure']])
+
+        # Brak Apollo w topologii - reaktory nieosiągalne w etapie apollo -> reaktor
+        r02 = next(e for e in report['equipment'] if e['stage'] == 'apollo -> reaktor' and e['equipment'] == 'R02')
+        self.assertFalse(r02['reachable'])
+
+        # Przeładowanie bez zmian w strukturze zachowuje raport, nowa struktura go unieważnia
+        self.pathfinder.reachability_background = False
+        self.pathfinder.reload_topology()
+        self.assertIs(self.pathfinder.resilience_report(), report)
+        db.session.add(WezlyRurociagu(id=200, nazwa_wezla='W2'))
+        db.session.commit()
+        self.pathfinder.reload_topology()
+        self.assertIsNot(self.pathfinder.resilience_report(), report)
+        self.assertEqual(self.pathfinder.resilience_report()['version'], self.pathfinder.topology_hash)
+
+    def test_33_segment_between_uses_in_memory_graph(self):
+        """Sprawdza odnajdywanie segmentu łączącego dwa punkty (w obu kierunkach) bez zapytań do bazy."""
+        self.assertEqual(self.pathfinder.segment_between('R01_OUT', 'W1'), 'SEG-R01-W1')
+        self.assertEqual(self.pathfinder.segment_between('W1', 'R01_OUT'), 'SEG-R01-W1')
+        self.assertEqual(self.pathfinder.segment_between('FZ1_OUT', 'R02_IN'), 'SEG-FZ1-R02')
+        self.assertIsNone(self.pathfinder.segment_between('R01_OUT', 'R02_IN'))
+        self.assertIsNone(self.pathfinder.segment_between('NIE_ISTNIEJE', 'W1'))
+
+    def test_34_topology_health_from_loaded_graph(self):
+        """Sprawdza przegląd stanu topologii liczony z grafu w pamięci i zapamiętywany dla wersji topologii."""
+        health = self.pathfinder.topology_health()
+        self.assertEqual(health['orphaned_valves'], [])
+        self.assertEqual(health['isolated_nodes'], [])
+        self.assertEqual(len(health['components']), 1)
+        self.assertEqual(health['unreachable_equipment'], [])
+        self.assertEqual(health['cycles'], [])
+        self.assertIs(self.pathfinder.topology_health(), health)
+
+        db.session.add_all([
+            Sprzet(id=9, nazwa_unikalna='S9', typ_sprzetu='beczka_brudna'),
+            WezlyRurociagu(id=109, nazwa_wezla='W9'),
+            Zawory(id=109, nazwa_zaworu='V9', stan='ZAMKNIETY'),
+        ])
+        db.session.commit()
+        self.pathfinder.reload_topology()
+
+        health = self.pathfinder.topology_health()
+        self.assertEqual(health['orphaned_valves'], ['V9'])
+        self.assertEqual(health['isolated_nodes'], [{'id': 109, 'nazwa_wezla': 'W9', 'connections_count': 0}])
+        self.assertEqual(health['equipment_without_ports'], ['S9'])
+        self.assertEqual(health['version'], self.pathfinder.topology_version)
+
+    def test_35_topology_export_and_changes_since_token(self):
+        """Sprawdza eksport topologii z tokenem wersji i eksport przyrostowy (tylko zmiany stanów)."""
+        export = self.pathfinder.export_topology()
+        self.assertFalse(export['delta'])
+        self.assertEqual(len(export['segments']), 4)
+        self.assertEqual(export['valves']['V3'], 'ZAMKNIETY')
+        token = export['token']
+
+        # Bez zmian - ten sam token i pusta delta
+        self.assertEqual(self.pathfinder.export_token(), token)
+        self.assertEqual(self.pathfinder.export_changes(token)['valves'], {})
+
+        self.pathfinder.set_valve_states({'V3': 'OTWARTY'})
+        self.pathfinder.occupy_segments(7, ['SEG-R01-W1', 'SEG-W1-FZ1'])
+        self.pathfinder.release_operation(7)
+        self.pathfinder.occupy_segments(8, ['SEG-W1-FZ1'])
+        changes = self.pathfinder.export_changes(token)
+        self.assertNotEqual(changes['token'], token)
+        self.assertEqual(changes['valves'], {'V3': 'OTWARTY'})
+        self.assertEqual(changes['occupied'], {'SEG-W1-FZ1': 8})
+        self.assertEqual(changes['released'], ['SEG-R01-W1'])
+
+        # Nowa wersja topologii lub nieznany token - wymagany pełny eksport
+        self.pathfinder.reload_topology()
+        self.assertIsNone(self.pathfinder.export_changes(changes['token']))
+        self.assertIsNone(self.pathfinder.export_changes('niepoprawny'))
+
+    def test_36_topology_snapshots_and_structural_diff(self):
+        """Sprawdza migawki struktury mapy (skrót niezależny od stanów zaworów) i różnicę między nimi."""
+        first_hash = self.pathfinder.topology_hash
+        first = self.pathfinder.snapshot
+        self.assertEqual(len(first_hash), 64)
+        self.assertEqual(db.session.execute(db.select(db.func.count(TopologiaSnapshot.id))).scalar(), 1)
+
+        # Zmiana stanu zaworu i przeładowanie bez zmian w strukturze - ten sam skrót, bez nowej migawki
+        self.pathfinder.rebuild_resilience()
+        resilience = self.pathfinder.resilience_report()
+        db.session.get(Zawory, 103).stan = 'OTWARTY'
+        db.session.commit()
+        self.pathfinder.reload_topology()
+        self.assertEqual(self.pathfinder.topology_hash, first_hash)
+        self.assertIs(self.pathfinder.resilience_report(), resilience)
+        self.assertEqual(db.session.execute(db.select(db.func.count(TopologiaSnapshot.id))).scalar(), 1)
+
+        # Zmiana zaworu segmentu i nowy węzeł - nowa migawka
+        db.session.add(WezlyRurociagu(id=200, nazwa_wezla='W2'))
+        db.session.get(Segmenty, 1003).id_zaworu = 102
+        db.session.commit()
+        self.pathfinder.reload_topology()
+        self.assertNotEqual(self.pathfinder.topology_hash, first_hash)
+        self.assertEqual(db.session.execute(db.select(db.func.count(TopologiaSnapshot.id))).scalar(), 2)
+
+        stored_hash, stored = topology_snapshots.load_snapshot(first_hash[:12])
+        self.assertEqual(stored_hash, first_hash)
+        diff = topology_snapshots.diff_snapshots(stored, self.pathfinder.snapshot)
+        self.assertFalse(diff['bez_zmian'])
+        self.assertEqual(diff['wezly']['dodane'], [{'nazwa': 'W2'}])
+        self.assertEqual(diff['segmenty']['zmienione'], [{
+            'nazwa': 'SEG-FZ1-R02',
+            'przed': {'start': 'FZ1_OUT', 'koniec': 'R02_IN', 'zawor': 'V3'},
+            'po': {'start': 'FZ1_OUT', 'koniec': 'R02_IN', 'zawor': 'V2'},
+            'pola': ['zawor']
+        }])
+        self.assertEqual(diff['porty'], {'dodane': [], 'usuniete': [], 'zmienione': []})
+        self.assertTrue(topology_snapshots.diff_snapshots(first, stored)['bez_zmian'])
+
+    def test_37_reachability_is_computed_in_os_thread_under_eventlet(self):
+        """Sprawdza, czy pod eventletem macierz osiągalności liczona jest w wątku systemowym (tpool), a wynik podmieniany u wywołującego."""
+        threads = []
+        compute = pathfinder_analysis.compute_reachability_rows
+
+        def recording_compute(adjacency, port_names):
+            threads.append(threading.get_ident())
+            return compute(adjacency, port_names)
+
+        # Bez przebudowy w tle - liczy wyłącznie wywołanie poniżej
+        self.pathfinder.reachability_background = False
+        worker = self.pathfinder._reach_thread
+        if worker is not None:
+            worker.join()
+        self.pathfinder.set_valve_states({'V3': 'OTWARTY'})
+        self.pathfinder._reachability.clear()
+        with mock.patch.object(pathfinder_analysis, '_eventlet_patched', return_value=True), \
+                mock.patch('app.pathfinder_service.compute_reachability_rows', recording_compute):
+            self.pathfinder.rebuild_reachability()
+
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(self.pathfinder.reachable_ports('R01_OUT'), {'FZ1_IN', 'FZ1_OUT', 'R02_IN'})
+
+    def test_38_resilience_is_computed_in_os_thread_under_eventlet(self):
+        """Sprawdza, czy pod eventletem raport odporności liczony jest w wątku systemowym (tpool)."""
+        threads = []
+        report = pathfinder_analysis.resilience_report
+
+        def recording_report(edges, ports):
+            threads.append(threading.get_ident())
+            return report(edges, ports)
+
+        # Liczenie zlecone przy wczytaniu topologii musi się zakończyć przed podmianą funkcji
+        worker = self.pathfinder._resilience_thread
+        if worker is not None:
+            worker.join()
+        with mock.patch.object(pathfinder_analysis, '_eventlet_patched', return_value=True), \
+                mock.patch('app.pathfinder_service.resilience_report', recording_report):
+            entry = self.pathfinder.rebuild_resilience()
+
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+        self.assertIs(self.pathfinder.resilience_report(), entry)
+
+    def test_39_background_refreshes_only_structural_critical_valves(self):
+        """Sprawdza, czy w tle odświeżana jest tylko analiza 'all', a 'live' liczona na żądanie po zmianie zaworu."""
+        live = self.pathfinder.critical_valves()
+        all_valves = self.pathfinder.critical_valves(use_valve_states=False)
+
+        self.pathfinder.set_valve_states({'V3': 'OTWARTY'})
+        worker = self.pathfinder._reach_thread
+        if worker is not None:
+            worker.join()
+        self.assertIs(self.pathfinder._critical_valves['live'], live)
+        self.assertIs(self.pathfinder._critical_valves['all'], all_valves)
+
+        self.assertEqual(self.pathfinder.critical_valves()['pairs_total'], 6)
+        self.assertIs(self.pathfinder.critical_valves(use_valve_states=False), all_valves)
+
+    def test_40_critical_valves_in_process_pool(self):
+        """Sprawdza, czy analiza w długo żyjącej puli procesów (oczekiwanie w wątku tpool) daje ten sam wynik co w bieżącym procesie."""
+        expected = {kind: self.pathfinder.critical_valves(use_valve_states=(kind == 'live')) for kind in ('live', 'all')}
+        pool = pathfinder_analysis.AnalysisPool(2)
+        self.pathfinder._analysis_pool = pool
+        self.pathfinder.analysis_workers = 2
+        try:
+            processes = None
+            with mock.patch.object(pathfinder_analysis, '_eventlet_patched', return_value=True):
+                for kind in ('live', 'all'):
+                    self.pathfinder._critical_valves.clear()
+                    analysis = self.pathfinder.critical_valves(use_valve_states=(kind == 'live'))
+                    self.assertEqual(analysis['pairs_total'], expected[kind]['pairs_total'])
+                    self.assertEqual(
+                        {nazwa: sorted(pairs) for nazwa, pairs in analysis['blocked'].items()},
+                        {nazwa: sorted(pairs) for nazwa, pairs in expected[kind]['blocked'].items()}
+                    )
+                    # Te same procesy dla kolejnych analiz
+                    pids = [process.pid for process, _ in pool._workers]
+                    self.assertEqual(len(pids), 2)
+                    self.assertEqual(pids, processes or pids)
+                    processes = pids
+        finally:
+            self.pathfinder._analysis_pool = None
+            pool.close()
+
+    def test_41_topology_change_is_reloaded_by_sync_listener(self):
+        """Sprawdza, czy zgłoszenie zmiany mapy przy działającym nasłuchu tylko publikuje komunikat, a bez nasłuchu przeładowuje graf."""
+        db.session.add(TopologiaWersja(id=1, wersja=3))
+        db.session.commit()
+        self.app.extensions['pathfinder'] = self.pathfinder
+        # W testach nasłuch jest wyłączony - działający wątek nasłuchu udaje atrapa
+        sync = TopologySync(self.app)
+
+        listener = mock.Mock(is_alive=mock.Mock(return_value=True))
+        with mock.patch.object(sync, 'publish', return_value=True), mock.patch.object(sync, '_thread', listener):
+            sync.notify(3)
+        self.assertEqual(self.pathfinder.db_topology_version, 0)
+
+        # Komunikat nie wyszedł (brak Redisa) - przeładowanie w procesie zgłaszającym
+        with mock.patch.object(sync, 'publish', return_value=False):
+            sync.notify(3)
+        self.assertEqual(self.pathfinder.db_topology_version, 3)
+
+    def test_42_sync_poll_picks_up_valve_changes_from_other_processes(self):
+        """Sprawdza, czy okresowy odczyt TopologySync nanosi na graf stany zaworów zmienione poza tym procesem."""
+        self.app.extensions['pathfinder'] = self.pathfinder
+        sync = TopologySync(self.app)
+        self.assertIsNone(self.pathfinder.find_path('FZ1_OUT', 'R02_IN'))
+
+        # Zmiana "w innym procesie" - wprost w bazie, bez set_valve_states
+        db.session.get(Zawory, 103).stan = 'OTWARTY'
+        db.session.commit()
+        version = self.pathfinder.valve_state_version
+        sync.poll()
+        self.assertEqual(self.pathfinder.valve_states['V3'], 'OTWARTY')
+        self.assertEqual(self.pathfinder.valve_state_version, version + 1)
+        self.assertEqual(self.pathfinder.find_path('FZ1_OUT', 'R02_IN'), ['SEG-FZ1-R02'])
+
+        # Bez zmian w bazie - bez nowej wersji stanów zaworów
+        sync.poll()
+        self.assertEqual(self.pathfinder.valve_state_version, version + 1)
+
+class TestPathFinderServiceCSR(TestPathFinderService):
+    """Te same testy PathFindera uruchamiane na silniku CSR."""
+    BACKEND = 'csr'
+
+    def test_26_csr_arrays_follow_valve_mask(self):
+        """Sprawdza, czy maska zaworów silnika CSR odpowiada stanom zaworów."""
+        backend = self.pathfinder.backend
+        self.assertEqual(len(backend.edge_segment), 4)
+        self.assertEqual(backend.live_mask[backend.valve_index['V3']], 0)
+
+        self.pathfinder.set_valve_states({'V3': 'OTWARTY'})
+        self.assertEqual(backend.live_mask[backend.valve_index['V3']], 1)
+
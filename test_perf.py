@@ -0,0 +1,58 @@
+# test_perf.py
+import unittest
+from app.perf import statement_shape, PerfRegistry, start_unit, finish_unit, record_query, track
+
+
+class TestSqlPerf(unittest.TestCase):
+
+    def test_01_statement_shape_hides_literals_and_parameter_lists(self):
+        """Sprawdza, czy kształt instrukcji nie zależy od literałów ani długości list parametrów."""
+        self.assertEqual(
+            statement_shape("SELECT * FROM sprzet WHERE id IN (%s, %s, %s) AND typ_sprzetu = 'reaktor'"),
+            statement_shape("SELECT *  FROM sprzet\n WHERE id IN (%s) AND typ_sprzetu = 'filtr'")
+        )
+        self.assertEqual(
+            statement_shape("INSERT INTO t1 (a, b) VALUES (%s, %s), (%s, %s)"),
+            "INSERT INTO t1 (a, b) VALUES (?)"
+        )
+
+    def test_02_repeated_shape_is_reported_as_n_plus_one(self):
+        """Sprawdza wykrywanie N+1 (ten sam kształt zapytania powtórzony w jednej jednostce pracy)."""
+        registry = PerfRegistry(n_plus_one_threshold=3)
+        previous = start_unit('GET api.dashboard')
+        for sprzet_id in range(4):
+            record_query(f"SELECT * FROM historia_pomiarow WHERE id_sprzetu = {sprzet_id}", 2.0)
+        record_query("SELECT * FROM sprzet", 1.0)
+        unit, _, repeated = finish_unit(registry, previous)
+
+        self.assertEqual(unit.queries, 5)
+        self.assertAlmostEqual(unit.db_ms, 9.0)
+        self.assertEqual([(shape, count) for shape, count, _ in repeated],
+                         [("SELECT * FROM historia_pomiarow WHERE id_sprzetu = ?", 4)])
+
+        stats = registry.snapshot()
+        self.assertEqual(stats['units'][0]['name'], 'GET api.dashboard')
+        self.assertEqual(stats['units'][0]['n_plus_one'][0]['max_repeats'], 4)
+        self.assertEqual(stats['slowest_statements'][0]['ms'], 2.0)
+
+    def test_03_nested_units_do_not_mix(self):
+        """Sprawdza, czy zapytania zadania wewnątrz innej jednostki są liczone osobno."""
+        registry = PerfRegistry()
+        previous = start_unit('zewnetrzna')
+        record_query("SELECT 1", 1.0)
+        with track('wewnetrzna', registry) as inner:
+            record_query("SELECT 2", 1.0)
+            record_query("SELECT 3", 1.0)
+        record_query("SELECT 4", 1.0)
+        outer, _, _ = finish_unit(registry, previous)
+
+        self.assertEqual(inner.queries, 2)
+        self.assertEqual(outer.queries, 2)
+        # Poza jednostką pracy zapytania nie są liczone
+        record_query("SELECT 5", 1.0)
+        self.assertEqual({unit['name']: unit['max_queries'] for unit in registry.snapshot()['units']},
+                         {'zewnetrzna': 2, 'wewnetrzna': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# test_replica.py
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from flask import Flask
+from sqlalchemy import text, Integer, VARCHAR
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from app.extensions import db
+from app import replica
+from app.replica import read_replica
+
+
+class _Base(DeclarativeBase):
+    pass
+
+
+class Zrodlo(_Base):
+    # Model tylko dla testu (poza db.metadata, aby nie trafił do create_all innych testów)
+    __tablename__ = 'zrodlo'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    nazwa: Mapped[str] = mapped_column(VARCHAR(20))
+
+
+class TestReadReplicaRouting(unittest.TestCase):
+    """Routing odczytów na replikę - baza główna i replika to dwa osobne pliki SQLite."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config.update(
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(self.tmpdir, 'primary.db')}",
+            SQLALCHEMY_BINDS={'replica': f"sqlite:///{os.path.join(self.tmpdir, 'replica.db')}"},
+            REPLICA_MAX_LAG_SECONDS=5,
+            REPLICA_LAG_CHECK_SECONDS=0,
+        )
+        db.init_app(self.app)
+        self.router = replica.init_app(self.app, db)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        # Ta sama tabela z różną zawartością - widać, z której bazy pochodzi odczyt
+        for bind_key, source in ((None, 'primary'), ('replica', 'replica')):
+            with db.engines[bind_key].begin() as conn:
+                conn.execute(text("CREATE TABLE zrodlo (id INTEGER PRIMARY KEY, nazwa VARCHAR(20))"))
+                conn.execute(text("INSERT INTO zrodlo (nazwa) VALUES (:nazwa)"), {'nazwa': source})
+
+    def tearDown(self):
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    @staticmethod
+    def _read_source():
+        return db.session.execute(text("SELECT nazwa FROM zrodlo")).scalar()
+
+    def test_01_reads_go_to_replica_only_inside_read_replica(self):
+        """Sprawdza, czy tylko odczyty z funkcji @read_replica trafiają na replikę."""
+        self.assertEqual(read_replica(self._read_source)(), 'replica')
+        db.session.remove()
+        self.assertEqual(self._read_source(), 'primary')
+        self.assertEqual(self.router.stats['replica_reads'], 1)
+
+    def test_02_lagging_replica_falls_back_to_primary(self):
+        """Sprawdza powrót odczytów na bazę główną, gdy replika jest opóźniona lub niedostępna."""
+        self.router._measure_lag = lambda: 30.0
+        self.assertEqual(read_replica(self._read_source)(), 'primary')
+        self.assertFalse(self.router.healthy)
+
+        db.session.remove()
+        self.router._measure_lag = lambda: None  # replikacja zatrzymana
+        self.assertEqual(read_replica(self._read_source)(), 'primary')
+
+        db.session.remove()
+        self.router._measure_lag = lambda: 1.0
+        self.assertEqual(read_replica(self._read_source)(), 'replica')
+        self.assertEqual(self.router.stats['primary_fallbacks'], 2)
+
+    def test_03_writes_inside_read_replica_go_to_primary(self):
+        """Sprawdza, czy zapis obiektu ORM (flush) wewnątrz bloku odczytu z repliki trafia do bazy głównej."""
+        @read_replica
+        def read_then_write():
+            nazwy = db.session.execute(db.select(Zrodlo.nazwa)).scalars().all()
+            db.session.add(Zrodlo(nazwa='zapis'))
+            db.session.commit()
+            return nazwy
+
+        self.assertEqual(read_then_write(), ['replica'])
+        db.session.remove()
+        self.assertEqual(db.session.execute(db.select(Zrodlo.nazwa).order_by(Zrodlo.id)).scalars().all(), ['primary', 'zapis'])
+
+    def test_04_core_dml_inside_read_replica_goes_to_primary(self):
+        """Sprawdza, czy insert()/update()/delete() przez db.session.execute w bloku odczytu trafiają do bazy głównej."""
+        @read_replica
+        def read_then_dml():
+            nazwa = db.session.execute(db.select(Zrodlo.nazwa)).scalar()
+            db.session.execute(db.insert(Zrodlo).values(nazwa='dodany'))
+            db.session.execute(db.update(Zrodlo).where(Zrodlo.nazwa == 'primary').values(nazwa='zmieniony'))
+            db.session.execute(db.delete(Zrodlo).where(Zrodlo.nazwa == 'replica'))
+            db.session.commit()
+            return nazwa
+
+        self.assertEqual(read_then_dml(), 'replica')
+        db.session.remove()
+        self.assertEqual(
+            db.session.execute(db.select(Zrodlo.nazwa).order_by(Zrodlo.id)).scalars().all(), ['zmieniony', 'dodany']
+        )
+        with db.engines['replica'].connect() as conn:
+            self.assertEqual(conn.execute(text("SELECT nazwa FROM zrodlo")).scalars().all(), ['replica'])
+
+    def test_05_dashboard_replica_only_for_http_view(self):
+        """Sprawdza, czy na replikę idzie tylko widok HTTP dashboardu, a rozgłoszenia po zapisie (wywołanie serwisu) czytają z bazy głównej."""
+        from app import routes
+        from app.dashboard_service import DashboardService
+
+        sources = []
+
+        def execute(*args, **kwargs):
+            sources.append('replica' if replica.using_replica() else 'primary')
+            raise RuntimeError('koniec testu')
+
+        with mock.patch.object(db.session, 'execute', side_effect=execute):
+            # Jak broadcast_dashboard_update i zadania Celery po zatwierdzeniu zmian
+            with self.assertRaises(RuntimeError):
+                DashboardService.get_main_dashboard_data()
+            with self.app.test_request_context('/api/dashboard/main-status'):
+                _, status = routes.api_dashboard_status()
+
+        self.assertEqual(status, 500)
+        self.assertEqual(sources, ['primary', 'replica'])
@@ -65,4 +65,32 @@ class TestSprzetService(unittest.TestCase):
         # 4. Sprawdź, czy temperatura startowa została ustawiona
         self.assertAlmostEqual(reaktor.temperatura_aktualna, start_temp)
         # 5. Sprawdź, czy status mieszaniny został zmieniony
-        self.assertEqual(mix.process_status, 'PODGRZEWANY')
\ No newline at end of file
+        self.assertEqual(mix.process_status, 'PODGRZEWANY')
+
+    def test_02_telemetry_is_stored_outside_sprzet_row(self):
+        """
+        Sprawdza, czy bieżące odczyty trafiają do sprzet_telemetria, a atrybuty Sprzet działają jak dawne kolumny.
+        """
+        from app.models import SprzetTelemetria
+        from app.sensors import SensorService
+
+        reaktor = Sprzet(id=1, nazwa_unikalna='R1', typ_sprzetu='reaktor', temperatura_docelowa=Decimal('110.0'))
+        db.session.add(reaktor)
+        db.session.commit()
+        self.assertIsNone(reaktor.temperatura_aktualna)
+
+        SensorService.set_current_temperature(['R1'], Decimal('64.5'))
+        db.session.expire_all()
+
+        telemetria = db.session.get(SprzetTelemetria, 1)
+        self.assertIsNotNone(telemetria)
+        self.assertAlmostEqual(telemetria.temperatura_aktualna, Decimal('64.5'))
+        self.assertIsNotNone(telemetria.ostatnia_aktualizacja)
+        # Konfiguracja bez zmian, odczyt przez atrybut i przez wyrażenie w zapytaniu
+        reaktor = db.session.get(Sprzet, 1)
+        self.assertAlmostEqual(reaktor.temperatura_docelowa, Decimal('110.0'))
+        self.assertAlmostEqual(reaktor.temperatura_aktualna, Decimal('64.5'))
+        wiersz = db.session.execute(
+            db.select(Sprzet.nazwa_unikalna, Sprzet.temperatura_aktualna).where(Sprzet.temperatura_aktualna > 60)
+        ).one()
+        self.assertEqual(wiersz.nazwa_unikalna, 'R1')